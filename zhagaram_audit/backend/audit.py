@@ -1,14 +1,162 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
 from .database import SessionLocal
 from .models import AuditLog
 
-def log_action(user_id, action, table_name, record_id):
-    db = SessionLocal()
-    log = AuditLog(
-        user_id=user_id,
-        action=action,
-        table_name=table_name,
-        record_id=record_id
-    )
-    db.add(log)
-    db.commit()
-    db.close()
+logger = logging.getLogger(__name__)
+
+# Audit events are queued in memory and written by a background thread as
+# multi-row INSERTs, every BATCH_SIZE events or FLUSH_SECONDS, whichever comes
+# first. When the queue is full, callers wait up to ENQUEUE_TIMEOUT and then
+# write their own event synchronously, so events are slowed down, never dropped.
+# must_persist events (financially sensitive actions) skip the queue: given the
+# request's session they are inserted in its transaction, before it commits, so
+# the action and its event commit or roll back together; written on their own,
+# a failure after WRITE_RETRIES is raised to the caller instead of logged.
+BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1.0"))
+QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+ENQUEUE_TIMEOUT = 1.0
+WRITE_RETRIES = 3
+
+_STOP = object()
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_writer = None
+_writer_pid = None
+_lock = threading.Lock()
+
+
+def _write(rows, must_persist=False):
+    for attempt in range(1, WRITE_RETRIES + 1):
+        db = SessionLocal()
+        try:
+            db.execute(insert(AuditLog), rows)
+            db.commit()
+            return
+        except Exception:
+            db.rollback()
+            logger.exception(f"Audit write failed (attempt {attempt}/{WRITE_RETRIES})")
+            if must_persist and attempt == WRITE_RETRIES:
+                raise
+            time.sleep(0.2 * attempt)
+        finally:
+            db.close()
+    # Last resort: keep the events in the application log rather than losing them
+    logger.error(f"Dropping {len(rows)} audit events after {WRITE_RETRIES} attempts: {rows}")
+
+
+def _persist(rows, db=None):
+    if db is not None:
+        db.execute(insert(AuditLog), rows)
+    else:
+        _write(rows, must_persist=True)
+
+
+def _run():
+    stopping = False
+    while not stopping:
+        try:
+            item = _queue.get(timeout=FLUSH_SECONDS)
+        except queue.Empty:
+            continue
+        if item is _STOP:
+            break
+
+        batch = [item]
+        deadline = time.monotonic() + FLUSH_SECONDS
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+        _write(batch)
+
+    # Drain whatever was enqueued before shutdown
+    batch = []
+    while True:
+        try:
+            item = _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is not _STOP:
+            batch.append(item)
+        if len(batch) >= BATCH_SIZE:
+            _write(batch)
+            batch = []
+    if batch:
+        _write(batch)
+
+
+def _ensure_writer():
+    global _writer, _writer_pid
+    # The thread is started lazily, and again in each forked worker
+    if _writer is not None and _writer_pid == os.getpid() and _writer.is_alive():
+        return
+    with _lock:
+        if _writer is None or _writer_pid != os.getpid() or not _writer.is_alive():
+            _writer = threading.Thread(target=_run, name="audit-writer", daemon=True)
+            _writer_pid = os.getpid()
+            _writer.start()
+
+
+def log_action(user_id, action, table_name, record_id, must_persist=False, db=None):
+    row = {
+        "user_id": user_id,
+        "action": action,
+        "table_name": table_name,
+        "record_id": record_id,
+        "created_at": datetime.now(),
+    }
+
+    # Financially sensitive actions are written before the request commits (db: its
+    # session) and fail it when they cannot be
+    if must_persist:
+        _persist([row], db)
+        return
+
+    _ensure_writer()
+    try:
+        _queue.put(row, timeout=ENQUEUE_TIMEOUT)
+    except queue.Full:
+        logger.warning("Audit queue full; writing event synchronously")
+        _write([row])
+
+
+def log_actions(user_id, action, table_name, record_ids, db=None):
+    """One must_persist event per record id, with a single multi-row INSERT (in db's
+    transaction when given)."""
+    now = datetime.now()
+    rows = [{"user_id": user_id, "action": action, "table_name": table_name, "record_id": record_id,
+             "created_at": now} for record_id in record_ids]
+    if rows:
+        _persist(rows, db)
+
+
+def shutdown(timeout=10.0):
+    # Flush everything still queued; safe to call more than once
+    global _writer
+    with _lock:
+        writer = _writer
+        _writer = None
+    if writer is None or _writer_pid != os.getpid() or not writer.is_alive():
+        return
+    _queue.put(_STOP)
+    writer.join(timeout)
+
+
+atexit.register(shutdown)
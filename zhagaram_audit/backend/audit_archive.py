@@ -0,0 +1,148 @@
+# /backend/audit_archive.py
+# Moves audit_logs rows older than the retention window into gzip-compressed
+# NDJSON files, one per month (audit_logs_YYYY-MM.ndjson.gz), and lets the
+# /api/audit endpoint keep searching them. Run it from cron:
+#   python -m backend.audit_archive --retention-days 365
+import argparse
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import func
+
+from .database import SessionLocal
+from .models import AuditLog, AuditCheckpoint
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+ARCHIVE_DIR = Path(os.getenv("AUDIT_ARCHIVE_DIR", str(BASE_DIR / "audit_archive")))
+RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "365"))
+CHUNK_ROWS = 5000
+
+COLUMNS = (AuditLog.id, AuditLog.user_id, AuditLog.action, AuditLog.table_name,
+           AuditLog.record_id, AuditLog.changes, AuditLog.created_at,
+           AuditLog.chain_seq, AuditLog.prev_hash, AuditLog.row_hash)
+
+
+def row_to_dict(row):
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "action": row.action,
+        "table_name": row.table_name,
+        "record_id": row.record_id,
+        "changes": row.changes,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "chain_seq": row.chain_seq,
+        "prev_hash": row.prev_hash,
+        "row_hash": row.row_hash,
+    }
+
+
+def _month_file(month):
+    return ARCHIVE_DIR / f"audit_logs_{month}.ndjson.gz"
+
+
+def archive(db, retention_days=RETENTION_DAYS):
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    moved = 0
+
+    # Only a sealed prefix of the hash chain is moved, so the live table always holds
+    # an unbroken tail of it: everything before the first chain entry that is still
+    # inside the retention window (or not sealed yet), rounded down to just after a
+    # signed checkpoint so audit_chain.verify() has an anchor to start the tail from.
+    boundary = db.query(func.min(AuditLog.chain_seq))\
+        .filter(AuditLog.created_at >= cutoff, AuditLog.chain_seq.isnot(None)).scalar()
+    if boundary is None:
+        boundary = (db.query(func.max(AuditLog.chain_seq)).scalar() or 0) + 1
+    anchor = db.query(func.max(AuditCheckpoint.chain_seq)).filter(AuditCheckpoint.chain_seq < boundary).scalar()
+    boundary = (anchor or 0) + 1
+
+    while True:
+        rows = db.query(*COLUMNS).filter(AuditLog.chain_seq < boundary)\
+            .order_by(AuditLog.chain_seq).limit(CHUNK_ROWS).all()
+        if not rows:
+            break
+
+        by_month = defaultdict(list)
+        for row in rows:
+            by_month[row.created_at.strftime("%Y-%m")].append(row_to_dict(row))
+
+        # Each append is a new gzip member; readers see one continuous stream.
+        # Files are synced before the rows are deleted, so a crash can only ever
+        # duplicate rows (readers de-duplicate by id), never lose them.
+        for month, month_rows in by_month.items():
+            with open(_month_file(month), "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="ab") as archive_file:
+                    for item in month_rows:
+                        archive_file.write((json.dumps(item) + "\n").encode("utf-8"))
+                raw.flush()
+                os.fsync(raw.fileno())
+
+        db.query(AuditLog).filter(AuditLog.id.in_([r.id for r in rows])).delete(synchronize_session=False)
+        db.commit()
+        moved += len(rows)
+
+    return moved
+
+
+def _matches(item, filters, date_from, date_to):
+    for key, value in filters.items():
+        if value is not None and item.get(key) != value:
+            return False
+    created_at = item["created_at"] or ""
+    if date_from and created_at < date_from.isoformat():
+        return False
+    if date_to and created_at >= (date_to + timedelta(days=1)).isoformat():
+        return False
+    return True
+
+
+def search(filters, date_from=None, date_to=None, before=None, limit=50):
+    """Newest-first archived rows matching filters, strictly older than before=(created_at, id)."""
+    if not ARCHIVE_DIR.exists():
+        return []
+
+    results = []
+    for path in sorted(ARCHIVE_DIR.glob("audit_logs_*.ndjson.gz"), reverse=True):
+        month = path.name[len("audit_logs_"):-len(".ndjson.gz")]
+        # Skip whole months outside the requested window or newer than the cursor
+        if date_from and month < date_from.strftime("%Y-%m"):
+            break
+        if date_to and month > date_to.strftime("%Y-%m"):
+            continue
+        if before and month > before[0].strftime("%Y-%m"):
+            continue
+
+        seen = {}
+        with gzip.open(path, "rt", encoding="utf-8") as archive_file:
+            for line in archive_file:
+                item = json.loads(line)
+                if not _matches(item, filters, date_from, date_to):
+                    continue
+                if before and (item["created_at"], item["id"]) >= (before[0].isoformat(), before[1]):
+                    continue
+                seen[item["id"]] = item
+
+        month_rows = sorted(seen.values(), key=lambda i: (i["created_at"], i["id"]), reverse=True)
+        results.extend(month_rows[:limit - len(results)])
+        if len(results) >= limit:
+            break
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old audit_logs rows to compressed NDJSON")
+    parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        moved = archive(db, args.retention_days)
+        print(f"Archived {moved} audit log row(s) to {ARCHIVE_DIR}.")
+    finally:
+        db.close()
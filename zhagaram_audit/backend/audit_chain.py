@@ -0,0 +1,240 @@
+# /backend/audit_chain.py
+# Tamper-evident audit log. Rows are inserted unsealed by audit.py and
+# change_capture.py; seal() then assigns each one the next chain_seq and
+#   row_hash = sha256(prev_hash + canonical row content)
+# under a lock on the single audit_chain_head row, so concurrent writers never
+# contend on the chain. Every CHECKPOINT_EVERY rows an HMAC-signed checkpoint is
+# stored; verify() checks the chain checkpoint-to-checkpoint in streamed chunks,
+# optionally with several ranges in parallel.
+# AUDIT_SIGNING_KEY (environment) is the checkpoint HMAC key and is required:
+# without it nothing is sealed and verify() fails, rather than signing with a key
+# anyone could read in the source.
+#   python -m backend.audit_chain seal
+#   python -m backend.audit_chain verify --workers 4
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from .database import SessionLocal
+from .models import AuditLog, AuditChainHead, AuditCheckpoint
+
+logger = logging.getLogger(__name__)
+
+GENESIS_HASH = "0" * 64
+SIGNING_KEY = os.getenv("AUDIT_SIGNING_KEY", "").encode()
+NO_KEY = "AUDIT_SIGNING_KEY is not set"
+SEAL_BATCH = 1000
+SEAL_SECONDS = float(os.getenv("AUDIT_SEAL_SECONDS", "5"))
+CHECKPOINT_EVERY = int(os.getenv("AUDIT_CHECKPOINT_EVERY", "10000"))
+VERIFY_CHUNK_ROWS = 5000
+MAX_REPORTED_ERRORS = 100
+
+
+def row_hash(prev_hash, seq, row):
+    content = json.dumps([
+        seq, row.id, row.user_id, row.action, row.table_name, row.record_id, row.changes,
+        row.created_at.isoformat() if row.created_at else None,
+    ], separators=(",", ":"))
+    return hashlib.sha256((prev_hash + content).encode("utf-8")).hexdigest()
+
+
+def sign(seq, hash_value):
+    if not SIGNING_KEY:
+        raise RuntimeError(NO_KEY)
+    return hmac.new(SIGNING_KEY, f"{seq}|{hash_value}".encode(), hashlib.sha256).hexdigest()
+
+
+def _lock_head(db):
+    for _ in range(2):
+        head = db.query(AuditChainHead).filter(AuditChainHead.id == 1).with_for_update().first()
+        if head:
+            return head
+        db.add(AuditChainHead(id=1, last_seq=0, last_hash=GENESIS_HASH))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+    raise RuntimeError("Could not lock the audit chain head")
+
+
+def seal(db):
+    """Chain every unsealed row (in id order). Returns the number of rows sealed."""
+    if not SIGNING_KEY:
+        raise RuntimeError(NO_KEY)
+    sealed = 0
+    while True:
+        head = _lock_head(db)
+        rows = db.query(
+            AuditLog.id, AuditLog.user_id, AuditLog.action, AuditLog.table_name,
+            AuditLog.record_id, AuditLog.changes, AuditLog.created_at
+        ).filter(AuditLog.chain_seq.is_(None)).order_by(AuditLog.id).limit(SEAL_BATCH).all()
+        if not rows:
+            db.rollback()
+            return sealed
+
+        seq, prev = head.last_seq, head.last_hash
+        updates, checkpoints = [], []
+        for row in rows:
+            seq += 1
+            current = row_hash(prev, seq, row)
+            updates.append({"id": row.id, "chain_seq": seq, "prev_hash": prev, "row_hash": current})
+            if seq % CHECKPOINT_EVERY == 0:
+                checkpoints.append(AuditCheckpoint(chain_seq=seq, row_hash=current, signature=sign(seq, current)))
+            prev = current
+
+        db.execute(update(AuditLog), updates)
+        db.add_all(checkpoints)
+        head.last_seq, head.last_hash = seq, prev
+        db.commit()
+        sealed += len(rows)
+
+
+def _verify_range(start_seq, end_seq, expected_prev, expected_end):
+    # Streams one checkpoint-to-checkpoint range; each range runs in its own session
+    db = SessionLocal()
+    errors = []
+    checked = 0
+    try:
+        rows = db.query(
+            AuditLog.id, AuditLog.user_id, AuditLog.action, AuditLog.table_name, AuditLog.record_id,
+            AuditLog.changes, AuditLog.created_at, AuditLog.chain_seq, AuditLog.prev_hash, AuditLog.row_hash
+        ).filter(AuditLog.chain_seq.between(start_seq, end_seq))\
+         .order_by(AuditLog.chain_seq)\
+         .execution_options(yield_per=VERIFY_CHUNK_ROWS)
+
+        expected_seq, prev = start_seq, expected_prev
+        for row in rows:
+            if row.chain_seq != expected_seq:
+                errors.append({"chain_seq": expected_seq, "error": f"missing rows {expected_seq}-{row.chain_seq - 1}"})
+                expected_seq = row.chain_seq
+            if row.prev_hash != prev:
+                errors.append({"chain_seq": row.chain_seq, "audit_id": row.id, "error": "broken link to previous row"})
+            if row_hash(row.prev_hash, row.chain_seq, row) != row.row_hash:
+                errors.append({"chain_seq": row.chain_seq, "audit_id": row.id, "error": "row content does not match its hash"})
+            prev = row.row_hash
+            expected_seq += 1
+            checked += 1
+            if len(errors) >= MAX_REPORTED_ERRORS:
+                break
+
+        if expected_seq <= end_seq and len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"chain_seq": expected_seq, "error": f"missing rows {expected_seq}-{end_seq}"})
+        elif expected_end and prev != expected_end:
+            errors.append({"chain_seq": end_seq, "error": "range does not end at the checkpoint hash"})
+    finally:
+        db.close()
+    return checked, errors
+
+
+def verify(db, from_seq=None, to_seq=None, workers=1):
+    if not SIGNING_KEY:
+        return {"ok": False, "checked_rows": 0, "ranges": 0, "errors": [{"error": NO_KEY}]}
+    head = db.get(AuditChainHead, 1)
+    if not head or head.last_seq == 0:
+        return {"ok": True, "checked_rows": 0, "ranges": 0, "errors": []}
+
+    to_seq = min(to_seq or head.last_seq, head.last_seq)
+    # Rows moved out by audit_archive are no longer in the table; start at the first live row
+    first_live = db.query(func.min(AuditLog.chain_seq)).scalar() or head.last_seq + 1
+    from_seq = max(from_seq or 1, first_live)
+
+    errors = []
+    anchors = {0: GENESIS_HASH}
+    for cp in db.query(AuditCheckpoint).order_by(AuditCheckpoint.chain_seq):
+        if hmac.compare_digest(cp.signature, sign(cp.chain_seq, cp.row_hash)):
+            anchors[cp.chain_seq] = cp.row_hash
+        else:
+            errors.append({"chain_seq": cp.chain_seq, "error": "checkpoint signature is invalid"})
+
+    # A range is verified from a trusted starting hash (a checkpoint, or genesis)
+    # whose following rows are all still live
+    candidates = [seq for seq in anchors if first_live - 1 <= seq < to_seq]
+    if not candidates:
+        errors.append({"chain_seq": first_live, "error": "no checkpoint inside the live rows to verify from"})
+        return {"ok": False, "checked_rows": 0, "ranges": 0, "errors": errors}
+    start = max((seq for seq in candidates if seq <= from_seq - 1), default=min(candidates))
+
+    bounds = sorted(seq for seq in candidates if seq >= start) + [to_seq]
+    ranges = []
+    for begin, end in zip(bounds, bounds[1:]):
+        expected_end = anchors.get(end) or (head.last_hash if end == head.last_seq else None)
+        ranges.append((begin + 1, end, anchors[begin], expected_end))
+
+    checked = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for range_checked, range_errors in pool.map(lambda r: _verify_range(*r), ranges):
+            checked += range_checked
+            errors.extend(range_errors)
+
+    return {
+        "ok": not errors,
+        "checked_rows": checked,
+        "ranges": len(ranges),
+        "from_seq": start + 1,
+        "to_seq": to_seq,
+        "errors": errors[:MAX_REPORTED_ERRORS],
+    }
+
+
+# Background sealer, started with the app so rows are chained within seconds
+_stop = threading.Event()
+_sealer = None
+
+
+def _run_sealer():
+    while not _stop.wait(SEAL_SECONDS):
+        db = SessionLocal()
+        try:
+            seal(db)
+        except Exception:
+            db.rollback()
+            logger.exception("Audit chain sealing failed")
+        finally:
+            db.close()
+
+
+def start_sealer():
+    global _sealer
+    if not SIGNING_KEY:
+        logger.error("%s: audit log rows will not be sealed", NO_KEY)
+        return
+    if _sealer is None or not _sealer.is_alive():
+        _stop.clear()
+        _sealer = threading.Thread(target=_run_sealer, name="audit-sealer", daemon=True)
+        _sealer.start()
+
+
+def stop_sealer():
+    _stop.set()
+    if _sealer is not None:
+        _sealer.join(SEAL_SECONDS + 5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seal or verify the audit log hash chain")
+    parser.add_argument("command", choices=["seal", "verify"])
+    parser.add_argument("--from-seq", type=int)
+    parser.add_argument("--to-seq", type=int)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    if not SIGNING_KEY:
+        raise SystemExit(NO_KEY)
+
+    db = SessionLocal()
+    try:
+        if args.command == "seal":
+            print(f"Sealed {seal(db)} audit log row(s).")
+        else:
+            result = verify(db, args.from_seq, args.to_seq, args.workers)
+            print(json.dumps(result, indent=2))
+            raise SystemExit(0 if result["ok"] else 1)
+    finally:
+        db.close()
@@ -1,21 +1,26 @@
-from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
-from jose import jwt
+from functools import lru_cache
 
-# Setup Bcrypt hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# passlib/bcrypt and jose are slow to import and only needed at login, so they
+# are loaded on first use rather than when the app starts
+@lru_cache(maxsize=1)
+def _pwd_context():
+    from passlib.context import CryptContext
+    # Setup Bcrypt hashing
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 SECRET_KEY = "ZHAGARAM_SECRET_KEY_2025" 
 ALGORITHM = "HS256"
 
 def verify_password(plain_password, hashed_password):
     # Validates input against the $2b$ hash in DB
-    return pwd_context.verify(plain_password, hashed_password)
+    return _pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return _pwd_context().hash(password)
 
 def create_access_token(data: dict):
+    from jose import jwt
     to_encode = data.copy()
     # Corrected for Python 3.13 timezone awareness
     expire = datetime.now(timezone.utc) + timedelta(minutes=60)
@@ -0,0 +1,128 @@
+# /backend/change_capture.py
+import json
+
+from sqlalchemy import event, inspect, insert
+
+from .database import SessionLocal
+from . import models
+
+# Automatic row-level audit trail. before_flush records what is about to be
+# inserted/updated/deleted (with before/after column values); after_flush, once
+# new rows have primary keys, writes all of it with a single multi-row INSERT on
+# the flush's own connection, so it commits with the change and adds no commit.
+# Query.update()/delete() and Core inserts bypass the ORM flush and are not captured;
+# code that writes audited tables that way records its changes with log_core_changes().
+EXCLUDED_MODELS = {
+    models.AuditLog,
+    models.AuditChainHead,
+    models.AuditCheckpoint,
+    models.InvoiceSequence,
+    models.InventorySnapshot,
+    models.LowStockItem,
+    models.SupplierPrice,
+    models.CostLayer,
+    models.DailySalesSummary,
+    models.DailyProductSales,
+}
+REDACTED_COLUMNS = {"password", "hashed_password"}
+
+
+def _is_audited(obj):
+    return type(obj) not in EXCLUDED_MODELS and isinstance(obj, models.Base)
+
+
+def _value(obj, column):
+    if column in REDACTED_COLUMNS:
+        return "***"
+    return getattr(obj, column)
+
+
+def _columns(obj):
+    return [attr.key for attr in inspect(obj).mapper.column_attrs]
+
+
+def _update_diff(obj):
+    state = inspect(obj)
+    diff = {}
+    for column in _columns(obj):
+        history = state.attrs[column].history
+        if not history.has_changes():
+            continue
+        before = history.deleted[0] if history.deleted else None
+        after = history.added[0] if history.added else None
+        if before != after:
+            if column in REDACTED_COLUMNS:
+                before = after = "***"
+            diff[column] = {"before": before, "after": after}
+    return diff
+
+
+def _record_id(obj):
+    # The identity key is not assigned yet in after_flush, but the primary key values are
+    key = inspect(obj).mapper.primary_key_from_instance(obj)
+    if len(key) == 1 and isinstance(key[0], int):
+        return key[0]
+    return None
+
+
+def inserted(values):
+    """The changes of an inserted row, from the values it was inserted with."""
+    return {c: {"before": None, "after": v} for c, v in values.items() if v is not None}
+
+
+def log_core_changes(session, action, table_name, changes):
+    """Audit rows for writes made with Core statements: changes is
+    [(record_id, {column: {"before": ..., "after": ...}})]. One multi-row INSERT in the
+    session's transaction, attributed to the session's user like captured changes."""
+    if not changes:
+        return
+    user_id = session.info.get("audit_user_id")
+    session.execute(insert(models.AuditLog), [{
+        "user_id": user_id,
+        "action": action,
+        "table_name": table_name,
+        "record_id": record_id,
+        "changes": json.dumps(diff, default=str),
+    } for record_id, diff in changes])
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def collect_changes(session, flush_context, instances):
+    pending = session.info.setdefault("audit_pending", [])
+    for obj in session.new:
+        if _is_audited(obj):
+            pending.append(("INSERT", obj, None))
+    for obj in session.dirty:
+        if _is_audited(obj) and session.is_modified(obj, include_collections=False):
+            diff = _update_diff(obj)
+            if diff:
+                pending.append(("UPDATE", obj, diff))
+    for obj in session.deleted:
+        if _is_audited(obj):
+            pending.append(("DELETE", obj, {c: {"before": _value(obj, c), "after": None} for c in _columns(obj)}))
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def write_changes(session, flush_context):
+    pending = session.info.pop("audit_pending", [])
+    if not pending:
+        return
+
+    user_id = session.info.get("audit_user_id")
+    rows = []
+    for action, obj, diff in pending:
+        if action == "INSERT":
+            diff = {c: {"before": None, "after": _value(obj, c)} for c in _columns(obj) if getattr(obj, c) is not None}
+        rows.append({
+            "user_id": user_id,
+            "action": action,
+            "table_name": obj.__tablename__,
+            "record_id": _record_id(obj),
+            "changes": json.dumps(diff, default=str),
+        })
+    session.connection().execute(insert(models.AuditLog), rows)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def discard_changes(session):
+    session.info.pop("audit_pending", None)
@@ -0,0 +1,208 @@
+# /backend/costing.py
+# Cost of goods sold from cost layers. Stock coming in opens a layer at what it
+# cost; stock going out takes units off the product's layers, and a sale keeps what
+# its units cost on sale_items.unit_cost, so gross profit is a sum over sale lines
+# instead of a join to today's products.purchase_price.
+#   FIFO     units go out oldest layer first, each at its own layer's cost
+#   AVERAGE  perpetual weighted average: units go out at the average cost of what is
+#            in stock, and the layers left are revalued to that average
+# Layers move inside inventory_ledger.record_movements, in the caller's transaction,
+# after products.stock_qty is updated: the product row locks (taken in id order)
+# serialize costing per product. Each call reads the open layers of the products it
+# touches once, works through its movements in memory, then writes with one
+# statement (or executemany) per kind of change. Only open layers are kept.
+# A receipt's layer costs the PO line's unit_price. Other stock coming in (opening
+# balances, returns, adjustments), and units going out beyond the open layers, are
+# costed at products.purchase_price.
+# Settings (environment): COSTING_METHOD  FIFO (default) or AVERAGE
+# After changing the method, or to cost sales recorded before the layers existed,
+# replay the whole movement ledger (this also rebuilds the sales rollups):
+#   python -m backend.costing recompute [--method AVERAGE]
+import argparse
+import os
+from collections import defaultdict
+
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from .database import SessionLocal
+from .models import CostLayer, InventoryMovement, Product, PurchaseItem, SaleItem
+from .pricing import get_prices
+from . import rollups
+
+METHODS = ("FIFO", "AVERAGE")
+COSTING_METHOD = os.getenv("COSTING_METHOD", "FIFO").strip().upper()
+if COSTING_METHOD not in METHODS:
+    raise RuntimeError(f"COSTING_METHOD must be one of {', '.join(METHODS)}, not {COSTING_METHOD!r}")
+
+# Products replayed (and committed) together by recompute()
+RECOMPUTE_CHUNK_SIZE = 500
+
+
+def _take(layers, quantity, fallback, method):
+    """Cost of taking quantity units off layers (oldest first), which are updated."""
+    average = None
+    if method == "AVERAGE":
+        units = sum(layer["remaining"] for layer in layers)
+        if units:
+            average = sum(layer["remaining"] * layer["unit_cost"] for layer in layers) / units
+
+    cost, left = 0.0, quantity
+    for layer in layers:
+        take = min(layer["remaining"], left)
+        if take:
+            cost += take * (average if average is not None else layer["unit_cost"])
+            layer["remaining"] -= take
+            layer["changed"] = True
+            left -= take
+    if average is not None:
+        for layer in layers:
+            if layer["remaining"] and layer["unit_cost"] != average:
+                layer.update(unit_cost=average, changed=True)
+    # More going out than the layers hold (stock that predates them, or negative stock)
+    return cost + left * fallback
+
+
+def _run(entries, layers, fallback, method, closed):
+    """Apply entries to layers ({product_id: [open layers, oldest first]}) in order.
+    Ids of layers used up are added to closed. Returns {(sale_id, product_id): [cost, units]}."""
+    sold = {}
+    for entry in entries:
+        product_layers = layers[entry["product_id"]]
+        price = float(fallback.get(entry["product_id"]) or 0)
+        if entry["quantity"] > 0:
+            product_layers.append({
+                "id": None, "product_id": entry["product_id"], "quantity": entry["quantity"],
+                "remaining": entry["quantity"], "purchase_id": entry.get("purchase_id"),
+                "unit_cost": price if entry.get("unit_cost") is None else float(entry["unit_cost"]),
+                "created_at": entry["created_at"], "changed": True
+            })
+            continue
+        cost = _take(product_layers, -entry["quantity"], price, method)
+        if entry.get("sale_id"):
+            line = sold.setdefault((entry["sale_id"], entry["product_id"]), [0.0, 0])
+            line[0] += cost
+            line[1] -= entry["quantity"]
+        closed += [layer["id"] for layer in product_layers if not layer["remaining"] and layer["id"]]
+        product_layers[:] = [layer for layer in product_layers if layer["remaining"]]
+    return sold
+
+
+def _write(db, layers, closed, sold):
+    if closed:
+        db.execute(delete(CostLayer).where(CostLayer.id.in_(closed)))
+    changed = [layer for product_layers in layers.values() for layer in product_layers if layer["changed"]]
+    updated = [{"id": layer["id"], "remaining": layer["remaining"], "unit_cost": layer["unit_cost"]}
+               for layer in changed if layer["id"]]
+    if updated:
+        db.execute(update(CostLayer), updated)
+    opened = [{key: layer[key] for key in ("product_id", "quantity", "remaining", "unit_cost", "purchase_id",
+                                           "created_at")} for layer in changed if not layer["id"]]
+    if opened:
+        db.execute(insert(CostLayer), opened)
+    if sold:
+        items = SaleItem.__table__
+        db.execute(items.update()
+                   .where(items.c.sale_id == bindparam("line_sale_id"), items.c.product_id == bindparam("line_product_id"))
+                   .values(unit_cost=bindparam("line_unit_cost")), [
+            {"line_sale_id": sale_id, "line_product_id": product_id, "line_unit_cost": cost / units}
+            for (sale_id, product_id), (cost, units) in sold.items()
+        ])
+
+
+def apply_movements(db, entries, method=None):
+    """entries: dicts with product_id, quantity (signed: positive in, negative out),
+    created_at and optionally unit_cost (stock in; default purchase_price), purchase_id
+    and sale_id (sales, whose lines get unit_cost). The caller commits."""
+    entries = [entry for entry in entries if entry["quantity"]]
+    if not entries:
+        return
+    product_ids = {entry["product_id"] for entry in entries}
+    fallback = dict(db.execute(select(Product.id, Product.purchase_price).where(Product.id.in_(product_ids))).all())
+    layers = defaultdict(list)
+    for row in db.execute(
+        select(CostLayer.id, CostLayer.product_id, CostLayer.remaining, CostLayer.unit_cost)
+        .where(CostLayer.product_id.in_(product_ids), CostLayer.remaining > 0)
+        .order_by(CostLayer.product_id, CostLayer.id).with_for_update()
+    ):
+        layers[row.product_id].append({"id": row.id, "remaining": row.remaining, "unit_cost": row.unit_cost,
+                                       "changed": False})
+    closed = []
+    sold = _run(entries, layers, fallback, method or COSTING_METHOD, closed)
+    _write(db, layers, closed, sold)
+
+
+def sale_costs(db, sale_id):
+    """{product_id: unit_cost} of a sale's lines that have one."""
+    return dict(db.execute(select(SaleItem.product_id, SaleItem.unit_cost)
+                           .where(SaleItem.sale_id == sale_id, SaleItem.unit_cost.is_not(None))).all())
+
+
+def cost_changes(db, sale_id, items):
+    """{product_id: realized cost - estimated cost} for the lines of a quote whose stock
+    just went out. items: its SaleItem rows as loaded before (with the estimates);
+    lines from before unit_cost existed were estimated at purchase_price."""
+    realized = sale_costs(db, sale_id)
+    prices = get_prices(db, [item.product_id for item in items if item.unit_cost is None])
+    changes = defaultdict(float)
+    for item in items:
+        estimate = item.unit_cost
+        if estimate is None:
+            estimate = prices.get(item.product_id, {}).get("purchase_price", 0.0)
+        changes[item.product_id] += (item.quantity or 0) * (realized.get(item.product_id, estimate) - estimate)
+    return {product_id: change for product_id, change in changes.items() if change}
+
+
+def recompute(db, method=None):
+    """Rebuild every product's layers, and the unit_cost of every sale line the ledger
+    has SALE movements for, by replaying the movement ledger. Commits per chunk of
+    products; returns (products, open layers)."""
+    from .inventory_ledger import MOVEMENT_SIGNS
+
+    method = method or COSTING_METHOD
+    fallback = dict(db.execute(select(Product.id, Product.purchase_price)).all())
+    # First line wins when a PO has the product on more than one line
+    line_prices = {(purchase_id, product_id): unit_price for purchase_id, product_id, unit_price in db.execute(
+        select(PurchaseItem.purchase_id, PurchaseItem.product_id, PurchaseItem.unit_price)
+        .order_by(PurchaseItem.id.desc()))}
+
+    product_ids, open_layers = sorted(fallback), 0
+    for start in range(0, len(product_ids), RECOMPUTE_CHUNK_SIZE):
+        chunk = product_ids[start:start + RECOMPUTE_CHUNK_SIZE]
+        movements = db.execute(
+            select(InventoryMovement.product_id, InventoryMovement.movement_type, InventoryMovement.quantity,
+                   InventoryMovement.sale_id, InventoryMovement.purchase_id, InventoryMovement.created_at)
+            .where(InventoryMovement.product_id.in_(chunk))
+            .order_by(InventoryMovement.created_at, InventoryMovement.id)
+        ).all()
+        entries = [{
+            "product_id": m.product_id,
+            "quantity": MOVEMENT_SIGNS.get(m.movement_type, 0) * (m.quantity or 0),
+            "unit_cost": line_prices.get((m.purchase_id, m.product_id)) if m.movement_type == "PURCHASE" else None,
+            "purchase_id": m.purchase_id,
+            "sale_id": m.sale_id if m.movement_type == "SALE" else None,
+            "created_at": m.created_at
+        } for m in movements if m.quantity]
+
+        layers = defaultdict(list)
+        sold = _run(entries, layers, fallback, method, [])
+        db.execute(delete(CostLayer).where(CostLayer.product_id.in_(chunk)))
+        _write(db, layers, [], sold)
+        db.commit()
+        open_layers += sum(len(product_layers) for product_layers in layers.values())
+    return len(product_ids), open_layers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cost layers and realized cost of sales")
+    parser.add_argument("command", choices=["recompute"], help="replay the movement ledger into cost layers")
+    parser.add_argument("--method", choices=METHODS, type=str.upper, help=f"default: COSTING_METHOD ({COSTING_METHOD})")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        products, layers = recompute(db, args.method)
+        print(f"Costed {products} product(s) with {args.method or COSTING_METHOD}; {layers} open layer(s).")
+        days = rollups.rebuild(db)
+        print(f"Rebuilt daily sales summary for {days} day(s).")
+    finally:
+        db.close()
@@ -1,12 +1,12 @@
 # create_admin.py
 from backend.database import SessionLocal, engine
-from backend import models
+from backend import models, migrations
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def init_db():
-    models.Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
     db = SessionLocal()
     
     # Check if admin exists
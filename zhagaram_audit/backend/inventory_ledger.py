@@ -0,0 +1,478 @@
+# /backend/inventory_ledger.py
+# inventory_movements is the source of truth for stock. Every stock change goes
+# through record_movements(), which writes the movements and moves
+# products.stock_qty by the same amount in the caller's transaction, so the
+# cached column and the ledger commit together.
+#
+# Stock at any point in time = the latest end-of-day snapshot before it plus the
+# movements after that snapshot. Snapshots cover the whole catalogue (products
+# at zero are left out), so "stock as of day X" for every product is one snapshot
+# read plus one range scan of movements. reconcile() compares stock_qty with the
+# ledger and can fix either side.
+#
+# Serialized units (IMEIs, serial numbers) are stored normalized and tracked in
+# serial_numbers: a serial comes in only while it is out of stock and goes out
+# only while it is in stock.
+#
+# low_stock_items holds the products at or below low_stock_threshold. Every stock
+# change re-checks just the products it touched; with LOW_STOCK_NOTIFY=1 a product
+# dropping into the set also queues a LOW_STOCK notification, sent by
+# POST /api/notifications/send_low_stock_alerts.
+#
+# Each movement also moves the product's cost layers (backend/costing.py): stock in
+# opens a layer, stock out takes units off them and sales keep their realized cost.
+# Run from cron:
+#   python -m backend.inventory_ledger snapshot              # end of yesterday
+#   python -m backend.inventory_ledger reconcile [--fix | --opening-balance]
+#   python -m backend.inventory_ledger stock --as-of 2026-03-31
+import argparse
+import os
+import re
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import case, delete, func, insert, select, update
+
+from .database import SessionLocal
+from . import change_capture, costing, rollups
+from .uploads import parse_number
+from .models import (
+    InventoryMovement, InventorySnapshot, LowStockItem, Notification, Product, Purchase, SaleItem, SerialNumber
+)
+
+LOW_STOCK_NOTIFY = os.getenv("LOW_STOCK_NOTIFY", "0").strip().lower() in ("1", "true", "yes", "on")
+
+# Direction of each movement type. quantity is stored as a positive number,
+# except for ADJUSTMENT, where its sign is the direction.
+MOVEMENT_SIGNS = {
+    "OPENING": 1,
+    "PURCHASE": 1,
+    "IN": 1,
+    "RETURN": 1,
+    "ADJUSTMENT": 1,
+    "SALE": -1,
+    "OUT": -1,
+    "DAMAGE": -1,
+    "PURCHASE_RETURN": -1,
+}
+
+# Stock leaves when a sale becomes an invoice (or is paid); quotes do not reserve stock
+STOCK_OUT_STATUSES = {"INVOICE", "PAID"}
+
+signed_quantity = case(MOVEMENT_SIGNS, value=InventoryMovement.movement_type, else_=0) * InventoryMovement.quantity
+
+
+def normalize_serial(serial):
+    """Upper-case letters and digits only: "35-209900 176148-1" and "352099001761481" are
+    the same handset. None for an empty serial."""
+    if not serial:
+        return None
+    return re.sub(r"[^0-9A-Z]", "", str(serial).upper()) or None
+
+
+def validate_movement(movement_type, quantity):
+    """Returns an error message, or None when the movement is acceptable."""
+    if movement_type not in MOVEMENT_SIGNS:
+        return f"Unknown movement type {movement_type!r}; expected one of {', '.join(MOVEMENT_SIGNS)}"
+    if movement_type == "ADJUSTMENT":
+        return "Adjustment quantity cannot be zero" if quantity == 0 else None
+    return None if quantity > 0 else "Quantity must be positive"
+
+
+def record_movements(db, movements):
+    """Insert movements (dicts with product_id, movement_type, quantity and optional
+    serial_number/remarks/sale_id/purchase_id, and unit_cost for stock bought in) and
+    apply them to products.stock_qty, the serial registry and the cost layers. Check
+    serials with serial_conflicts() first. The caller commits. Returns the number of
+    movements written."""
+    if not movements:
+        return 0
+    now = datetime.now()
+    unit_costs = [m.get("unit_cost") for m in movements]
+    movements = [{
+        "product_id": m["product_id"],
+        "movement_type": m["movement_type"],
+        "quantity": m["quantity"],
+        "serial_number": normalize_serial(m.get("serial_number")),
+        "remarks": m.get("remarks", ""),
+        "sale_id": m.get("sale_id"),
+        "purchase_id": m.get("purchase_id"),
+    } for m in movements]
+    db.flush()
+    # The ledger is append-only, so rows go in with one executemany (no ORM identity); the
+    # flush capture does not see it, so their audit rows go in with one more
+    rows = [dict(m, created_at=now) for m in movements]
+    db.execute(insert(InventoryMovement), rows)
+    change_capture.log_core_changes(db, "INSERT", "inventory_movements",
+                                    [(None, change_capture.inserted(row)) for row in rows])
+    _apply_to_stock(db, movements)
+    _register_serials(db, movements, now)
+    costing.apply_movements(db, [{
+        "product_id": m["product_id"],
+        "quantity": MOVEMENT_SIGNS[m["movement_type"]] * m["quantity"],
+        "unit_cost": unit_cost,
+        "purchase_id": m["purchase_id"],
+        "sale_id": m["sale_id"] if m["movement_type"] == "SALE" else None,
+        "created_at": now
+    } for m, unit_cost in zip(movements, unit_costs)])
+    return len(movements)
+
+
+def _apply_to_stock(db, movements):
+    deltas = defaultdict(int)
+    for m in movements:
+        deltas[m["product_id"]] += MOVEMENT_SIGNS[m["movement_type"]] * m["quantity"]
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # Row locks taken in primary-key order; the quantities read under them are the
+    # "before" of the audit rows, which the flush capture never sees for a Core UPDATE
+    before = dict(db.execute(select(Product.id, Product.stock_qty).where(Product.id.in_(deltas))
+                             .order_by(Product.id).with_for_update()).all())
+    # One UPDATE ... CASE for every product touched: an atomic increment per row (concurrent
+    # movements never overwrite each other)
+    db.execute(update(Product).where(Product.id.in_(deltas))
+               .values(stock_qty=func.coalesce(Product.stock_qty, 0) + case(deltas, value=Product.id)))
+    change_capture.log_core_changes(db, "UPDATE", "products", [
+        (product_id, {"stock_qty": {"before": stock_qty, "after": (stock_qty or 0) + deltas[product_id]}})
+        for product_id, stock_qty in before.items()
+    ])
+    refresh_low_stock(db, deltas)
+
+
+def _is_low(product):
+    return (product.is_active is not False and product.low_stock_threshold is not None
+            and (product.stock_qty or 0) <= product.low_stock_threshold)
+
+
+def refresh_low_stock(db, product_ids):
+    """Re-check low_stock_items for the products a transaction touched: add those now at
+    or below their threshold, drop those back above it. The caller commits."""
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+    db.flush()
+    products = db.query(Product.id, Product.sku, Product.model, Product.stock_qty,
+                        Product.low_stock_threshold, Product.is_active)\
+        .filter(Product.id.in_(product_ids)).all()
+    low = {p.id: p for p in products if _is_low(p)}
+    listed = set(db.scalars(select(LowStockItem.product_id).where(LowStockItem.product_id.in_(product_ids))))
+
+    recovered = listed - set(low)
+    if recovered:
+        db.execute(delete(LowStockItem).where(LowStockItem.product_id.in_(recovered)))
+    still_low = [{"product_id": p.id, "stock_qty": p.stock_qty or 0, "threshold": p.low_stock_threshold}
+                 for pid, p in low.items() if pid in listed]
+    if still_low:
+        db.execute(update(LowStockItem), still_low)
+
+    now = datetime.now()
+    newly_low = [p for pid, p in low.items() if pid not in listed]
+    if newly_low:
+        db.execute(insert(LowStockItem), [
+            {"product_id": p.id, "stock_qty": p.stock_qty or 0, "threshold": p.low_stock_threshold, "since": now}
+            for p in newly_low
+        ])
+    if newly_low and LOW_STOCK_NOTIFY:
+        db.execute(insert(Notification), [{
+            "customer_id": None, "type": "LOW_STOCK", "status": "PENDING", "sent_at": None,
+            "message": f"Low stock: {p.sku} {p.model} has {p.stock_qty or 0} left "
+                       f"(threshold {p.low_stock_threshold})"[:255],
+        } for p in newly_low])
+
+
+def serial_conflicts(db, movements):
+    """One error message (or None) per movement, in order, for serialized movements that
+    move more than one unit, receive a serial already in stock or move out one that is
+    not. Earlier movements in the list count, so a list cannot receive a serial twice."""
+    serials = {normalize_serial(m.get("serial_number")) for m in movements} - {None}
+    in_stock = {}
+    if serials:
+        in_stock = {(product_id, serial): flag for product_id, serial, flag in db.query(
+            SerialNumber.product_id, SerialNumber.serial, SerialNumber.in_stock
+        ).filter(SerialNumber.serial.in_(serials))}
+
+    errors = []
+    for m in movements:
+        serial, error = normalize_serial(m.get("serial_number")), None
+        if serial:
+            key = (m["product_id"], serial)
+            incoming = MOVEMENT_SIGNS[m["movement_type"]] * m["quantity"] > 0
+            if abs(m["quantity"]) != 1:
+                error = "A serialized movement moves exactly one unit"
+            elif incoming and in_stock.get(key):
+                error = f"Serial {serial} is already in stock"
+            elif not incoming and not in_stock.get(key):
+                error = f"Serial {serial} is not in stock"
+            else:
+                in_stock[key] = incoming
+        errors.append(error)
+    return errors
+
+
+def _register_serials(db, movements, now):
+    latest = {(m["product_id"], m["serial_number"]): m for m in movements if m.get("serial_number")}
+    if not latest:
+        return
+    existing = {(unit.product_id, unit.serial): unit for unit in db.query(
+        SerialNumber.id, SerialNumber.product_id, SerialNumber.serial, SerialNumber.in_stock,
+        SerialNumber.last_movement_type
+    ).filter(SerialNumber.serial.in_({serial for _, serial in latest}))}
+
+    updates, inserts, changes = [], [], []
+    for (product_id, serial), m in latest.items():
+        row = {"in_stock": MOVEMENT_SIGNS[m["movement_type"]] * m["quantity"] > 0,
+               "last_movement_type": m["movement_type"], "updated_at": now}
+        unit = existing.get((product_id, serial))
+        if unit:
+            updates.append(dict(row, id=unit.id))
+            changes.append(("UPDATE", unit.id, {
+                "in_stock": {"before": unit.in_stock, "after": row["in_stock"]},
+                "last_movement_type": {"before": unit.last_movement_type, "after": row["last_movement_type"]},
+            }))
+        else:
+            inserts.append(dict(row, product_id=product_id, serial=serial, first_seen_at=now))
+            changes.append(("INSERT", None, change_capture.inserted(inserts[-1])))
+    if updates:
+        db.execute(update(SerialNumber), updates)
+    if inserts:
+        db.execute(insert(SerialNumber), inserts)
+    for action in ("UPDATE", "INSERT"):
+        change_capture.log_core_changes(db, action, "serial_numbers",
+                                        [(unit_id, diff) for kind, unit_id, diff in changes if kind == action])
+
+
+def _prefix_end(prefix):
+    # Smallest normalized serial after every serial starting with prefix ("35Z" -> "36"),
+    # so prefix search is an index range. Digits sort before letters in every collation.
+    chars = list(prefix)
+    while chars:
+        last = chars.pop()
+        if last != "Z":
+            return "".join(chars) + ("A" if last == "9" else chr(ord(last) + 1))
+    return None
+
+
+def search_serials(db, prefix, limit=20):
+    """Registered serials starting with prefix (an exact match sorts first)."""
+    prefix = normalize_serial(prefix)
+    if not prefix:
+        return []
+    query = db.query(SerialNumber, Product.sku, Product.model)\
+        .join(Product, Product.id == SerialNumber.product_id)\
+        .filter(SerialNumber.serial >= prefix)
+    end = _prefix_end(prefix)
+    if end:
+        query = query.filter(SerialNumber.serial < end)
+    return query.order_by(SerialNumber.serial, SerialNumber.product_id).limit(limit).all()
+
+
+def apply_batch(db, lines):
+    """Apply one chunk of a bulk upload. lines: [(line_no, dict)] where each dict has
+    product_id or sku, movement_type, quantity and optional serial_number, remarks and
+    purchase_id. Products, purchases and serials are checked with one query each, valid
+    rows go in with a single executemany and stock moves in one UPDATE; commits, and
+    returns one result per line."""
+    results = {}
+
+    def fail(line_no, error):
+        results[line_no] = {"line": line_no, "status": "ERROR", "detail": error}
+
+    skus = {str(row["sku"]) for _, row in lines if row.get("product_id") is None and row.get("sku")}
+    sku_ids = dict(db.query(Product.sku, Product.id).filter(Product.sku.in_(skus)).all()) if skus else {}
+
+    candidates = []
+    for line_no, row in lines:
+        if "_error" in row:
+            fail(line_no, row["_error"])
+            continue
+        product_id = parse_number(row["product_id"], int) if row.get("product_id") is not None else sku_ids.get(str(row.get("sku")))
+        quantity = parse_number(row.get("quantity"), int)
+        movement_type = str(row.get("movement_type") or "").upper()
+        purchase_id = parse_number(row.get("purchase_id"), int)
+        if product_id is None:
+            fail(line_no, f"Unknown product {row.get('product_id') or row.get('sku')!r}")
+        elif quantity is None:
+            fail(line_no, "Quantity must be a whole number")
+        elif validate_movement(movement_type, quantity):
+            fail(line_no, validate_movement(movement_type, quantity))
+        else:
+            candidates.append((line_no, {
+                "product_id": product_id, "movement_type": movement_type, "quantity": quantity,
+                "serial_number": normalize_serial(row.get("serial_number")),
+                "remarks": str(row.get("remarks") or ""), "sale_id": None, "purchase_id": purchase_id,
+            }))
+
+    known = set(db.scalars(select(Product.id).where(Product.id.in_({m["product_id"] for _, m in candidates}))))
+    purchase_ids = {m["purchase_id"] for _, m in candidates} - {None}
+    purchases = set(db.scalars(select(Purchase.id).where(Purchase.id.in_(purchase_ids)))) if purchase_ids else set()
+
+    found = []
+    for line_no, m in candidates:
+        if m["product_id"] not in known:
+            fail(line_no, f"Product {m['product_id']} not found")
+        elif m["purchase_id"] is not None and m["purchase_id"] not in purchases:
+            fail(line_no, f"Purchase {m['purchase_id']} not found")
+        else:
+            found.append((line_no, m))
+
+    # The serial registry is read once for the chunk; lines are applied in order
+    valid = []
+    for (line_no, m), error in zip(found, serial_conflicts(db, [m for _, m in found])):
+        if error:
+            fail(line_no, error)
+        else:
+            valid.append((line_no, m))
+
+    if valid:
+        try:
+            record_movements(db, [m for _, m in valid])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            for line_no, _ in valid:
+                fail(line_no, f"Chunk rolled back: {e}")
+        else:
+            for line_no, m in valid:
+                results[line_no] = {"line": line_no, "status": "APPLIED", "product_id": m["product_id"]}
+
+    return [results[line_no] for line_no, _ in lines]
+
+
+def sale_movements(invoice_number, lines, sale_id=None):
+    """SALE movements for sale lines (dicts or rows with product_id/quantity and optional
+    serial_numbers). Each serial sold is its own one-unit movement."""
+    movements = []
+    for line in lines:
+        if not isinstance(line, dict):
+            line = {"product_id": line.product_id, "quantity": line.quantity,
+                    "serial_numbers": getattr(line, "serial_numbers", None)}
+        serials = line.get("serial_numbers") or []
+        sold = {"product_id": line["product_id"], "movement_type": "SALE", "sale_id": sale_id,
+                "remarks": f"Sold on invoice {invoice_number}"}
+        movements += [dict(sold, quantity=1, serial_number=serial) for serial in serials]
+        if line["quantity"] > len(serials):
+            movements.append(dict(sold, quantity=line["quantity"] - len(serials)))
+    return movements
+
+
+def take_quote_stock(db, sale):
+    """A quote leaving the quote stage (converted, or paid in full): its stock goes out
+    now, and the cost it went into the rollup at is corrected to what the units cost.
+    Call before changing sale.status; the caller commits."""
+    if sale.status in STOCK_OUT_STATUSES:
+        return
+    items = db.query(SaleItem).filter(SaleItem.sale_id == sale.id).all()
+    record_movements(db, sale_movements(sale.invoice_number, items, sale.id))
+    rollups.record_cost(db, sale.created_at.date(), costing.cost_changes(db, sale.id, items))
+
+
+def _end_of(day):
+    return datetime.combine(day + timedelta(days=1), time.min)
+
+
+def stock_as_of(db, day=None, product_ids=None):
+    """{product_id: quantity} at the end of day, or now when day is None."""
+    snapshot_day = db.query(func.max(InventorySnapshot.day))
+    if day:
+        snapshot_day = snapshot_day.filter(InventorySnapshot.day <= day)
+    snapshot_day = snapshot_day.scalar()
+
+    stock = defaultdict(int)
+    movements = db.query(InventoryMovement.product_id, func.sum(signed_quantity))
+    if snapshot_day:
+        snapshot = db.query(InventorySnapshot.product_id, InventorySnapshot.quantity)\
+            .filter(InventorySnapshot.day == snapshot_day)
+        if product_ids is not None:
+            snapshot = snapshot.filter(InventorySnapshot.product_id.in_(product_ids))
+        stock.update(snapshot.all())
+        movements = movements.filter(InventoryMovement.created_at >= _end_of(snapshot_day))
+    if day:
+        movements = movements.filter(InventoryMovement.created_at < _end_of(day))
+    if product_ids is not None:
+        movements = movements.filter(InventoryMovement.product_id.in_(product_ids))
+
+    for product_id, quantity in movements.group_by(InventoryMovement.product_id):
+        stock[product_id] += int(quantity or 0)
+    return stock
+
+
+def take_snapshot(db, day=None):
+    """Store end-of-day stock for every product. Only for days that have ended."""
+    day = day or date.today() - timedelta(days=1)
+    if day >= date.today():
+        raise ValueError("Snapshots can only be taken for days that have ended")
+
+    db.query(InventorySnapshot).filter(InventorySnapshot.day == day).delete(synchronize_session=False)
+    stock = stock_as_of(db, day)
+    rows = [{"day": day, "product_id": pid, "quantity": qty} for pid, qty in stock.items() if qty]
+    if rows:
+        db.execute(insert(InventorySnapshot), rows)
+    db.commit()
+    return len(rows)
+
+
+def reconcile(db, fix=False, opening_balance=False):
+    """Products whose stock_qty differs from the ledger.
+    fix: set stock_qty to the ledger value (the ledger is right).
+    opening_balance: record ADJUSTMENT movements so the ledger matches stock_qty
+    (for stock that predates the ledger)."""
+    products = db.query(Product.id, Product.sku, Product.stock_qty).order_by(Product.id)
+    if fix or opening_balance:
+        # Hold the rows so no movement lands between reading the ledger and writing
+        products = products.with_for_update()
+    products = products.all()
+    ledger = stock_as_of(db)
+
+    drift = [{
+        "product_id": p.id,
+        "sku": p.sku,
+        "stock_qty": p.stock_qty or 0,
+        "ledger_qty": ledger.get(p.id, 0),
+        "difference": (p.stock_qty or 0) - ledger.get(p.id, 0),
+    } for p in products if (p.stock_qty or 0) != ledger.get(p.id, 0)]
+
+    if opening_balance and drift:
+        db.add_all([InventoryMovement(
+            product_id=d["product_id"], movement_type="ADJUSTMENT", quantity=d["difference"],
+            remarks="Opening balance from products.stock_qty", created_at=datetime.now()
+        ) for d in drift])
+    elif fix and drift:
+        db.execute(update(Product), [{"id": d["product_id"], "stock_qty": d["ledger_qty"]} for d in drift])
+        change_capture.log_core_changes(db, "UPDATE", "products", [
+            (d["product_id"], {"stock_qty": {"before": d["stock_qty"], "after": d["ledger_qty"]}}) for d in drift
+        ])
+        refresh_low_stock(db, [d["product_id"] for d in drift])
+    db.commit()
+    return drift
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inventory ledger snapshots, reconciliation and point-in-time stock")
+    sub = parser.add_subparsers(dest="command", required=True)
+    snap = sub.add_parser("snapshot", help="store end-of-day stock (default: yesterday)")
+    snap.add_argument("--day", type=date.fromisoformat)
+    rec = sub.add_parser("reconcile", help="report products whose stock_qty drifted from the ledger")
+    mode = rec.add_mutually_exclusive_group()
+    mode.add_argument("--fix", action="store_true", help="set stock_qty from the ledger")
+    mode.add_argument("--opening-balance", action="store_true", help="adjust the ledger to stock_qty")
+    stock = sub.add_parser("stock", help="print stock per product")
+    stock.add_argument("--as-of", type=date.fromisoformat)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "snapshot":
+            day = args.day or date.today() - timedelta(days=1)
+            print(f"Snapshot for {day}: {take_snapshot(db, day)} product(s) in stock.")
+        elif args.command == "reconcile":
+            drift = reconcile(db, fix=args.fix, opening_balance=args.opening_balance)
+            for d in drift:
+                print(f"{d['sku']:20} stock_qty={d['stock_qty']:>7} ledger={d['ledger_qty']:>7} diff={d['difference']:>+7}")
+            action = " (stock_qty fixed)" if args.fix else " (opening balances recorded)" if args.opening_balance else ""
+            print(f"{len(drift)} product(s) drifted{action if drift else ''}.")
+        else:
+            for product_id, quantity in sorted(stock_as_of(db, args.as_of).items()):
+                print(f"{product_id}\t{quantity}")
+    finally:
+        db.close()
@@ -0,0 +1,100 @@
+# /backend/invoicing.py
+import os
+import threading
+from datetime import date
+
+from sqlalchemy.exc import IntegrityError
+
+from .database import SessionLocal
+from .models import InvoiceSequence
+
+# Hi/lo invoice numbering: each worker process reserves a block of numbers per
+# financial year from the invoice_sequences row (one locked round trip per block)
+# and hands them out from memory. Bigger blocks mean fewer DB trips but larger
+# gaps if a worker dies; 1 gives a strictly sequential (still per-sale) allocator.
+INVOICE_PREFIX = "INV"
+BLOCK_SIZE = int(os.getenv("INVOICE_BLOCK_SIZE", "20"))
+
+_blocks = {}  # financial_year -> [next_value, end_value (exclusive)]
+_owner_pid = os.getpid()
+_lock = threading.Lock()
+
+
+def financial_year(day: date) -> str:
+    # Indian financial year runs April to March, e.g. "2026-27"
+    start = day.year if day.month >= 4 else day.year - 1
+    return f"{start}-{str(start + 1)[-2:]}"
+
+
+def format_invoice_number(fy: str, value: int) -> str:
+    return f"{INVOICE_PREFIX}/{fy}/{value:06d}"
+
+
+def _reserve_block(fy: str, size: int):
+    # Runs in its own short transaction so the reservation commits (and the row
+    # lock is released) independently of the sale that triggered it.
+    db = SessionLocal()
+    try:
+        for _ in range(2):
+            seq = db.query(InvoiceSequence)\
+                .filter(InvoiceSequence.financial_year == fy)\
+                .with_for_update().first()
+            if seq:
+                start = seq.next_value
+                seq.next_value = start + size
+                db.commit()
+                return start, start + size
+
+            # First invoice of the year: another worker may create the row concurrently
+            db.add(InvoiceSequence(financial_year=fy, next_value=1 + size))
+            try:
+                db.commit()
+                return 1, 1 + size
+            except IntegrityError:
+                db.rollback()
+        raise RuntimeError(f"Could not reserve invoice numbers for {fy}")
+    finally:
+        db.close()
+
+
+def next_invoice_number(day: date = None) -> str:
+    global _owner_pid
+    fy = financial_year(day or date.today())
+
+    with _lock:
+        # Blocks reserved before a fork (gunicorn --preload) must not be shared with children
+        if _owner_pid != os.getpid():
+            _blocks.clear()
+            _owner_pid = os.getpid()
+
+        block = _blocks.get(fy)
+        if not block or block[0] >= block[1]:
+            block = list(_reserve_block(fy, BLOCK_SIZE))
+            _blocks[fy] = block
+
+        value = block[0]
+        block[0] += 1
+
+    return format_invoice_number(fy, value)
+
+
+def release_unused():
+    # Called on shutdown: hand back the tail of each block if no other worker has
+    # reserved after it, so restarts do not leave gaps in the sequence.
+    with _lock:
+        if _owner_pid != os.getpid():
+            return
+        blocks = dict(_blocks)
+        _blocks.clear()
+
+    db = SessionLocal()
+    try:
+        for fy, (next_value, end_value) in blocks.items():
+            if next_value < end_value:
+                db.query(InvoiceSequence).filter(
+                    InvoiceSequence.financial_year == fy,
+                    InvoiceSequence.next_value == end_value
+                ).update({InvoiceSequence.next_value: next_value}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
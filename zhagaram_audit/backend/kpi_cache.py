@@ -0,0 +1,122 @@
+# /backend/kpi_cache.py
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict
+
+# In-process result cache for the dashboard KPIs.
+# - Each key has its own TTL (jittered +/-10% so workers do not all expire together).
+# - Only one thread per worker recomputes an expired key; the others keep serving
+#   the stale value meanwhile, so an expiry costs each worker one query, not one per tab.
+# - Writers call invalidate() after commit. That only clears this worker's copy;
+#   other workers pick the change up when their TTL runs out.
+DAILY = "kpi_daily"
+TOP_PRODUCTS = "kpi_top_products"
+OUTSTANDING_SERVICES = "kpi_outstanding_services"
+STOCK_VALUATION = "kpi_stock_valuation"
+
+TTL_SECONDS = {
+    DAILY: 30,
+    TOP_PRODUCTS: 300,
+    OUTSTANDING_SERVICES: 60,
+    STOCK_VALUATION: 300,
+}
+
+# Which cached results each kind of write makes stale
+SALES_WRITE = (DAILY, TOP_PRODUCTS)
+STOCK_WRITE = (STOCK_VALUATION,)
+SERVICE_WRITE = (OUTSTANDING_SERVICES,)
+
+_entries = {}  # key -> (expires_at, value)
+_refresh_locks = defaultdict(threading.Lock)
+_async_refresh_locks = defaultdict(asyncio.Lock)
+_lock = threading.Lock()
+_counters = defaultdict(lambda: {"hits": 0, "misses": 0, "stale_hits": 0, "invalidations": 0})
+
+
+def _count(key, counter):
+    with _lock:
+        _counters[key][counter] += 1
+
+
+def cached(key, compute):
+    entry = _entries.get(key)
+    if entry and entry[0] > time.monotonic():
+        _count(key, "hits")
+        return entry[1]
+
+    with _lock:
+        refresh_lock = _refresh_locks[key]
+
+    # Someone else is already recomputing: serve the stale copy if we have one
+    if entry and not refresh_lock.acquire(blocking=False):
+        _count(key, "stale_hits")
+        return entry[1]
+    if not entry:
+        refresh_lock.acquire()
+
+    try:
+        # The thread we waited on may have filled the entry already
+        entry = _entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            _count(key, "hits")
+            return entry[1]
+
+        _count(key, "misses")
+        value = compute()
+        _store(key, value)
+        return value
+    finally:
+        refresh_lock.release()
+
+
+def _store(key, value):
+    ttl = TTL_SECONDS.get(key, 60) * random.uniform(0.9, 1.1)
+    _entries[key] = (time.monotonic() + ttl, value)
+
+
+# Same policy as cached() for async def endpoints; compute is a coroutine function.
+# Waiting happens on an asyncio.Lock so the event loop keeps serving other requests.
+async def cached_async(key, compute):
+    entry = _entries.get(key)
+    if entry and entry[0] > time.monotonic():
+        _count(key, "hits")
+        return entry[1]
+
+    refresh_lock = _async_refresh_locks[key]
+    if entry and refresh_lock.locked():
+        _count(key, "stale_hits")
+        return entry[1]
+
+    async with refresh_lock:
+        entry = _entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            _count(key, "hits")
+            return entry[1]
+
+        _count(key, "misses")
+        value = await compute()
+        _store(key, value)
+        return value
+
+
+def invalidate(*keys):
+    for key in keys:
+        if _entries.pop(key, None) is not None:
+            _count(key, "invalidations")
+
+
+def stats():
+    with _lock:
+        counters = {key: dict(values) for key, values in _counters.items()}
+    now = time.monotonic()
+    result = {}
+    for key, ttl in TTL_SECONDS.items():
+        entry = _entries.get(key)
+        result[key] = {
+            **counters.get(key, {"hits": 0, "misses": 0, "stale_hits": 0, "invalidations": 0}),
+            "ttl_seconds": ttl,
+            "expires_in": round(entry[0] - now, 1) if entry else None,
+        }
+    return result
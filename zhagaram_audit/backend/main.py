@@ -1,86 +1,143 @@
 # /backend/main.py
-from fastapi import FastAPI, Request
-from fastapi.templating import Jinja2Templates
+# Importing this module has no side effects: the app is built by create_app(),
+# and "app" is created on first access (uvicorn/gunicorn "backend.main:app",
+# or "uvicorn --factory backend.main:create_app"). The database is not touched
+# at startup unless DB_SCHEMA_CHECK asks for it, so workers boot during a DB outage.
+from contextlib import asynccontextmanager
+import os
+
+from fastapi import APIRouter, FastAPI, Request
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
-from pathlib import Path
 
-from .database import engine
-from . import models 
-from .routers import (
-    auth, customers, product, inventory, purchase, 
-    sales, crm, service, employee,employee_pages, dashboard, 
-    notifications, accounting
-)
-from .routers import service_api, service_pages
+from .database import engine, async_engine, mark_written
+from .templating import BASE_DIR, templates
+from . import invoicing, audit, audit_chain, migrations
 
 # 1. PATH SETUP
-BASE_DIR = Path(__file__).resolve().parent.parent
 STATIC_FILES_DIR = BASE_DIR / "backend" / "static"
-TEMPLATES_DIR = BASE_DIR / "frontend" / "templates"
-
-# 2. INITIALIZATION
-models.Base.metadata.create_all(bind=engine)
-app = FastAPI(title="Zhagaram Audit", version="0.1.0")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], # For development; restrict this in production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# 3. STATIC & TEMPLATES
-app.mount("/static", StaticFiles(directory=str(STATIC_FILES_DIR)), name="static")
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
-
-app.include_router(service_api.router)
-app.include_router(service_pages.router)
-
-# 4. API ROUTERS
-# We use specific prefixes so that the routers can use "/" as their root path
-app.include_router(auth.router, prefix="/api", tags=["auth"])
-app.include_router(product.router, prefix="/api/products", tags=["Products"])
-app.include_router(inventory.router, prefix="/api/inventory", tags=["Inventory"])
-app.include_router(purchase.router, prefix="/api/purchases")
-app.include_router(sales.router)
-app.include_router(customers.router, prefix="/api/customers", tags=["Customers"])
-app.include_router(crm.router, prefix="/api/crm", tags=["CRM"])
-app.include_router(service.router)
-app.include_router(employee.router, prefix="/api/employees", tags=["Employees"])
-app.include_router(dashboard.router, prefix="/api", tags=["Dashboard"])
-app.include_router(notifications.router, prefix="/api/notifications", tags=["Notifications"])
-app.include_router(accounting.router)
-app.include_router(employee_pages.router)
-app.include_router(employee.router)
-
-# 5. UI ROUTES
-@app.get("/", include_in_schema=False)
-@app.get("/login", include_in_schema=False)
+
+# DB_SCHEMA_CHECK: "off" (default), "verify" (refuse to start while migrations are
+# pending) or "upgrade" (apply pending migrations at startup, single-server installs)
+SCHEMA_CHECK = os.getenv("DB_SCHEMA_CHECK", "off").lower()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if SCHEMA_CHECK == "upgrade":
+        await run_in_threadpool(migrations.upgrade, engine)
+    elif SCHEMA_CHECK == "verify":
+        pending = await run_in_threadpool(migrations.pending, engine)
+        if pending:
+            raise RuntimeError(f"Pending schema migrations: {', '.join(pending)}; run python -m backend.migrations upgrade")
+    audit_chain.start_sealer()
+    try:
+        yield
+    finally:
+        invoicing.release_unused()
+        audit.shutdown()
+        audit_chain.stop_sealer()
+        await async_engine.dispose()
+
+
+# After a successful write, the client's reads stay on the primary for a few
+# seconds (see database.get_read_db) so it never reads its own write from a lagging replica
+async def read_your_writes(request: Request, call_next):
+    response = await call_next(request)
+    if request.method in ("POST", "PUT", "PATCH", "DELETE") and response.status_code < 400:
+        mark_written(response)
+    return response
+
+
+def create_app():
+    from . import change_capture  # registers the flush listeners that fill the audit trail
+    from .routers import (
+        auth, customers, product, inventory, purchase,
+        sales, crm, service, employee, employee_pages, dashboard,
+        notifications, accounting, audit_trail, internal
+    )
+    from .routers import service_api, service_pages
+
+    # 2. INITIALIZATION
+    app = FastAPI(title="Zhagaram Audit", version="0.1.0", lifespan=lifespan)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"], # For development; restrict this in production
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.middleware("http")(read_your_writes)
+
+    # 3. STATIC
+    app.mount("/static", StaticFiles(directory=str(STATIC_FILES_DIR)), name="static")
+
+    app.include_router(service_api.router)
+    app.include_router(service_pages.router)
+
+    # 4. API ROUTERS
+    # We use specific prefixes so that the routers can use "/" as their root path
+    app.include_router(auth.router, prefix="/api", tags=["auth"])
+    app.include_router(product.router, prefix="/api/products", tags=["Products"])
+    app.include_router(inventory.router, prefix="/api/inventory", tags=["Inventory"])
+    app.include_router(purchase.router, prefix="/api/purchases")
+    app.include_router(sales.router)
+    app.include_router(customers.router, prefix="/api/customers", tags=["Customers"])
+    app.include_router(crm.router, prefix="/api/crm", tags=["CRM"])
+    app.include_router(service.router)
+    app.include_router(employee.router, prefix="/api/employees", tags=["Employees"])
+    app.include_router(dashboard.router, prefix="/api", tags=["Dashboard"])
+    app.include_router(notifications.router, prefix="/api/notifications", tags=["Notifications"])
+    app.include_router(accounting.router)
+    app.include_router(audit_trail.router)
+    app.include_router(internal.router)
+    app.include_router(employee_pages.router)
+    app.include_router(employee.router)
+
+    # 5. UI ROUTES
+    app.include_router(pages)
+    return app
+
+
+def __getattr__(name):
+    # Module-level "app", built on first access
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# UI pages, rendered from the shared template environment
+pages = APIRouter(include_in_schema=False)
+
+@pages.get("/", include_in_schema=False)
+@pages.get("/login", include_in_schema=False)
 def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request, "title": "Login"})
+    return templates.TemplateResponse(request, "login.html", {"request": request, "title": "Login"})
 
-@app.get("/dashboard", include_in_schema=False)
+@pages.get("/dashboard", include_in_schema=False)
 def get_dashboard(request: Request):
-    return templates.TemplateResponse("dashboard.html", {"request": request, "title": "Dashboard"})
+    return templates.TemplateResponse(request, "dashboard.html", {"request": request, "title": "Dashboard"})
 
-@app.get("/products", include_in_schema=False)
+@pages.get("/products", include_in_schema=False)
 def products_page(request: Request):
-    return templates.TemplateResponse("products.html", {"request": request, "title": "Products"})
+    return templates.TemplateResponse(request, "products.html", {"request": request, "title": "Products"})
 
-@app.get("/sales", include_in_schema=False)
+@pages.get("/sales", include_in_schema=False)
 def sales_page(request: Request):
-    return templates.TemplateResponse("sales.html", {"request": request, "title": "Sales"})
+    return templates.TemplateResponse(request, "sales.html", {"request": request, "title": "Sales"})
 
-@app.get("/sales/new", include_in_schema=False)
+@pages.get("/sales/new", include_in_schema=False)
 def new_sale_page(request: Request):
-    return templates.TemplateResponse("new_sale.html", {"request": request, "title": "New Sale"})
+    return templates.TemplateResponse(request, "new_sale.html", {"request": request, "title": "New Sale"})
 
-@app.get("/sales/{sale_id}", include_in_schema=False)
+@pages.get("/sales/{sale_id}", include_in_schema=False)
 def sale_detail_page(request: Request, sale_id: int):
-    return templates.TemplateResponse("sale_detail.html", {"request": request, "sale_id": sale_id})
+    return templates.TemplateResponse(request, "sale_detail.html", {"request": request, "sale_id": sale_id})
 
-@app.get("/customers", include_in_schema=False)
+@pages.get("/customers", include_in_schema=False)
 def customers_page(request: Request):
-    return templates.TemplateResponse("customers.html", {"request": request, "title": "Customers"})
\ No newline at end of file
+    return templates.TemplateResponse(request, "customers.html", {"request": request, "title": "Customers"})
\ No newline at end of file
@@ -0,0 +1,395 @@
+# /backend/migrations.py
+# Versioned schema migrations. Every applied version is recorded in
+# schema_migrations; upgrade() runs the missing ones in order.
+#   python -m backend.migrations status
+#   python -m backend.migrations upgrade
+# Each step checks what already exists (installs made by the old create_all at
+# startup have some of it), so re-running is safe. On MySQL, indexes are built
+# with ALGORITHM=INPLACE, LOCK=NONE and columns added with ALGORITHM=INSTANT: a
+# change that would need a full table copy fails instead of locking the table.
+# A column added with a ForeignKey gets the constraint too, so upgraded databases
+# match new installs (on SQLite only while the column is being added).
+# New schema changes go in a new function appended to MIGRATIONS; never edit one
+# that has shipped.
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text, bindparam, func, inspect, select, text
+)
+from sqlalchemy.schema import CreateColumn
+
+from .database import engine
+from . import models
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+LOCK_NAME = "zhagaram_schema_migrations"
+LOCK_TIMEOUT_SECONDS = 300
+
+
+def _is_mysql(conn):
+    return conn.dialect.name in ("mysql", "mariadb")
+
+
+def _quote(conn, name):
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+# --- Building blocks for migrations ---
+def create_tables(conn, *table_names):
+    tables = [models.Base.metadata.tables[name] for name in table_names]
+    models.Base.metadata.create_all(conn, tables=tables, checkfirst=True)
+
+
+def add_column(conn, table_name, column):
+    if column.name in {c["name"] for c in inspect(conn).get_columns(table_name)}:
+        return
+    Table(table_name, MetaData(), column)  # CreateColumn needs the column attached to a table
+    ddl = f"ALTER TABLE {_quote(conn, table_name)} ADD COLUMN {CreateColumn(column).compile(dialect=conn.dialect)}"
+    references = [fk.target_fullname.split(".") for fk in column.foreign_keys]
+    if conn.dialect.name == "sqlite":
+        # SQLite cannot add a constraint later; the reference goes on the new column
+        ddl += "".join(f" REFERENCES {_quote(conn, t)} ({_quote(conn, c)})" for t, c in references)
+    elif _is_mysql(conn):
+        ddl += ", ALGORITHM=INSTANT"
+    conn.execute(text(ddl))
+    if conn.dialect.name != "sqlite":
+        for referred_table, referred_column in references:
+            add_foreign_key(conn, table_name, column.name, referred_table, referred_column)
+
+
+def add_foreign_key(conn, table_name, column, referred_table, referred_column="id"):
+    if conn.dialect.name == "sqlite":
+        return  # see add_column
+    if any(fk["constrained_columns"] == [column] for fk in inspect(conn).get_foreign_keys(table_name)):
+        return
+    table, col = _quote(conn, table_name), _quote(conn, column)
+    referred = f"{_quote(conn, referred_table)} ({_quote(conn, referred_column)})"
+    # References to rows deleted before there was a constraint would make it fail
+    conn.execute(text(f"UPDATE {table} SET {col} = NULL WHERE {col} IS NOT NULL AND {col} NOT IN "
+                      f"(SELECT {_quote(conn, referred_column)} FROM {_quote(conn, referred_table)})"))
+    name = _quote(conn, f"fk_{table_name}_{column}")
+    ddl = f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({col}) REFERENCES {referred}"
+    if not _is_mysql(conn):
+        conn.execute(text(ddl))
+        return
+    # InnoDB adds a foreign key in place only with the checks off; the rows were checked above
+    conn.execute(text("SET foreign_key_checks = 0"))
+    try:
+        conn.execute(text(ddl + ", ALGORITHM=INPLACE, LOCK=NONE"))
+    finally:
+        conn.execute(text("SET foreign_key_checks = 1"))
+
+
+def create_index(conn, table_name, name, *columns, unique=False):
+    inspector = inspect(conn)
+    existing = inspector.get_indexes(table_name)
+    if unique:
+        existing += [dict(uc, unique=True) for uc in inspector.get_unique_constraints(table_name)]
+    # Skip when the same index exists under any name (e.g. one MySQL made for a foreign key)
+    for index in existing:
+        if index["name"] == name:
+            return
+        if list(index["column_names"]) == list(columns) and (index.get("unique") or not unique):
+            return
+
+    column_list = ", ".join(_quote(conn, c) for c in columns)
+    ddl = f"CREATE {'UNIQUE ' if unique else ''}INDEX {_quote(conn, name)} ON {_quote(conn, table_name)} ({column_list})"
+    if _is_mysql(conn):
+        ddl += " ALGORITHM=INPLACE LOCK=NONE"
+    conn.execute(text(ddl))
+
+
+def drop_index(conn, table_name, name):
+    if name not in {index["name"] for index in inspect(conn).get_indexes(table_name)}:
+        return
+    ddl = f"DROP INDEX {_quote(conn, name)}"
+    if _is_mysql(conn):
+        ddl += f" ON {_quote(conn, table_name)} ALGORITHM=INPLACE LOCK=NONE"
+    conn.execute(text(ddl))
+
+
+# --- Migrations ---
+# The tables the application had before versioned migrations; every table added
+# since is created by its own migration below
+BASELINE_TABLES = (
+    "users", "audit_logs", "customers", "follow_ups", "notifications", "sales", "sale_items", "payments",
+    "products", "inventory_movements", "suppliers", "purchases", "purchase_items", "expenses",
+    "technicians", "service_tickets", "service_parts", "employees", "tasks", "activity_logs", "attendance",
+)
+
+
+def m0001_baseline(conn):
+    """The baseline tables, for new installs. They are created from the current models;
+    the columns and indexes later migrations add are then found in place and skipped."""
+    create_tables(conn, *BASELINE_TABLES)
+
+
+def m0002_sales_rollups_and_audit_chain(conn):
+    """Keyset indexes, rollup/invoice tables and audit log changes/chain columns."""
+    create_tables(conn, "daily_sales_summary", "daily_product_sales", "invoice_sequences",
+                  "audit_chain_head", "audit_checkpoints")
+    create_index(conn, "sales", "ix_sales_created_at_id", "created_at", "id")
+    create_index(conn, "sales", "ix_sales_status_created_at_id", "status", "created_at", "id")
+    create_index(conn, "sales", "ix_sales_customer_created_at_id", "customer_id", "created_at", "id")
+
+    add_column(conn, "audit_logs", Column("changes", Text, nullable=True))
+    add_column(conn, "audit_logs", Column("chain_seq", Integer, nullable=True))
+    add_column(conn, "audit_logs", Column("prev_hash", String(64), nullable=True))
+    add_column(conn, "audit_logs", Column("row_hash", String(64), nullable=True))
+    create_index(conn, "audit_logs", "uq_audit_logs_chain_seq", "chain_seq", unique=True)
+    create_index(conn, "audit_logs", "ix_audit_logs_table_record_created", "table_name", "record_id", "created_at")
+    create_index(conn, "audit_logs", "ix_audit_logs_user_created", "user_id", "created_at")
+    create_index(conn, "audit_logs", "ix_audit_logs_created_at", "created_at")
+
+
+def m0003_lookup_indexes(conn):
+    """Secondary indexes for the hot lookups and joins (see backend.query_plans)."""
+    create_index(conn, "customers", "ix_customers_phone", "phone")
+    create_index(conn, "sale_items", "ix_sale_items_sale_id", "sale_id")
+    create_index(conn, "sale_items", "ix_sale_items_product_id", "product_id")
+    create_index(conn, "payments", "ix_payments_sale_id", "sale_id")
+    create_index(conn, "inventory_movements", "ix_inventory_movements_product_created", "product_id", "created_at")
+    create_index(conn, "purchases", "ix_purchases_supplier_id", "supplier_id")
+    create_index(conn, "purchase_items", "ix_purchase_items_purchase_id", "purchase_id")
+    create_index(conn, "purchase_items", "ix_purchase_items_product_id", "product_id")
+    create_index(conn, "service_tickets", "ix_service_tickets_status", "status")
+    create_index(conn, "service_tickets", "ix_service_tickets_customer_id", "customer_id")
+    create_index(conn, "service_parts", "ix_service_parts_ticket_id", "ticket_id")
+    create_index(conn, "follow_ups", "ix_follow_ups_customer_id", "customer_id")
+    create_index(conn, "notifications", "ix_notifications_customer_id", "customer_id")
+    create_index(conn, "tasks", "ix_tasks_employee_id", "employee_id")
+    create_index(conn, "activity_logs", "ix_activity_logs_employee_id", "employee_id")
+    create_index(conn, "attendance", "ix_attendance_employee_id", "employee_id")
+
+
+def m0004_inventory_snapshots(conn):
+    """Snapshot table and the created_at index used to replay movements after a snapshot."""
+    create_tables(conn, "inventory_snapshots")
+    create_index(conn, "inventory_movements", "ix_inventory_movements_created_at", "created_at")
+
+
+def m0005_movement_serial_index(conn):
+    """Serial-number lookups for batch stock movements."""
+    create_index(conn, "inventory_movements", "ix_inventory_movements_serial_number", "serial_number")
+
+
+def m0006_serial_registry(conn):
+    """Serial registry, sale/purchase references on movements and serials on service
+    tickets. Serials already in the ledger are normalized and registered."""
+    from .inventory_ledger import MOVEMENT_SIGNS, normalize_serial
+
+    create_tables(conn, "serial_numbers")
+    add_column(conn, "inventory_movements", Column("sale_id", Integer, ForeignKey("sales.id"), nullable=True))
+    add_column(conn, "inventory_movements", Column("purchase_id", Integer, ForeignKey("purchases.id"), nullable=True))
+    add_column(conn, "service_tickets", Column("serial_number", String(100), nullable=True))
+    create_index(conn, "service_tickets", "ix_service_tickets_serial_number", "serial_number")
+    # A device's movements in time order straight from the index; replaces the serial-only one
+    create_index(conn, "inventory_movements", "ix_inventory_movements_serial_created", "serial_number", "created_at")
+    drop_index(conn, "inventory_movements", "ix_inventory_movements_serial_number")
+
+    movements = models.InventoryMovement.__table__
+    units, renamed = {}, {}
+    for product_id, raw, movement_type, quantity, created_at in conn.execute(
+        select(movements.c.product_id, movements.c.serial_number, movements.c.movement_type,
+               movements.c.quantity, movements.c.created_at)
+        .where(movements.c.serial_number.is_not(None)).order_by(movements.c.created_at, movements.c.id)
+    ):
+        serial = normalize_serial(raw)
+        if serial != raw:
+            renamed[raw] = serial
+        if not serial:
+            continue
+        unit = units.setdefault((product_id, serial), {
+            "product_id": product_id, "serial": serial, "in_stock": 0, "first_seen_at": created_at})
+        unit["in_stock"] += MOVEMENT_SIGNS.get(movement_type, 0) * (quantity or 0)
+        unit.update(last_movement_type=movement_type, updated_at=created_at)
+
+    if renamed:
+        conn.execute(movements.update().where(movements.c.serial_number == bindparam("raw"))
+                     .values(serial_number=bindparam("serial")),
+                     [{"raw": raw, "serial": serial or None} for raw, serial in renamed.items()])
+    registered = set(conn.execute(select(models.SerialNumber.product_id, models.SerialNumber.serial)).all())
+    rows = [dict(unit, in_stock=unit["in_stock"] > 0) for key, unit in units.items() if key not in registered]
+    if rows:
+        conn.execute(models.SerialNumber.__table__.insert(), rows)
+
+
+def m0007_low_stock_items(conn):
+    """The maintained low-stock set, filled from current stock."""
+    create_tables(conn, "low_stock_items")
+    if conn.execute(select(models.LowStockItem.product_id).limit(1)).first():
+        return
+    product = models.Product.__table__
+    stock = func.coalesce(product.c.stock_qty, 0)
+    conn.execute(models.LowStockItem.__table__.insert().from_select(
+        ["product_id", "stock_qty", "threshold", "since"],
+        select(product.c.id, stock, product.c.low_stock_threshold, func.now())
+        .where(product.c.is_active.is_not(False), product.c.low_stock_threshold.is_not(None),
+               stock <= product.c.low_stock_threshold)
+    ))
+
+
+def m0008_partial_receipts(conn):
+    """Received quantity per purchase line; lines of received POs count as fully received."""
+    add_column(conn, "purchase_items", Column("received_qty", Integer, nullable=False, server_default="0"))
+    items, purchases = models.PurchaseItem.__table__, models.Purchase.__table__
+    conn.execute(items.update()
+                 .where(items.c.received_qty == 0,
+                        items.c.purchase_id.in_(select(purchases.c.id).where(purchases.c.status == "RECEIVED")))
+                 .values(received_qty=items.c.quantity))
+
+
+def m0009_purchase_remarks(conn):
+    """Remarks on purchase orders (sent by the purchase form, never stored until now)."""
+    add_column(conn, "purchases", Column("remarks", String(255), nullable=True))
+
+
+def m0010_purchase_received_at(conn):
+    """First receipt time per PO, from the PURCHASE movements that reference it. Receipts
+    from before 0006 have no purchase_id and are matched by their "Stock received via
+    Purchase ID <id>" remarks; a PO with neither keeps a NULL received_at."""
+    add_column(conn, "purchases", Column("received_at", DateTime, nullable=True))
+    movements, purchases = models.InventoryMovement.__table__, models.Purchase.__table__
+    unreceived = (purchases.c.received_at.is_(None), purchases.c.status.in_(["RECEIVED", "PARTIAL"]))
+    first_receipt = select(func.min(movements.c.created_at))\
+        .where(movements.c.purchase_id == purchases.c.id, movements.c.movement_type == "PURCHASE")\
+        .scalar_subquery()
+    conn.execute(purchases.update().where(*unreceived).values(received_at=first_receipt))
+
+    prefix, first = "Stock received via Purchase ID ", {}
+    for remarks, created_at in conn.execute(
+        select(movements.c.remarks, movements.c.created_at)
+        .where(movements.c.purchase_id.is_(None), movements.c.movement_type == "PURCHASE",
+               movements.c.remarks.like(prefix + "%"))
+    ):
+        purchase_id = remarks[len(prefix):].strip()
+        if purchase_id.isdigit() and (int(purchase_id) not in first or created_at < first[int(purchase_id)]):
+            first[int(purchase_id)] = created_at
+    if first:
+        conn.execute(purchases.update().where(purchases.c.id == bindparam("purchase_id"), *unreceived)
+                     .values(received_at=bindparam("first_receipt")),
+                     [{"purchase_id": key, "first_receipt": value} for key, value in first.items()])
+
+
+def m0011_supplier_prices(conn):
+    """Supplier price index, built from received POs; expenses can belong to a PO."""
+    from .supplier_prices import rebuild
+
+    add_column(conn, "expenses", Column("purchase_id", Integer, ForeignKey("purchases.id"), nullable=True))
+    create_index(conn, "expenses", "ix_expenses_purchase_id", "purchase_id")
+    create_tables(conn, "supplier_prices")
+    if not conn.execute(select(models.SupplierPrice.product_id).limit(1)).first():
+        rebuild(conn)
+
+
+def m0012_cost_layers(conn):
+    """Realized cost per sale line and cost layers, opened from current stock at
+    purchase_price. History is costed by "python -m backend.costing recompute"."""
+    add_column(conn, "sale_items", Column("unit_cost", Float, nullable=True))
+    create_tables(conn, "cost_layers")
+    if conn.execute(select(models.CostLayer.id).limit(1)).first():
+        return
+    product = models.Product.__table__
+    conn.execute(models.CostLayer.__table__.insert().from_select(
+        ["product_id", "quantity", "remaining", "unit_cost", "created_at"],
+        select(product.c.id, product.c.stock_qty, product.c.stock_qty, func.coalesce(product.c.purchase_price, 0),
+               func.now())
+        .where(product.c.stock_qty > 0)
+    ))
+
+
+def m0013_reference_constraints(conn):
+    """Foreign keys for the reference columns 0006 and 0011 first added without them
+    (SQLite databases keep the plain columns)."""
+    add_foreign_key(conn, "inventory_movements", "sale_id", "sales")
+    add_foreign_key(conn, "inventory_movements", "purchase_id", "purchases")
+    add_foreign_key(conn, "expenses", "purchase_id", "purchases")
+
+
+MIGRATIONS = [
+    (1, m0001_baseline),
+    (2, m0002_sales_rollups_and_audit_chain),
+    (3, m0003_lookup_indexes),
+    (4, m0004_inventory_snapshots),
+    (5, m0005_movement_serial_index),
+    (6, m0006_serial_registry),
+    (7, m0007_low_stock_items),
+    (8, m0008_partial_receipts),
+    (9, m0009_purchase_remarks),
+    (10, m0010_purchase_received_at),
+    (11, m0011_supplier_prices),
+    (12, m0012_cost_layers),
+    (13, m0013_reference_constraints),
+]
+
+
+@contextmanager
+def _migration_lock(conn):
+    # Several app workers may start at once; on MySQL only one migrates at a time
+    if not _is_mysql(conn):
+        yield
+        return
+    if not conn.execute(text("SELECT GET_LOCK(:name, :timeout)"),
+                        {"name": LOCK_NAME, "timeout": LOCK_TIMEOUT_SECONDS}).scalar():
+        raise RuntimeError("Timed out waiting for another process to finish migrating")
+    try:
+        yield
+    finally:
+        conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": LOCK_NAME})
+
+
+def applied_versions(conn):
+    schema_migrations.create(conn, checkfirst=True)
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def status(bind=engine):
+    with bind.connect() as conn:
+        applied = applied_versions(conn)
+        conn.commit()
+    return [(version, migration.__name__, version in applied) for version, migration in MIGRATIONS]
+
+
+def pending(bind=engine):
+    return [name for _, name, is_applied in status(bind) if not is_applied]
+
+
+def upgrade(bind=engine):
+    """Apply every pending migration in order. Returns the names applied."""
+    done = []
+    with bind.connect() as conn:
+        with _migration_lock(conn):
+            applied = applied_versions(conn)
+            conn.commit()
+            for version, migration in MIGRATIONS:
+                if version in applied:
+                    continue
+                # MySQL commits DDL implicitly, which is why every step is idempotent
+                migration(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=version, name=migration.__name__, applied_at=datetime.now()
+                ))
+                conn.commit()
+                done.append(migration.__name__)
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply or list schema migrations")
+    parser.add_argument("command", choices=["status", "upgrade"])
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        applied = upgrade()
+        print("\n".join(f"Applied {name}" for name in applied) or "Schema is up to date.")
+    else:
+        for version, name, is_applied in status():
+            print(f"{version:04d} {name:45} {'applied' if is_applied else 'PENDING'}")
@@ -1,5 +1,5 @@
 # /backend/models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Float, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -24,6 +24,31 @@ class AuditLog(Base):
     action = Column(String(255))
     table_name = Column(String(100))
     record_id = Column(Integer)
+    changes = Column(Text, nullable=True)  # JSON {column: {"before", "after"}} from change_capture.py
+    created_at = Column(DateTime, server_default=func.now())
+    # Hash chain, filled in by audit_chain.seal() shortly after the row is written
+    chain_seq = Column(Integer, nullable=True, unique=True)
+    prev_hash = Column(String(64), nullable=True)
+    row_hash = Column(String(64), nullable=True)
+
+    # "Who touched record X", "what did user Y do" and the archival age scan
+    __table_args__ = (
+        Index("ix_audit_logs_table_record_created", "table_name", "record_id", "created_at"),
+        Index("ix_audit_logs_user_created", "user_id", "created_at"),
+        Index("ix_audit_logs_created_at", "created_at"),
+    )
+
+class AuditChainHead(Base):
+    __tablename__ = "audit_chain_head"
+    id = Column(Integer, primary_key=True)  # single row, id=1; locked while sealing
+    last_seq = Column(Integer, nullable=False, default=0)
+    last_hash = Column(String(64), nullable=False)
+
+class AuditCheckpoint(Base):
+    __tablename__ = "audit_checkpoints"
+    chain_seq = Column(Integer, primary_key=True)
+    row_hash = Column(String(64), nullable=False)
+    signature = Column(String(64), nullable=False)  # HMAC-SHA256 of "chain_seq|row_hash"
     created_at = Column(DateTime, server_default=func.now())
 
 # =================================================================
@@ -33,7 +58,7 @@ class Customer(Base):
     __tablename__ = "customers"
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
-    phone = Column(String(20), nullable=False)
+    phone = Column(String(20), nullable=False, index=True)  # customer lookup at the billing counter
     email = Column(String(50), nullable=True)
     address = Column(String(255), nullable=True)
     status = Column(String(50), default="Active", nullable=False)
@@ -45,7 +70,7 @@ class Customer(Base):
 class FollowUp(Base):
     __tablename__ = "follow_ups"
     id = Column(Integer, primary_key=True)
-    customer_id = Column(Integer, ForeignKey("customers.id"))
+    customer_id = Column(Integer, ForeignKey("customers.id"), index=True)
     followup_date = Column(DateTime)
     note = Column(String(255))
     status = Column(String(50), default="PENDING")
@@ -54,7 +79,7 @@ class FollowUp(Base):
 class Notification(Base):
     __tablename__ = "notifications"
     id = Column(Integer, primary_key=True)
-    customer_id = Column(Integer, ForeignKey("customers.id"))
+    customer_id = Column(Integer, ForeignKey("customers.id"), index=True)
     type = Column(String(50))
     message = Column(String(255))
     sent_at = Column(DateTime, server_default=func.now())
@@ -78,15 +103,26 @@ class Sale(Base):
     payments = relationship("Payment", back_populates="sale")
     items = relationship("SaleItem", back_populates="sale")
 
+    # Keyset pagination on (created_at, id) for the sales listing, optionally narrowed by status/customer.
+    # These also serve plain lookups by created_at and by customer_id (leftmost columns).
+    __table_args__ = (
+        Index("ix_sales_created_at_id", "created_at", "id"),
+        Index("ix_sales_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_sales_customer_created_at_id", "customer_id", "created_at", "id"),
+    )
+
 class SaleItem(Base):
     __tablename__ = "sale_items"
     id = Column(Integer, primary_key=True)
-    sale_id = Column(Integer, ForeignKey("sales.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
+    sale_id = Column(Integer, ForeignKey("sales.id"), index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     quantity = Column(Integer)
     unit_price = Column(Float)
     tax_rate = Column(Float)
     total = Column(Float)
+    # What each unit cost us, from the cost layers it left (backend/costing.py); on
+    # quotes, an estimate at purchase_price until the stock goes out
+    unit_cost = Column(Float, nullable=True)
     
     product = relationship("Product", back_populates="sale_items")
     sale = relationship("Sale", back_populates="items")
@@ -94,12 +130,34 @@ class SaleItem(Base):
 class Payment(Base):
     __tablename__ = "payments"
     id = Column(Integer, primary_key=True)
-    sale_id = Column(Integer, ForeignKey("sales.id"))
+    sale_id = Column(Integer, ForeignKey("sales.id"), index=True)
     amount = Column(Float)
     payment_type = Column(String(50))
     created_at = Column(DateTime, server_default=func.now())
     sale = relationship("Sale", back_populates="payments")
 
+# Rollups maintained in the same transaction as sale creation / payment (see rollups.py)
+class DailySalesSummary(Base):
+    __tablename__ = "daily_sales_summary"
+    day = Column(Date, primary_key=True)
+    sales_count = Column(Integer, nullable=False, default=0)
+    sales_total = Column(Float, nullable=False, default=0.0)
+    cost_total = Column(Float, nullable=False, default=0.0)
+    paid_total = Column(Float, nullable=False, default=0.0)
+
+class DailyProductSales(Base):
+    __tablename__ = "daily_product_sales"
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    cost = Column(Float, nullable=False, default=0.0)
+
+class InvoiceSequence(Base):
+    __tablename__ = "invoice_sequences"
+    financial_year = Column(String(10), primary_key=True)  # e.g. "2026-27"
+    next_value = Column(Integer, nullable=False, default=1)  # first number not yet reserved by any worker
+
 # =================================================================
 # INVENTORY & PURCHASE MODELS
 # =================================================================
@@ -130,8 +188,53 @@ class InventoryMovement(Base):
     quantity = Column(Integer)
     serial_number = Column(String(100), nullable=True)
     remarks = Column(Text)
+    # The document that moved the stock, for a serial's history
+    sale_id = Column(Integer, ForeignKey("sales.id"), nullable=True)
+    purchase_id = Column(Integer, ForeignKey("purchases.id"), nullable=True)
     created_at = Column(DateTime, server_default=func.now())
 
+    # Stock history per product, in time order; created_at alone for catalogue-wide replay;
+    # serial_number for the history of one device
+    __table_args__ = (
+        Index("ix_inventory_movements_product_created", "product_id", "created_at"),
+        Index("ix_inventory_movements_created_at", "created_at"),
+        Index("ix_inventory_movements_serial_created", "serial_number", "created_at"),
+    )
+
+# End-of-day stock per product (non-zero only), written by inventory_ledger.take_snapshot.
+# Stock at any time = latest snapshot before it + the movements after it.
+class InventorySnapshot(Base):
+    __tablename__ = "inventory_snapshots"
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    quantity = Column(Integer, nullable=False)
+
+# Products at or below their low_stock_threshold, kept current by inventory_ledger for
+# the products each stock change touches, so the low-stock list never scans products.
+class LowStockItem(Base):
+    __tablename__ = "low_stock_items"
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    stock_qty = Column(Integer, nullable=False)
+    threshold = Column(Integer, nullable=False)
+    since = Column(DateTime, nullable=False)
+
+# One row per serialized unit (IMEI/serial, normalized by inventory_ledger.normalize_serial),
+# kept current by inventory_ledger as serialized movements are recorded.
+class SerialNumber(Base):
+    __tablename__ = "serial_numbers"
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    serial = Column(String(100), nullable=False)
+    in_stock = Column(Boolean, nullable=False, default=False)
+    last_movement_type = Column(String(50))
+    first_seen_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+    # Unique per product; serial alone (leftmost) serves exact and prefix search
+    __table_args__ = (
+        UniqueConstraint("serial", "product_id", name="uq_serial_numbers_serial_product"),
+    )
+
 class Supplier(Base):
     __tablename__ = "suppliers"
     id = Column(Integer, primary_key=True)
@@ -146,10 +249,13 @@ class Supplier(Base):
 class Purchase(Base):
     __tablename__ = "purchases"
     id = Column(Integer, primary_key=True)
-    supplier_id = Column(Integer, ForeignKey("suppliers.id"))
+    supplier_id = Column(Integer, ForeignKey("suppliers.id"), index=True)
     total_amount = Column(Float, default=0)
     status = Column(String(50), default="PENDING")
+    remarks = Column(String(255), nullable=True)
     created_at = Column(DateTime, server_default=func.now())
+    # First goods receipt; with created_at, the supplier's lead time
+    received_at = Column(DateTime, nullable=True)
     
     supplier = relationship("Supplier", back_populates="purchases")
     items = relationship("PurchaseItem", back_populates="purchase")
@@ -157,19 +263,53 @@ class Purchase(Base):
 class PurchaseItem(Base):
     __tablename__ = "purchase_items"
     id = Column(Integer, primary_key=True)
-    purchase_id = Column(Integer, ForeignKey("purchases.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
+    purchase_id = Column(Integer, ForeignKey("purchases.id"), index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     quantity = Column(Integer)
     unit_price = Column(Float)
+    received_qty = Column(Integer, nullable=False, default=0, server_default="0")
     
     purchase = relationship("Purchase", back_populates="items")
     product = relationship("Product", back_populates="purchase_items")
 
+# Units in stock by what they cost: each receipt opens a layer, stock going out takes
+# units off (FIFO or weighted average, see backend/costing.py). Only open layers are
+# kept, so the table is also the stock valuation.
+class CostLayer(Base):
+    __tablename__ = "cost_layers"
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
+    quantity = Column(Integer, nullable=False)
+    remaining = Column(Integer, nullable=False)
+    unit_cost = Column(Float, nullable=False)
+    purchase_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+
+# What each supplier has charged for each product, from received purchase lines; kept
+# current by supplier_prices for the pairs each receipt (or PO expense) touches.
+# Landed cost adds the PO's expenses (freight, duty), shared by line value.
+class SupplierPrice(Base):
+    __tablename__ = "supplier_prices"
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    supplier_id = Column(Integer, ForeignKey("suppliers.id"), primary_key=True, index=True)
+    last_price = Column(Float, nullable=False)
+    last_landed_cost = Column(Float, nullable=False)
+    last_purchase_id = Column(Integer, nullable=False)
+    last_received_at = Column(DateTime, nullable=False)
+    min_price = Column(Float, nullable=False)
+    min_price_at = Column(DateTime, nullable=False)
+    avg_price = Column(Float, nullable=False)  # weighted by units received
+    units_received = Column(Integer, nullable=False)
+    purchase_count = Column(Integer, nullable=False)
+    first_received_at = Column(DateTime, nullable=False)
+
 class Expense(Base):
     __tablename__ = "expenses"
     id = Column(Integer, primary_key=True)
     description = Column(String(255))
     amount = Column(Float)
+    # Set for costs of a purchase order (freight, duty); they go into its landed cost
+    purchase_id = Column(Integer, ForeignKey("purchases.id"), nullable=True, index=True)
     created_at = Column(DateTime, server_default=func.now())
 
 # =================================================================
@@ -185,10 +325,11 @@ class Technician(Base):
 class ServiceTicket(Base):
     __tablename__ = "service_tickets"
     id = Column(Integer, primary_key=True)
-    customer_id = Column(Integer, ForeignKey("customers.id"))
+    customer_id = Column(Integer, ForeignKey("customers.id"), index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
     technician_id = Column(Integer, ForeignKey("technicians.id"), nullable=True)
-    status = Column(String(50), default="RECEIVED")
+    serial_number = Column(String(100), nullable=True, index=True)
+    status = Column(String(50), default="RECEIVED", index=True)
     estimate_parts = Column(Float, default=0.0)
     estimate_labor = Column(Float, default=0.0)
     remarks = Column(String(255), nullable=True)
@@ -202,7 +343,7 @@ class ServiceTicket(Base):
 class ServicePart(Base):
     __tablename__ = "service_parts"
     id = Column(Integer, primary_key=True)
-    ticket_id = Column(Integer, ForeignKey("service_tickets.id"))
+    ticket_id = Column(Integer, ForeignKey("service_tickets.id"), index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
     quantity = Column(Integer)
     unit_price = Column(Float)
@@ -226,7 +367,7 @@ class Employee(Base):
 class Task(Base):
     __tablename__ = "tasks"
     id = Column(Integer, primary_key=True)
-    employee_id = Column(Integer, ForeignKey("employees.id"))
+    employee_id = Column(Integer, ForeignKey("employees.id"), index=True)
     title = Column(String(100), nullable=False)
     description = Column(String(255))
     status = Column(String(50), default="PENDING")
@@ -235,13 +376,13 @@ class Task(Base):
 class ActivityLog(Base):
     __tablename__ = "activity_logs"
     id = Column(Integer, primary_key=True)
-    employee_id = Column(Integer, ForeignKey("employees.id"))
+    employee_id = Column(Integer, ForeignKey("employees.id"), index=True)
     activity = Column(String(255))
     created_at = Column(DateTime, server_default=func.now())
 
 class Attendance(Base):
     __tablename__ = "attendance"
     id = Column(Integer, primary_key=True)
-    employee_id = Column(Integer, ForeignKey("employees.id"))
+    employee_id = Column(Integer, ForeignKey("employees.id"), index=True)
     check_in = Column(DateTime)
     check_out = Column(DateTime, nullable=True)
\ No newline at end of file
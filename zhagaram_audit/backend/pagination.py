@@ -0,0 +1,35 @@
+# /backend/pagination.py
+import base64
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+# Shared keyset (cursor) pagination on (created_at, id) for the list APIs.
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_cursor(created_at_column, id_column, cursor, descending=True):
+    # (created_at, id) < cursor, written out so MySQL can range-scan the composite index
+    cursor_created_at, cursor_id = decode_cursor(cursor)
+    if descending:
+        return or_(
+            created_at_column < cursor_created_at,
+            and_(created_at_column == cursor_created_at, id_column < cursor_id)
+        )
+    return or_(
+        created_at_column > cursor_created_at,
+        and_(created_at_column == cursor_created_at, id_column > cursor_id)
+    )
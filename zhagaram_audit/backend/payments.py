@@ -0,0 +1,94 @@
+# /backend/payments.py
+from datetime import datetime
+
+from .models import Sale, Payment
+from . import rollups, inventory_ledger
+
+# Payments lock the sale rows (SELECT ... FOR UPDATE) before the read-modify-write
+# on paid_amount, so two terminals paying the same invoice cannot lose an update.
+# Callers own the transaction and must commit or roll back.
+# A quote paid in full becomes PAID, and its stock goes out then, as on /convert.
+BATCH_CHUNK_SIZE = 500
+
+
+def lock_sales(db, sale_ids):
+    # Locks are always taken in id order so concurrent batches cannot deadlock
+    sales = db.query(Sale).filter(Sale.id.in_(set(sale_ids)))\
+        .order_by(Sale.id).with_for_update().all()
+    return {s.id: s for s in sales}
+
+
+def _record_payment(db, sale, amount, payment_type, paid_at):
+    db.add(Payment(sale_id=sale.id, amount=amount, payment_type=payment_type, created_at=paid_at))
+    sale.paid_amount = float(sale.paid_amount or 0) + amount
+    if sale.paid_amount >= (sale.total_amount or 0):
+        inventory_ledger.take_quote_stock(db, sale)
+        sale.status = "PAID"
+
+
+def apply_payment(db, sale_id, amount, payment_type="CASH"):
+    sale = lock_sales(db, [sale_id]).get(sale_id)
+    if not sale:
+        return None
+    paid_at = datetime.utcnow()
+    _record_payment(db, sale, amount, payment_type, paid_at)
+    rollups.record_payment(db, paid_at.date(), amount)
+    return sale
+
+
+def _resolve_sale_ids(db, rows):
+    invoices = {r.invoice_number for r in rows if r.sale_id is None and r.invoice_number}
+    if not invoices:
+        return {}
+    return dict(db.query(Sale.invoice_number, Sale.id).filter(Sale.invoice_number.in_(invoices)).all())
+
+
+def _apply_chunk(db, offset, rows):
+    ids_by_invoice = _resolve_sale_ids(db, rows)
+    wanted = [r.sale_id or ids_by_invoice.get(r.invoice_number) for r in rows]
+    sales = lock_sales(db, [sid for sid in wanted if sid])
+
+    paid_at = datetime.utcnow()
+    applied_total = 0.0
+    results = []
+    for index, (row, sale_id) in enumerate(zip(rows, wanted), start=offset):
+        result = {"row": index, "sale_id": sale_id, "invoice_number": row.invoice_number}
+        sale = sales.get(sale_id)
+        if row.amount <= 0:
+            result.update(status="ERROR", detail="Amount must be positive")
+        elif not sale:
+            result.update(status="ERROR", detail="Sale not found")
+        else:
+            _record_payment(db, sale, row.amount, row.payment_type, paid_at)
+            applied_total += row.amount
+            result.update(
+                status="APPLIED",
+                invoice_number=sale.invoice_number,
+                balance_due=float((sale.total_amount or 0) - sale.paid_amount)
+            )
+        results.append(result)
+
+    # One rollup update per chunk instead of one per settlement row
+    if applied_total:
+        rollups.record_payment(db, paid_at.date(), applied_total)
+    return results
+
+
+def apply_payment_batch(db, rows, chunk_size=BATCH_CHUNK_SIZE):
+    # One transaction per chunk: a failing chunk is rolled back and reported,
+    # chunks before and after it are still applied.
+    results = []
+    for offset in range(0, len(rows), chunk_size):
+        chunk = rows[offset:offset + chunk_size]
+        try:
+            chunk_results = _apply_chunk(db, offset, chunk)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            chunk_results = [
+                {"row": offset + i, "sale_id": r.sale_id, "invoice_number": r.invoice_number,
+                 "status": "ERROR", "detail": f"Chunk rolled back: {e}"}
+                for i, r in enumerate(chunk)
+            ]
+        results.extend(chunk_results)
+    return results
@@ -0,0 +1,90 @@
+# /backend/pricing.py
+import threading
+import time
+
+from .models import Product
+
+# In-process price/tax cache keyed by Product.id.
+# Entries are dropped by product.py on update/delete; the TTL only bounds how
+# long another gunicorn worker can serve a price edited through a different one.
+CACHE_TTL_SECONDS = 60
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def invalidate(product_id=None):
+    with _lock:
+        if product_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(product_id, None)
+
+
+def get_prices(db, product_ids):
+    """Return {product_id: {"model", "sale_price", "tax_rate", "purchase_price"}} using one IN (...) query for cache misses."""
+    wanted = set(product_ids)
+    now = time.monotonic()
+    found = {}
+
+    with _lock:
+        for pid in wanted:
+            entry = _cache.get(pid)
+            if entry and entry[0] > now:
+                found[pid] = entry[1]
+
+    missing = wanted - found.keys()
+    if missing:
+        rows = db.query(
+            Product.id, Product.model, Product.sale_price, Product.tax_rate, Product.purchase_price
+        ).filter(Product.id.in_(missing)).all()
+
+        expires = now + CACHE_TTL_SECONDS
+        with _lock:
+            for row in rows:
+                price = {
+                    "model": row.model,
+                    "sale_price": float(row.sale_price or 0),
+                    "tax_rate": float(row.tax_rate or 0),
+                    "purchase_price": float(row.purchase_price or 0),
+                }
+                _cache[row.id] = (expires, price)
+                found[row.id] = price
+
+    return found
+
+
+def price_items(db, items, include_cost=False):
+    """Price a cart of objects with product_id/quantity. Unknown ids are returned in "missing".
+
+    include_cost adds each line's unit_cost and cost at purchase_price (an estimate; the cost
+    layers give the real one when stock goes out); keep it off for anything shown to customers.
+    """
+    prices = get_prices(db, [item.product_id for item in items])
+
+    lines = []
+    missing = []
+    total = 0
+    for item in items:
+        price = prices.get(item.product_id)
+        if not price:
+            missing.append(item.product_id)
+            continue
+
+        # Simple tax calculation logic
+        item_total = (item.quantity * price["sale_price"]) * (1 + price["tax_rate"] / 100)
+        total += item_total
+        line = {
+            "product_id": item.product_id,
+            "model": price["model"],
+            "quantity": item.quantity,
+            "unit_price": price["sale_price"],
+            "tax_rate": price["tax_rate"],
+            "total": item_total,
+        }
+        if include_cost:
+            line["unit_cost"] = price["purchase_price"]
+            line["cost"] = item.quantity * price["purchase_price"]
+        lines.append(line)
+
+    return {"lines": lines, "total": total, "missing": missing}
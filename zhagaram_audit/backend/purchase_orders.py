@@ -0,0 +1,115 @@
+# /backend/purchase_orders.py
+# Creating purchase orders, one from the form or many from a supplier file, in the
+# caller's transaction: headers are flushed for their ids and every line goes in
+# with one executemany, so a failure leaves no header without its lines.
+#
+# group_rows() takes records from a CSV/NDJSON/JSON upload (backend/uploads.py)
+# one chunk at a time:
+#   sku (or product_id), quantity, unit_price, supplier_id (unless given for the
+#   whole file), and optionally po_ref and remarks.
+# Rows with the same supplier and po_ref become one PO (no po_ref: one PO per
+# supplier), across chunks. SKUs and suppliers are resolved with one query each
+# per chunk; a bad row is reported against its line and left out, the rest of the
+# file is still imported. import_orders() then creates the POs.
+from sqlalchemy import insert, select
+
+from . import change_capture
+from .models import Product, Purchase, PurchaseItem, Supplier
+from .uploads import parse_number
+
+
+def create_purchases(db, orders):
+    """orders: [{"supplier_id", "remarks", "items": [{"product_id", "quantity", "unit_price"}]}].
+    Returns the new Purchase rows, in order. The caller commits."""
+    purchases = [Purchase(
+        supplier_id=order["supplier_id"],
+        remarks=order.get("remarks"),
+        total_amount=sum(item["quantity"] * item["unit_price"] for item in order["items"]),
+        status="PENDING"
+    ) for order in orders]
+    db.add_all(purchases)
+    db.flush()
+    lines = [
+        {"purchase_id": purchase.id, "product_id": item["product_id"],
+         "quantity": item["quantity"], "unit_price": item["unit_price"]}
+        for purchase, order in zip(purchases, orders) for item in order["items"]
+    ]
+    db.execute(insert(PurchaseItem), lines)
+    # The headers were captured by the flush; the lines' audit rows go in with one INSERT
+    change_capture.log_core_changes(db, "INSERT", "purchase_items", [(None, change_capture.inserted(line)) for line in lines])
+    return purchases
+
+
+def missing_references(db, supplier_ids, product_ids):
+    """(unknown supplier ids, unknown product ids), one query each."""
+    suppliers = set(db.scalars(select(Supplier.id).where(Supplier.id.in_(set(supplier_ids)))))
+    products = set(db.scalars(select(Product.id).where(Product.id.in_(set(product_ids)))))
+    return set(supplier_ids) - suppliers, set(product_ids) - products
+
+
+def group_rows(db, rows, orders, errors, supplier_id=None):
+    """rows: one chunk of [(line_no, record)]. Adds the valid lines to orders
+    ({(supplier_id, po_ref): order}) and the bad rows to errors ([{"line", "detail"}])."""
+    skus = {str(r["sku"]).strip() for _, r in rows if r.get("sku") and r.get("product_id") in (None, "")}
+    sku_ids = dict(db.query(Product.sku, Product.id).filter(Product.sku.in_(skus)).all()) if skus else {}
+
+    parsed = []
+    for line_no, record in rows:
+        if "_error" in record:
+            errors.append({"line": line_no, "detail": record["_error"]})
+            continue
+        if record.get("product_id") not in (None, ""):
+            product_id = parse_number(record["product_id"], int)
+        else:
+            product_id = sku_ids.get(str(record.get("sku") or "").strip())
+        quantity = parse_number(record.get("quantity"), int)
+        unit_price = parse_number(record.get("unit_price"))
+        # A null or empty supplier_id falls back to the file's, like a missing one
+        supplier = record.get("supplier_id")
+        supplier = parse_number(supplier_id if supplier in (None, "") else supplier, int)
+        if product_id is None:
+            errors.append({"line": line_no, "detail": f"Unknown product {record.get('sku') or record.get('product_id')!r}"})
+        elif quantity is None or quantity <= 0:
+            errors.append({"line": line_no, "detail": "Quantity must be a positive whole number"})
+        elif unit_price is None or unit_price < 0:
+            errors.append({"line": line_no, "detail": "Unit price must be a number, zero or more"})
+        elif supplier is None:
+            errors.append({"line": line_no, "detail": "Supplier is missing"})
+        else:
+            parsed.append((line_no, supplier, product_id, quantity, unit_price, record))
+
+    bad_suppliers, bad_products = missing_references(
+        db, [p[1] for p in parsed], [p[2] for p in parsed]
+    ) if parsed else (set(), set())
+
+    for line_no, supplier, product_id, quantity, unit_price, record in parsed:
+        if supplier in bad_suppliers:
+            errors.append({"line": line_no, "detail": f"Supplier {supplier} not found"})
+        elif product_id in bad_products:
+            errors.append({"line": line_no, "detail": f"Product {product_id} not found"})
+        else:
+            po_ref = str(record.get("po_ref") or "")
+            order = orders.setdefault((supplier, po_ref), {
+                "supplier_id": supplier, "items": [],
+                "remarks": record.get("remarks") or (f"Supplier ref {po_ref}" if po_ref else None)
+            })
+            order["items"].append({"product_id": product_id, "quantity": quantity, "unit_price": unit_price})
+
+
+def import_orders(db, orders, errors):
+    """Creates the POs grouped by group_rows() and returns
+    {"purchases": [{"purchase_id", "supplier_id", "po_ref", "lines", "total_amount"}],
+     "errors": [{"line", "detail"}]}. The caller commits."""
+    keys = list(orders)
+    purchases = create_purchases(db, [orders[key] for key in keys]) if keys else []
+
+    return {
+        "purchases": [{
+            "purchase_id": purchase.id,
+            "supplier_id": supplier,
+            "po_ref": po_ref or None,
+            "lines": len(orders[supplier, po_ref]["items"]),
+            "total_amount": purchase.total_amount
+        } for purchase, (supplier, po_ref) in zip(purchases, keys)],
+        "errors": sorted(errors, key=lambda e: e["line"])
+    }
@@ -0,0 +1,200 @@
+# /backend/query_plans.py
+# Query-plan regression check for the hot queries. Runs EXPLAIN on each of them
+# against the configured database and exits 1 if any of them reads its table
+# with a full scan, so a dropped or unused index is caught before it is slow in
+# production. Run after migrations, on a database with realistic row counts;
+# --seed fills an empty scratch database with synthetic rows first:
+#   DATABASE_URL=mysql+pymysql://.../zhagaram_scratch python -m backend.query_plans --seed 20000
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from .database import engine
+from .models import (
+    AuditLog, CostLayer, Customer, InventoryMovement, Payment, Product, PurchaseItem, Sale, SaleItem, SerialNumber,
+    ServiceTicket, SupplierPrice
+)
+from . import migrations
+
+SINCE = datetime(2026, 4, 1)
+UNTIL = datetime(2026, 5, 1)
+
+# name -> (statement, table that must not be read by a full scan)
+HOT_QUERIES = {
+    "sales list, newest first": (
+        select(Sale.id).order_by(Sale.created_at.desc(), Sale.id.desc()).limit(50), "sales"),
+    "sales list by status": (
+        select(Sale.id).where(Sale.status == "INVOICE")
+        .order_by(Sale.created_at.desc(), Sale.id.desc()).limit(50), "sales"),
+    "sales list by customer": (
+        select(Sale.id).where(Sale.customer_id == 1)
+        .order_by(Sale.created_at.desc(), Sale.id.desc()).limit(50), "sales"),
+    "sales in a date range": (
+        select(Sale.id).where(Sale.created_at >= SINCE, Sale.created_at < UNTIL), "sales"),
+    "sale detail lines": (
+        select(SaleItem).where(SaleItem.sale_id == 1), "sale_items"),
+    "ledger GST per sale": (
+        select(func.sum(SaleItem.total - SaleItem.quantity * SaleItem.unit_price)).where(SaleItem.sale_id == 1),
+        "sale_items"),
+    "sale payments": (
+        select(Payment).where(Payment.sale_id == 1), "payments"),
+    "product stock history": (
+        select(InventoryMovement).where(InventoryMovement.product_id == 1)
+        .order_by(InventoryMovement.created_at), "inventory_movements"),
+    "stock replay after snapshot": (
+        select(InventoryMovement.product_id, func.sum(InventoryMovement.quantity))
+        .where(InventoryMovement.created_at >= SINCE, InventoryMovement.created_at < UNTIL)
+        .group_by(InventoryMovement.product_id), "inventory_movements"),
+    "serials in a movement batch": (
+        select(SerialNumber.product_id, SerialNumber.serial, SerialNumber.in_stock)
+        .where(SerialNumber.serial.in_(["IMEI1", "IMEI2"])), "serial_numbers"),
+    "serial prefix search": (
+        select(SerialNumber.id).where(SerialNumber.serial >= "3520", SerialNumber.serial < "3521")
+        .order_by(SerialNumber.serial, SerialNumber.product_id).limit(20), "serial_numbers"),
+    "device movements": (
+        select(InventoryMovement).where(InventoryMovement.serial_number == "352099001761481")
+        .order_by(InventoryMovement.created_at), "inventory_movements"),
+    "device service tickets": (
+        select(ServiceTicket.id).where(ServiceTicket.serial_number == "352099001761481"), "service_tickets"),
+    "open cost layers of a sale": (
+        select(CostLayer.id, CostLayer.remaining, CostLayer.unit_cost)
+        .where(CostLayer.product_id.in_([1, 2, 3]), CostLayer.remaining > 0)
+        .order_by(CostLayer.product_id, CostLayer.id), "cost_layers"),
+    "supplier prices for SKUs": (
+        select(SupplierPrice).where(SupplierPrice.product_id.in_([1, 2, 3]))
+        .order_by(SupplierPrice.product_id, SupplierPrice.last_landed_cost), "supplier_prices"),
+    "a supplier's prices": (
+        select(SupplierPrice).where(SupplierPrice.supplier_id == 1), "supplier_prices"),
+    "purchase lines": (
+        select(PurchaseItem).where(PurchaseItem.purchase_id == 1), "purchase_items"),
+    "open service tickets": (
+        select(ServiceTicket.id).where(ServiceTicket.status == "RECEIVED"), "service_tickets"),
+    "customer by phone": (
+        select(Customer).where(Customer.phone == "9000000001"), "customers"),
+    "audit trail of a record": (
+        select(AuditLog.id).where(AuditLog.table_name == "sales", AuditLog.record_id == 1)
+        .order_by(AuditLog.created_at.desc()).limit(50), "audit_logs"),
+    "audit trail of a user": (
+        select(AuditLog.id).where(AuditLog.user_id == 1).order_by(AuditLog.created_at.desc()).limit(50),
+        "audit_logs"),
+}
+
+
+def explain(conn, statement):
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    return [dict(row) for row in conn.exec_driver_sql(prefix + compiled.string, params).mappings()]
+
+
+def full_scans(conn, plan, table):
+    """Plan steps that read every row of table."""
+    if conn.dialect.name == "sqlite":
+        # "SCAN sales" is a table scan; "SCAN sales USING [COVERING] INDEX ..." walks an index
+        return [step["detail"] for step in plan
+                if step["detail"].split(" ")[:2] == ["SCAN", table] and "USING" not in step["detail"]]
+    if conn.dialect.name in ("mysql", "mariadb"):
+        return [f"type=ALL rows={step['rows']}" for step in plan
+                if step.get("table") == table and step.get("type") == "ALL"]
+    raise RuntimeError(f"No plan reader for {conn.dialect.name}")
+
+
+def _describe(conn, plan):
+    if conn.dialect.name == "sqlite":
+        return "; ".join(step["detail"] for step in plan)
+    return "; ".join(f"{s.get('table')}:{s.get('type')}/{s.get('key') or '-'}" for s in plan)
+
+
+def seed(conn, rows):
+    """Synthetic data for an empty database, sized so the planner prefers indexes."""
+    if conn.execute(select(func.count()).select_from(Sale)).scalar():
+        print("sales already has rows; not seeding.")
+        return
+
+    customers = max(rows // 10, 10)
+    products = max(rows // 50, 10)
+    conn.execute(insert(Customer), [
+        {"id": i, "name": f"Customer {i}", "phone": f"9{i:09d}", "status": "Active"} for i in range(1, customers + 1)
+    ])
+    conn.execute(insert(Product), [
+        {"id": i, "sku": f"SEED-{i:06d}", "model": f"Model {i}", "purchase_price": 100.0, "sale_price": 125.0,
+         "tax_rate": 18.0, "stock_qty": 50, "low_stock_threshold": 5, "is_active": True}
+        for i in range(1, products + 1)
+    ])
+
+    start = datetime(2025, 4, 1)
+    statuses = ("QUOTE", "INVOICE", "PAID")
+    conn.execute(insert(Sale), [
+        {"id": i, "customer_id": i % customers + 1, "invoice_number": f"SEED/{i:08d}", "status": statuses[i % 3],
+         "total_amount": 250.0, "paid_amount": 0.0, "created_at": start + timedelta(minutes=37 * i)}
+        for i in range(1, rows + 1)
+    ])
+    conn.execute(insert(SaleItem), [
+        {"sale_id": i // 2 + 1, "product_id": i % products + 1, "quantity": 1, "unit_price": 125.0,
+         "tax_rate": 18.0, "total": 147.5}
+        for i in range(rows * 2)
+    ])
+    conn.execute(insert(Payment), [
+        {"sale_id": i, "amount": 100.0, "payment_type": "CASH", "created_at": start + timedelta(minutes=37 * i)}
+        for i in range(1, rows + 1, 2)
+    ])
+    conn.execute(insert(InventoryMovement), [
+        {"product_id": i % products + 1, "movement_type": "IN", "quantity": 5, "remarks": "seed",
+         "created_at": start + timedelta(minutes=11 * i)}
+        for i in range(rows)
+    ])
+    conn.execute(insert(SerialNumber), [
+        {"product_id": i % products + 1, "serial": f"35{i:013d}", "in_stock": i % 3 > 0,
+         "last_movement_type": "PURCHASE", "first_seen_at": start, "updated_at": start}
+        for i in range(rows)
+    ])
+    conn.execute(insert(ServiceTicket), [
+        {"customer_id": i % customers + 1, "product_id": i % products + 1,
+         "status": ("RECEIVED", "IN_PROGRESS", "DELIVERED", "DELIVERED")[i % 4],
+         "created_at": start + timedelta(hours=i)}
+        for i in range(rows // 4)
+    ])
+    conn.execute(insert(AuditLog), [
+        {"user_id": i % 5 + 1, "action": "UPDATE", "table_name": ("sales", "products", "customers")[i % 3],
+         "record_id": i % rows + 1, "created_at": start + timedelta(minutes=7 * i)}
+        for i in range(rows * 2)
+    ])
+    conn.commit()
+
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("ANALYZE")
+    else:
+        tables = {table for _, table in HOT_QUERIES.values()}
+        conn.exec_driver_sql("ANALYZE TABLE " + ", ".join(sorted(tables)))
+    conn.commit()
+    print(f"Seeded {rows} sales and related rows.")
+
+
+def check(bind=engine):
+    failures = 0
+    with bind.connect() as conn:
+        for name, (statement, table) in HOT_QUERIES.items():
+            plan = explain(conn, statement)
+            scans = full_scans(conn, plan, table)
+            failures += bool(scans)
+            print(f"{'FULL SCAN' if scans else 'ok':9} {name:28} {_describe(conn, plan)}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if a hot query's plan regresses to a full table scan")
+    parser.add_argument("--seed", type=int, metavar="SALES",
+                        help="first fill an empty (scratch) database with this many synthetic sales")
+    args = parser.parse_args()
+
+    migrations.upgrade(engine)
+    if args.seed:
+        with engine.connect() as conn:
+            seed(conn, args.seed)
+
+    failed = check()
+    print(f"{failed} of {len(HOT_QUERIES)} hot queries use a full table scan." if failed else "All query plans use indexes.")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,109 @@
+# /backend/receiving.py
+# Goods receipt for purchase orders, any number of POs at a time, each in full or
+# line by line. Everything happens in the caller's transaction:
+#   - the POs and their lines are locked (SELECT ... FOR UPDATE, in id order), so two
+#     receipts of the same PO cannot both book the stock;
+#   - the PURCHASE movements go in with one executemany and products.stock_qty moves
+#     with one UPDATE ... CASE (inventory_ledger.record_movements);
+#   - lines keep received_qty, and a PO stays PARTIAL until every line is complete;
+#   - the supplier price index is refreshed for the products received.
+# Nothing is written when any PO or line is rejected.
+from datetime import datetime
+
+from .models import Purchase, PurchaseItem
+from . import inventory_ledger, supplier_prices
+
+
+def lock_purchases(db, purchase_ids):
+    purchases = db.query(Purchase).filter(Purchase.id.in_(set(purchase_ids)))\
+        .order_by(Purchase.id).with_for_update().all()
+    items = db.query(PurchaseItem).filter(PurchaseItem.purchase_id.in_(set(purchase_ids)))\
+        .order_by(PurchaseItem.id).with_for_update().all()
+    lines = {p.id: [] for p in purchases}
+    for item in items:
+        lines[item.purchase_id].append(item)
+    return {p.id: p for p in purchases}, lines
+
+
+def _outstanding(item):
+    return (item.quantity or 0) - (item.received_qty or 0)
+
+
+def _resolve_lines(items, wanted):
+    """[(item, quantity)] to receive, or an error message. wanted: None (everything
+    outstanding) or lines with item_id or product_id and an optional quantity."""
+    if wanted is None:
+        return [(item, _outstanding(item)) for item in items if _outstanding(item) > 0], None
+
+    by_id = {item.id: item for item in items}
+    remaining = {item.id: _outstanding(item) for item in items}
+    picked = []
+    for line in wanted:
+        if line.item_id is not None:
+            item = by_id.get(line.item_id)
+        else:
+            # By product: the first line of that product with something outstanding
+            item = next((i for i in items if i.product_id == line.product_id and remaining[i.id] > 0), None)
+        if item is None:
+            what = f"item {line.item_id}" if line.item_id is not None else f"product {line.product_id}"
+            return None, f"No outstanding line for {what}"
+        quantity = line.quantity or remaining[item.id]
+        if quantity > remaining[item.id]:
+            return None, f"Line {item.id}: receiving {quantity} but only {remaining[item.id]} outstanding"
+        remaining[item.id] -= quantity
+        picked.append((item, quantity))
+    return picked, None
+
+
+def receive_purchases(db, receipts):
+    """receipts: [(purchase_id, lines or None)]. Returns (results, errors); when errors is
+    non-empty nothing was written and the caller should roll back. The caller commits."""
+    purchases, lines = lock_purchases(db, [purchase_id for purchase_id, _ in receipts])
+
+    errors, plan, seen = [], [], set()
+    for purchase_id, wanted in receipts:
+        purchase = purchases.get(purchase_id)
+        if purchase_id in seen:
+            errors.append({"purchase_id": purchase_id, "detail": "Purchase Order listed twice"})
+        elif not purchase:
+            errors.append({"purchase_id": purchase_id, "detail": "Purchase Order not found"})
+        elif purchase.status == "RECEIVED":
+            errors.append({"purchase_id": purchase_id, "detail": "Purchase Order already received"})
+        else:
+            picked, error = _resolve_lines(lines[purchase_id], wanted)
+            if error:
+                errors.append({"purchase_id": purchase_id, "detail": error})
+            elif not picked:
+                errors.append({"purchase_id": purchase_id, "detail": "Nothing outstanding to receive"})
+            else:
+                plan.append((purchase, picked))
+        seen.add(purchase_id)
+    if errors:
+        return [], errors
+
+    now = datetime.now()
+    movements, results = [], []
+    for purchase, picked in plan:
+        for item, quantity in picked:
+            item.received_qty = (item.received_qty or 0) + quantity
+            movements.append({
+                "product_id": item.product_id,
+                "movement_type": "PURCHASE",
+                "quantity": quantity,
+                "purchase_id": purchase.id,
+                "unit_cost": item.unit_price,
+                "remarks": f"Stock received via Purchase ID {purchase.id}"
+            })
+        complete = all(_outstanding(item) <= 0 for item in lines[purchase.id])
+        purchase.status = "RECEIVED" if complete else "PARTIAL"
+        purchase.received_at = purchase.received_at or now
+        results.append({
+            "purchase_id": purchase.id,
+            "status": purchase.status,
+            "lines_received": len(picked),
+            "units_received": sum(quantity for _, quantity in picked)
+        })
+
+    inventory_ledger.record_movements(db, movements)
+    supplier_prices.refresh_prices(db, [purchase.id for purchase, _ in plan])
+    return results, []
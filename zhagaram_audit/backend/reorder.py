@@ -0,0 +1,190 @@
+# /backend/reorder.py
+# Reorder suggestions for the whole catalogue from recent sales velocity.
+#
+# Four aggregated queries feed it, and the maths runs on NumPy arrays over every
+# product at once, with no per-product queries or loops:
+#   demand     units sold per product per day (SALE movements) over the window
+#   lead time  average days from PO to first receipt, per supplier
+#   supplier   the supplier and price of each product's latest purchase line
+#   on order   units still outstanding on open POs
+# velocity      = mean daily demand over the window (moving average)
+# safety stock  = z(service level) * std dev of daily demand * sqrt(lead days)
+# reorder point = max(velocity * lead days + safety stock, low_stock_threshold)
+# A product at or below its reorder point (stock + on order) is topped up to
+# velocity * (lead + review days) + safety stock (and past the reorder point, when it
+# is above 0). Only products that sold in the window or have a low_stock_threshold
+# are suggested, so dead and discontinued items stay out. Suggestions come back as draft
+# POs per supplier, in the shape POST /api/purchases/ accepts.
+#   python -m backend.reorder [--window-days 56] [--service-level 0.95] [--supplier-id 3]
+# Settings (environment, overridable per call):
+#   REORDER_WINDOW_DAYS        days of sales the velocity is taken over (default 56)
+#   REORDER_SERVICE_LEVEL      chance of not running out during the lead time (default 0.95)
+#   REORDER_REVIEW_DAYS        days until the next order is placed (default 7)
+#   REORDER_DEFAULT_LEAD_DAYS  lead time for suppliers without receipts yet (default 7)
+import argparse
+import os
+import time
+from datetime import date, datetime, timedelta
+from statistics import NormalDist
+
+from sqlalchemy import func, select
+
+from .database import SessionLocal
+from .models import InventoryMovement, Product, Purchase, PurchaseItem, Supplier
+
+WINDOW_DAYS = int(os.getenv("REORDER_WINDOW_DAYS", "56"))
+SERVICE_LEVEL = float(os.getenv("REORDER_SERVICE_LEVEL", "0.95"))
+REVIEW_DAYS = float(os.getenv("REORDER_REVIEW_DAYS", "7"))
+DEFAULT_LEAD_DAYS = float(os.getenv("REORDER_DEFAULT_LEAD_DAYS", "7"))
+# Receipts older than this do not count towards a supplier's lead time
+LEAD_TIME_HISTORY_DAYS = 365
+OPEN_PURCHASE_STATUSES = ("PENDING", "PARTIAL")
+
+
+def _as_date(value):
+    # func.date() comes back as a string on SQLite and as a date on MySQL
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def daily_demand(db, start, end):
+    """[(product_id, day, units)] sold on [start, end)."""
+    # Core select rather than db.query: one row per product per day is too many to
+    # build ORM rows for
+    day = func.date(InventoryMovement.created_at)
+    return db.execute(
+        select(InventoryMovement.product_id, day, func.sum(InventoryMovement.quantity))
+        .where(InventoryMovement.movement_type == "SALE",
+               InventoryMovement.created_at >= datetime.combine(start, datetime.min.time()),
+               InventoryMovement.created_at < datetime.combine(end, datetime.min.time()))
+        .group_by(InventoryMovement.product_id, day)
+    ).all()
+
+
+def supplier_lead_days(db, since):
+    """{supplier_id: average days from order to first receipt}."""
+    days = {}
+    for supplier_id, created_at, received_at in db.query(
+        Purchase.supplier_id, Purchase.created_at, Purchase.received_at
+    ).filter(Purchase.received_at.is_not(None), Purchase.created_at >= since):
+        days.setdefault(supplier_id, []).append((received_at - created_at).total_seconds() / 86400)
+    return {supplier_id: sum(values) / len(values) for supplier_id, values in days.items()}
+
+
+def latest_supplier(db):
+    """{product_id: (supplier_id, unit_price)} from each product's newest purchase line."""
+    newest = db.query(func.max(PurchaseItem.id)).group_by(PurchaseItem.product_id)
+    return {product_id: (supplier_id, unit_price) for product_id, supplier_id, unit_price in db.query(
+        PurchaseItem.product_id, Purchase.supplier_id, PurchaseItem.unit_price
+    ).join(Purchase, Purchase.id == PurchaseItem.purchase_id).filter(PurchaseItem.id.in_(newest))}
+
+
+def on_order(db):
+    """{product_id: units ordered but not yet received}."""
+    outstanding = func.sum(PurchaseItem.quantity - func.coalesce(PurchaseItem.received_qty, 0))
+    return dict(db.query(PurchaseItem.product_id, outstanding)
+                .join(Purchase, Purchase.id == PurchaseItem.purchase_id)
+                .filter(Purchase.status.in_(OPEN_PURCHASE_STATUSES))
+                .group_by(PurchaseItem.product_id).all())
+
+
+def suggest(db, window_days=None, service_level=None, review_days=None, supplier_id=None, today=None):
+    import numpy as np  # only the reorder job pays for importing NumPy
+
+    window_days = window_days or WINDOW_DAYS
+    service_level = service_level or SERVICE_LEVEL
+    review_days = REVIEW_DAYS if review_days is None else review_days
+    today = today or date.today()
+    start = today - timedelta(days=window_days)
+
+    products = db.query(Product.id, Product.sku, Product.model, Product.stock_qty,
+                        Product.low_stock_threshold, Product.purchase_price)\
+        .filter(Product.is_active.is_not(False)).order_by(Product.id).all()
+    params = {"window_days": window_days, "service_level": service_level, "review_days": review_days,
+              "as_of": str(today)}
+    if not products:
+        return {"params": params, "drafts": []}
+
+    ids = np.array([p.id for p in products])
+    column = {product_id: i for i, product_id in enumerate(ids.tolist())}
+
+    # Demand matrix: one row per product, one column per day of the window
+    demand = np.zeros((len(ids), window_days))
+    rows = [(column[pid], (_as_date(day) - start).days, units)
+            for pid, day, units in daily_demand(db, start, today) if pid in column]
+    if rows:
+        p_idx, d_idx, units = (np.array(values) for values in zip(*rows))
+        np.add.at(demand, (p_idx, d_idx), units)
+
+    sources = latest_supplier(db)
+    leads = supplier_lead_days(db, datetime.combine(today - timedelta(days=LEAD_TIME_HISTORY_DAYS), datetime.min.time()))
+    ordered = on_order(db)
+
+    suppliers = [sources.get(pid, (None, None))[0] for pid in ids.tolist()]
+    lead = np.array([leads.get(s, DEFAULT_LEAD_DAYS) for s in suppliers], dtype=float)
+    stock = np.array([p.stock_qty or 0 for p in products], dtype=float)
+    threshold = np.array([p.low_stock_threshold or 0 for p in products], dtype=float)
+    incoming = np.array([float(ordered.get(pid) or 0) for pid in ids.tolist()])
+
+    velocity = demand.mean(axis=1)
+    safety = NormalDist().inv_cdf(service_level) * demand.std(axis=1) * np.sqrt(lead)
+    reorder_point = np.maximum(velocity * lead + safety, threshold)
+    position = stock + incoming
+    cover = velocity * (lead + review_days) + safety
+    target = np.where(reorder_point > 0, np.maximum(cover, reorder_point + 1), cover)
+    quantity = np.ceil(target - position)
+    wanted = np.flatnonzero((position <= reorder_point) & (quantity > 0) & ((velocity > 0) | (threshold > 0)))
+
+    drafts = {}
+    for i in wanted.tolist():
+        source, price = sources.get(products[i].id, (None, None))
+        if supplier_id is not None and source != supplier_id:
+            continue
+        unit_price = float(price if price is not None else products[i].purchase_price or 0)
+        draft = drafts.setdefault(source, {"supplier_id": source, "items": [], "total_amount": 0.0})
+        draft["items"].append({
+            "product_id": products[i].id,
+            "sku": products[i].sku,
+            "model": products[i].model,
+            "quantity": int(quantity[i]),
+            "unit_price": unit_price,
+            "stock_qty": int(stock[i]),
+            "on_order": int(incoming[i]),
+            "velocity_per_day": round(float(velocity[i]), 3),
+            "safety_stock": round(float(safety[i]), 1),
+            "reorder_point": round(float(reorder_point[i]), 1),
+            "lead_days": round(float(lead[i]), 1)
+        })
+        draft["total_amount"] += int(quantity[i]) * unit_price
+
+    names = dict(db.query(Supplier.id, Supplier.name).filter(Supplier.id.in_([s for s in drafts if s])).all())
+    for source, draft in drafts.items():
+        draft["supplier_name"] = names.get(source) if source else None
+        draft["remarks"] = f"Reorder suggestion for {today}"
+    # Products never bought from a supplier come last, for someone to assign
+    ordered_drafts = sorted(drafts.values(), key=lambda d: (d["supplier_id"] is None, -d["total_amount"]))
+    return {"params": params, "drafts": ordered_drafts}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reorder suggestions from sales velocity, as draft POs per supplier")
+    parser.add_argument("--window-days", type=int)
+    parser.add_argument("--service-level", type=float)
+    parser.add_argument("--review-days", type=float)
+    parser.add_argument("--supplier-id", type=int)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        result = suggest(db, args.window_days, args.service_level, args.review_days, args.supplier_id)
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+
+    for draft in result["drafts"]:
+        print(f"Supplier {draft['supplier_name'] or 'unassigned'}: {len(draft['items'])} line(s), "
+              f"{draft['total_amount']:.2f}")
+        for item in draft["items"]:
+            print(f"  {item['sku']:20} order {item['quantity']:>6}  stock {item['stock_qty']:>6}  "
+                  f"on order {item['on_order']:>5}  {item['velocity_per_day']:.2f}/day  ROP {item['reorder_point']}")
+    print(f"{sum(len(d['items']) for d in result['drafts'])} product(s) to reorder, computed in {elapsed:.2f}s.")
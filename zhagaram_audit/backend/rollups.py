@@ -0,0 +1,161 @@
+# /backend/rollups.py
+# Daily sales rollups for the dashboard. record_sale/record_payment are called
+# inside the transaction that creates or pays a sale, so the summary commits (or
+# rolls back) together with it; record_cost books the difference when a quote's
+# stock goes out at its real cost. rebuild() backfills history:
+#   python -m backend.rollups --from 2025-04-01 --to 2026-03-31
+import argparse
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func, insert, select
+
+from .database import SessionLocal
+from .models import DailySalesSummary, DailyProductSales, Sale, SaleItem, Payment, Product
+
+
+def _increment(db, model, rows, amount_columns):
+    # Atomic "insert or add to" so concurrent sales on the same day never lose an update
+    table = model.__table__
+    dialect = db.get_bind().dialect.name
+    # Dialect modules are imported here, on first use, to keep app import fast
+    if dialect in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert as upsert
+        stmt = upsert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update({c: table.c[c] + stmt.inserted[c] for c in amount_columns})
+    else:
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        stmt = upsert(table).values(rows)
+        key_columns = [c.name for c in table.primary_key.columns]
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={c: table.c[c] + stmt.excluded[c] for c in amount_columns}
+        )
+    db.execute(stmt)
+
+
+def record_sale(db, day, total, lines):
+    """lines: dicts with product_id, quantity, total and cost (as built by create_sale)."""
+    per_product = defaultdict(lambda: {"quantity": 0, "revenue": 0.0, "cost": 0.0})
+    for line in lines:
+        bucket = per_product[line["product_id"]]
+        bucket["quantity"] += line["quantity"]
+        bucket["revenue"] += line["total"]
+        bucket["cost"] += line["cost"]
+
+    _increment(db, DailySalesSummary, [{
+        "day": day,
+        "sales_count": 1,
+        "sales_total": total,
+        "cost_total": sum(b["cost"] for b in per_product.values()),
+        "paid_total": 0.0,
+    }], ["sales_count", "sales_total", "cost_total"])
+
+    if per_product:
+        _increment(db, DailyProductSales, [
+            {"day": day, "product_id": product_id, **bucket} for product_id, bucket in per_product.items()
+        ], ["quantity", "revenue", "cost"])
+
+
+def record_cost(db, day, costs):
+    """costs: {product_id: amount} to add to the day's cost of sales."""
+    if not costs:
+        return
+    _increment(db, DailySalesSummary, [{
+        "day": day, "sales_count": 0, "sales_total": 0.0, "cost_total": sum(costs.values()), "paid_total": 0.0,
+    }], ["cost_total"])
+    _increment(db, DailyProductSales, [
+        {"day": day, "product_id": product_id, "quantity": 0, "revenue": 0.0, "cost": cost}
+        for product_id, cost in costs.items()
+    ], ["cost"])
+
+
+def record_payment(db, day, amount):
+    _increment(db, DailySalesSummary, [{
+        "day": day, "sales_count": 0, "sales_total": 0.0, "cost_total": 0.0, "paid_total": amount,
+    }], ["paid_total"])
+
+
+def _as_date(value):
+    # func.date() comes back as a string on SQLite and as a date on MySQL
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _in_range(column, date_from, date_to):
+    conditions = []
+    if date_from:
+        conditions.append(column >= datetime.combine(date_from, time.min))
+    if date_to:
+        conditions.append(column < datetime.combine(date_to + timedelta(days=1), time.min))
+    return conditions
+
+
+def _day_range(column, date_from, date_to):
+    conditions = []
+    if date_from:
+        conditions.append(column >= date_from)
+    if date_to:
+        conditions.append(column <= date_to)
+    return conditions
+
+
+def rebuild(db, date_from=None, date_to=None):
+    # Cost is the realized unit_cost stored on each line (backend/costing.py); lines from
+    # before it existed fall back to today's purchase_price
+    line_cost = SaleItem.quantity * func.coalesce(SaleItem.unit_cost, Product.purchase_price)
+    for model in (DailySalesSummary, DailyProductSales):
+        db.query(model).filter(*_day_range(model.day, date_from, date_to)).delete(synchronize_session=False)
+
+    sale_day = func.date(Sale.created_at)
+    summaries = defaultdict(lambda: {"sales_count": 0, "sales_total": 0.0, "cost_total": 0.0, "paid_total": 0.0})
+
+    for day, count, total in db.query(sale_day, func.count(Sale.id), func.sum(Sale.total_amount))\
+            .filter(*_in_range(Sale.created_at, date_from, date_to)).group_by(sale_day):
+        summaries[_as_date(day)].update(sales_count=count, sales_total=float(total or 0))
+
+    for day, cost in db.query(sale_day, func.sum(line_cost))\
+            .select_from(SaleItem)\
+            .join(Sale, Sale.id == SaleItem.sale_id)\
+            .join(Product, Product.id == SaleItem.product_id)\
+            .filter(*_in_range(Sale.created_at, date_from, date_to)).group_by(sale_day):
+        summaries[_as_date(day)]["cost_total"] = float(cost or 0)
+
+    payment_day = func.date(Payment.created_at)
+    for day, paid in db.query(payment_day, func.sum(Payment.amount))\
+            .filter(*_in_range(Payment.created_at, date_from, date_to)).group_by(payment_day):
+        summaries[_as_date(day)]["paid_total"] = float(paid or 0)
+
+    if summaries:
+        db.execute(insert(DailySalesSummary), [{"day": day, **values} for day, values in summaries.items()])
+
+    # Per-product rows can be large (days x products), so they are built entirely in SQL
+    db.execute(insert(DailyProductSales).from_select(
+        ["day", "product_id", "quantity", "revenue", "cost"],
+        select(
+            sale_day, SaleItem.product_id, func.sum(SaleItem.quantity), func.sum(SaleItem.total),
+            func.sum(line_cost)
+        ).select_from(SaleItem)
+         .join(Sale, Sale.id == SaleItem.sale_id)
+         .join(Product, Product.id == SaleItem.product_id)
+         .where(*_in_range(Sale.created_at, date_from, date_to))
+         .group_by(sale_day, SaleItem.product_id)
+    ))
+    db.commit()
+    return len(summaries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the daily sales rollup tables")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat)
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        days = rebuild(db, args.date_from, args.date_to)
+        print(f"Rebuilt daily sales summary for {days} day(s).")
+    finally:
+        db.close()
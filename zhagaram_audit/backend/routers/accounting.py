@@ -1,10 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from datetime import date
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime, time, timedelta
+from typing import Optional
 import csv
-import os
+import io
+import zlib
 
-from ..database import get_db
+from ..database import get_async_read_db, AsyncSessionLocal
 from ..models import Sale, SaleItem, Purchase, Customer
 from ..audit import log_action
 
@@ -13,39 +17,80 @@ router = APIRouter(
     tags=["Accounting"]
 )
 
+# GST on a sale = tax-inclusive line totals minus their pre-tax value (Sale has no stored GST column)
+gst_amount = select(
+    func.coalesce(func.sum(SaleItem.total - SaleItem.quantity * SaleItem.unit_price), 0)
+).where(SaleItem.sale_id == Sale.id).correlate(Sale).scalar_subquery().label("gst")
+
 # 1. Provide JSON data for the HTML Table
 @router.get("/ledger/data")
-def get_ledger_data(db: Session = Depends(get_db)):
+async def get_ledger_data(db: AsyncSession = Depends(get_async_read_db)):
     try:
-        sales = db.query(Sale).order_by(Sale.created_at.desc()).all()
+        sales = (await db.execute(select(Sale, gst_amount).order_by(Sale.created_at.desc()))).all()
         return [{
             "id": s.id,
             "invoice": s.invoice_number,
             "total": float(s.total_amount or 0),
-            "gst": float(s.gst_total or 0),
+            "gst": float(gst or 0),
             "paid": float(s.paid_amount or 0),
             "balance": float((s.total_amount or 0) - (s.paid_amount or 0)),
             "status": s.status,
             "date": s.created_at.strftime("%Y-%m-%d") if s.created_at else "N/A"
-        } for s in sales]
+        } for s, gst in sales]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Data Fetch Error: {str(e)}")
 
-# 2. Export logic (Original logic with fixed paths)
-@router.get("/ledger/sales/export")
-def export_sales_ledger(db: Session = Depends(get_db)):
+# 2. Export logic: streamed straight to the client, never written to disk
+EXPORT_CHUNK_ROWS = 1000
+
+async def iter_ledger_csv(date_from, date_to, status, compress):
+    # Own session: the stream outlives the request-scoped get_db dependency
+    db = AsyncSessionLocal()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    gzipper = zlib.compressobj(wbits=31) if compress else None  # wbits=31 -> gzip container
+
+    def flush():
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+        return gzipper.compress(data) if gzipper else data
+
     try:
-        sales = db.query(Sale).all()
-        filename = f"sales_ledger_{date.today()}.csv"
-        # Saves in the project root
-        filepath = os.path.join(os.getcwd(), filename)
-        
-        with open(filepath, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(["Invoice No", "Total", "GST", "Paid", "Status", "Date"])
-            for s in sales:
-                writer.writerow([s.invoice_number, s.total_amount, s.gst_total, s.paid_amount, s.status, s.created_at])
-        
-        return {"message": "Exported successfully", "filename": filename}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        query = select(
+            Sale.invoice_number, Sale.total_amount, gst_amount, Sale.paid_amount, Sale.status, Sale.created_at
+        ).order_by(Sale.id)
+        if date_from:
+            query = query.where(Sale.created_at >= datetime.combine(date_from, time.min))
+        if date_to:
+            query = query.where(Sale.created_at < datetime.combine(date_to + timedelta(days=1), time.min))
+        if status:
+            query = query.where(Sale.status == status)
+
+        writer.writerow(["Invoice No", "Total", "GST", "Paid", "Status", "Date"])
+        # yield_per turns on stream_results (server-side cursor), so memory stays flat
+        result = await db.stream(query.execution_options(yield_per=EXPORT_CHUNK_ROWS))
+        async for rows in result.partitions():
+            writer.writerows(rows)
+            yield flush()
+
+        tail = flush()
+        if gzipper:
+            tail += gzipper.flush()
+        yield tail
+    finally:
+        await db.close()
+
+@router.get("/ledger/sales/export")
+async def export_sales_ledger(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    status: Optional[str] = None,
+    gzip: bool = False
+):
+    filename = f"sales_ledger_{date.today()}.csv" + (".gz" if gzip else "")
+    return StreamingResponse(
+        iter_ledger_csv(date_from, date_to, status, gzip),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,85 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+import json
+
+from ..database import get_db
+from ..models import AuditLog
+from ..pagination import encode_cursor, decode_cursor, after_cursor
+from .. import audit_archive, audit_chain
+
+router = APIRouter(
+    prefix="/api/audit",
+    tags=["Audit"]
+)
+
+MAX_PAGE_SIZE = 500
+MAX_VERIFY_WORKERS = 8
+
+# Newest first, keyset paginated on (created_at, id). Filters line up with the
+# (table_name, record_id, created_at) and (user_id, created_at) indexes.
+# include_archive continues into the NDJSON archive once live rows run out.
+@router.get("/")
+def query_audit_log(
+    table_name: Optional[str] = None,
+    record_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    include_archive: bool = False,
+    db: Session = Depends(get_db)
+):
+    query = db.query(*audit_archive.COLUMNS)
+    if table_name:
+        query = query.filter(AuditLog.table_name == table_name)
+    if record_id is not None:
+        query = query.filter(AuditLog.record_id == record_id)
+    if user_id is not None:
+        query = query.filter(AuditLog.user_id == user_id)
+    if action:
+        query = query.filter(AuditLog.action == action)
+    if date_from:
+        query = query.filter(AuditLog.created_at >= datetime.combine(date_from, time.min))
+    if date_to:
+        query = query.filter(AuditLog.created_at < datetime.combine(date_to + timedelta(days=1), time.min))
+    if cursor:
+        query = query.filter(after_cursor(AuditLog.created_at, AuditLog.id, cursor))
+
+    rows = query.order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).limit(limit + 1).all()
+    items = [dict(audit_archive.row_to_dict(r), source="live") for r in rows]
+
+    if include_archive and len(items) <= limit:
+        if items:
+            before = (rows[-1].created_at, rows[-1].id)
+        else:
+            before = decode_cursor(cursor) if cursor else None
+        filters = {"table_name": table_name, "record_id": record_id, "user_id": user_id, "action": action}
+        archived = audit_archive.search(filters, date_from, date_to, before, limit + 1 - len(items))
+        items.extend(dict(item, source="archive") for item in archived)
+
+    has_more = len(items) > limit
+    items = items[:limit]
+    for item in items:
+        item["changes"] = json.loads(item["changes"]) if item["changes"] else None
+
+    next_cursor = None
+    if has_more:
+        last = items[-1]
+        next_cursor = encode_cursor(datetime.fromisoformat(last["created_at"]), last["id"])
+
+    return {"items": items, "next_cursor": next_cursor}
+
+# Walks the hash chain checkpoint to checkpoint; large ranges are better run via
+# "python -m backend.audit_chain verify" than over HTTP
+@router.get("/verify")
+def verify_audit_chain(
+    from_seq: Optional[int] = Query(None, ge=1),
+    to_seq: Optional[int] = Query(None, ge=1),
+    workers: int = Query(4, ge=1, le=MAX_VERIFY_WORKERS),
+    db: Session = Depends(get_db)
+):
+    return audit_chain.verify(db, from_seq, to_seq, workers)
@@ -4,7 +4,7 @@ from sqlalchemy.orm import Session
 import logging
 from pydantic import BaseModel, Field
 from typing import Optional
-from ..database import get_db
+from ..database import get_db, get_read_db
 from ..models import Customer
 
 logging.basicConfig(level=logging.INFO)
@@ -69,7 +69,7 @@ def create_customer(
 # 2. GET All Customers -> Final URL: /api/customers/
 # -----------------------------------------------------------------
 @router.get("/")
-def read_customers(db: Session = Depends(get_db)):
+def read_customers(db: Session = Depends(get_read_db)):
     try:
         customers = db.query(Customer).all()
         return customers # FastAPI handles the formatting automatically
@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+
+from ..database import pool_stats, replica_stats, engine, async_engine, POOL_SIZE, MAX_OVERFLOW, POOL_RECYCLE, POOL_PRE_PING, STATEMENT_TIMEOUT_MS
+
+# Operational endpoints, hidden from the OpenAPI schema
+router = APIRouter(
+    prefix="/internal",
+    tags=["Internal"],
+    include_in_schema=False
+)
+
+# Live connection pool figures for sizing gunicorn workers against DB_POOL_SIZE /
+# DB_MAX_OVERFLOW: a non-zero overflow or rising avg_wait_ms means the pool is too small
+@router.get("/db/pool")
+def db_pool():
+    return {
+        "dialect": engine.dialect.name,
+        "config": {
+            "pool_size": POOL_SIZE,
+            "max_overflow": MAX_OVERFLOW,
+            "pool_recycle": POOL_RECYCLE,
+            "pool_pre_ping": POOL_PRE_PING,
+            "statement_timeout_ms": STATEMENT_TIMEOUT_MS,
+        },
+        "pool": pool_stats(),
+        "async_pool": pool_stats(async_engine.pool),
+        "replicas": replica_stats(),
+    }
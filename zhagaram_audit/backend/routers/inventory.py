@@ -1,13 +1,26 @@
-from fastapi import APIRouter, Depends
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from ..database import SessionLocal
-from ..models import InventoryMovement
+from datetime import date
+from typing import Optional
+from ..database import AUDIT_USER_ID, SessionLocal, get_async_db, get_read_db
+from ..models import (
+    Customer, InventoryMovement, LowStockItem, Product, Purchase, Sale, SerialNumber, ServiceTicket, Supplier
+)
 from ..audit import log_action
+from ..uploads import iter_records, upload_format
+from .. import inventory_ledger, kpi_cache
 
 router = APIRouter()
 
+# Movements validated, inserted and committed together in a batch upload
+BATCH_CHUNK_SIZE = 500
+
 def get_db():
     db = SessionLocal()
+    db.info["audit_user_id"] = AUDIT_USER_ID
     try:
         yield db
     finally:
@@ -22,15 +35,155 @@ def stock_movement(
     remarks: str = "",
     db: Session = Depends(get_db)
 ):
-    movement = InventoryMovement(
-        product_id=product_id,
-        movement_type=movement_type,
-        quantity=quantity,
-        serial_number=serial_number,
-        remarks=remarks
-    )
-    db.add(movement)
+    error = inventory_ledger.validate_movement(movement_type, quantity)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    if not db.get(Product, product_id):
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    movement = {
+        "product_id": product_id,
+        "movement_type": movement_type,
+        "quantity": quantity,
+        "serial_number": serial_number,
+        "remarks": remarks
+    }
+    error = inventory_ledger.serial_conflicts(db, [movement])[0]
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+
+    # Writes the movement and moves products.stock_qty in the same transaction
+    inventory_ledger.record_movements(db, [movement])
     db.commit()
+    kpi_cache.invalidate(*kpi_cache.STOCK_WRITE)
 
     log_action(1, "STOCK_MOVE", "inventory_movements", product_id)
     return {"message": "Stock updated"}
+
+# Bulk stock movements (e.g. scanning a carton of serialized handsets against its
+# purchase_id): a JSON array, NDJSON or CSV (see backend/uploads.py). Each chunk is
+# checked with set-based queries, inserted in one executemany and committed; one
+# result per line, returned as NDJSON for an NDJSON upload.
+@router.post("/moves:batch")
+async def batch_movements(request: Request, db: AsyncSession = Depends(get_async_db)):
+    results, chunk = [], []
+    async for line in iter_records(request, key="movements"):
+        chunk.append(line)
+        if len(chunk) == BATCH_CHUNK_SIZE:
+            results.extend(await db.run_sync(inventory_ledger.apply_batch, chunk))
+            chunk = []
+    if chunk:
+        results.extend(await db.run_sync(inventory_ledger.apply_batch, chunk))
+
+    applied = sum(1 for r in results if r["status"] == "APPLIED")
+    if applied:
+        kpi_cache.invalidate(*kpi_cache.STOCK_WRITE)
+        log_action(1, "STOCK_MOVE_BATCH", "inventory_movements", None)
+
+    if upload_format(request) == "ndjson":
+        return Response("".join(json.dumps(r) + "\n" for r in results), media_type="application/x-ndjson")
+    return {"applied": applied, "failed": len(results) - applied, "results": results}
+
+# Serial / IMEI search: exact or prefix, on the normalized registry
+@router.get("/serials")
+def search_serials(q: str, limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_read_db)):
+    if not inventory_ledger.normalize_serial(q):
+        raise HTTPException(status_code=400, detail="Search needs at least one letter or digit")
+    return [{
+        "serial": unit.serial,
+        "product_id": unit.product_id,
+        "sku": sku,
+        "model": model,
+        "in_stock": unit.in_stock,
+        "last_movement_type": unit.last_movement_type,
+        "updated_at": str(unit.updated_at) if unit.updated_at else None
+    } for unit, sku, model in inventory_ledger.search_serials(db, q, limit)]
+
+# Everything that happened to one device: the units registered under the serial, its
+# movements with the purchase/sale behind each, and service tickets raised for it
+@router.get("/serials/{serial}")
+def serial_history(serial: str, db: Session = Depends(get_read_db)):
+    serial = inventory_ledger.normalize_serial(serial)
+    if not serial:
+        raise HTTPException(status_code=404, detail="Serial not found")
+
+    units = db.query(SerialNumber, Product.sku, Product.model)\
+        .join(Product, Product.id == SerialNumber.product_id)\
+        .filter(SerialNumber.serial == serial).order_by(SerialNumber.product_id).all()
+    movements = db.query(InventoryMovement, Sale.invoice_number, Customer.name, Purchase.id, Supplier.name)\
+        .outerjoin(Sale, Sale.id == InventoryMovement.sale_id)\
+        .outerjoin(Customer, Customer.id == Sale.customer_id)\
+        .outerjoin(Purchase, Purchase.id == InventoryMovement.purchase_id)\
+        .outerjoin(Supplier, Supplier.id == Purchase.supplier_id)\
+        .filter(InventoryMovement.serial_number == serial)\
+        .order_by(InventoryMovement.created_at, InventoryMovement.id).all()
+    tickets = db.query(ServiceTicket, Customer.name)\
+        .outerjoin(Customer, Customer.id == ServiceTicket.customer_id)\
+        .filter(ServiceTicket.serial_number == serial)\
+        .order_by(ServiceTicket.created_at, ServiceTicket.id).all()
+    if not (units or movements or tickets):
+        raise HTTPException(status_code=404, detail="Serial not found")
+
+    return {
+        "serial": serial,
+        "units": [{
+            "product_id": unit.product_id, "sku": sku, "model": model, "in_stock": unit.in_stock,
+            "first_seen_at": str(unit.first_seen_at) if unit.first_seen_at else None
+        } for unit, sku, model in units],
+        "movements": [{
+            "created_at": str(m.created_at) if m.created_at else None,
+            "product_id": m.product_id,
+            "movement_type": m.movement_type,
+            "quantity": m.quantity,
+            "remarks": m.remarks,
+            "purchase_id": purchase_id,
+            "supplier": supplier,
+            "sale_id": m.sale_id,
+            "invoice_number": invoice_number,
+            "customer": customer
+        } for m, invoice_number, customer, purchase_id, supplier in movements],
+        "service_tickets": [{
+            "id": t.id,
+            "product_id": t.product_id,
+            "customer": customer,
+            "status": t.status,
+            "remarks": t.remarks,
+            "created_at": str(t.created_at) if t.created_at else None
+        } for t, customer in tickets]
+    }
+
+# Products at or below their low-stock threshold, from the maintained set (no product scan)
+@router.get("/low-stock")
+def low_stock(db: Session = Depends(get_read_db)):
+    rows = db.query(LowStockItem, Product.sku, Product.model)\
+        .join(Product, Product.id == LowStockItem.product_id)\
+        .order_by(LowStockItem.stock_qty - LowStockItem.threshold, LowStockItem.product_id).all()
+    return [{
+        "product_id": item.product_id,
+        "sku": sku,
+        "model": model,
+        "stock_qty": item.stock_qty,
+        "threshold": item.threshold,
+        "since": str(item.since)
+    } for item, sku, model in rows]
+
+# Stock per product from the movement ledger, at the end of as_of (default: now)
+@router.get("/stock")
+def stock_levels(as_of: Optional[date] = None, product_id: Optional[int] = None, db: Session = Depends(get_read_db)):
+    products = db.query(Product.id, Product.sku, Product.model)
+    if product_id is not None:
+        products = products.filter(Product.id == product_id)
+    products = products.order_by(Product.id).all()
+
+    stock = inventory_ledger.stock_as_of(db, as_of, [p.id for p in products] if product_id is not None else None)
+    return {
+        "as_of": str(as_of) if as_of else None,
+        "items": [{"product_id": p.id, "sku": p.sku, "model": p.model, "quantity": stock.get(p.id, 0)} for p in products]
+    }
+
+# Products whose stock_qty disagrees with the ledger (report only; fixing is done by
+# "python -m backend.inventory_ledger reconcile --fix")
+@router.get("/reconcile")
+def reconcile_stock(db: Session = Depends(get_db)):
+    drift = inventory_ledger.reconcile(db)
+    return {"drifted": len(drift), "items": drift}
@@ -1,15 +1,19 @@
+import os
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from ..database import SessionLocal
+from ..database import AUDIT_USER_ID, SessionLocal
 from ..models import Notification, Customer
 from ..audit import log_action
 from datetime import datetime
-import requests
 
 router = APIRouter()
 
+# Staff number that low-stock alerts go to
+LOW_STOCK_ALERT_PHONE = os.getenv("LOW_STOCK_ALERT_PHONE", "")
+
 def get_db():
     db = SessionLocal()
+    db.info["audit_user_id"] = AUDIT_USER_ID
     try:
         yield db
     finally:
@@ -21,7 +25,8 @@ def send_sms(phone: str, message: str):
     TWILIO_AUTH = "YOUR_TWILIO_AUTH_TOKEN"
     TWILIO_FROM = "YOUR_TWILIO_NUMBER"
 
-    # Here you would integrate Twilio API call
+    # Here you would integrate Twilio API call (import the HTTP client inside this
+    # function, so importing the app does not pay for it)
     # For demo, just print
     print(f"SMS to {phone}: {message}")
     return True
@@ -32,6 +37,16 @@ def send_whatsapp(phone: str, message: str):
     print(f"WhatsApp to {phone}: {message}")
     return True
 
+def send_any(phone: str, message: str):
+    # Each channel is tried on its own, so one being down does not stop the other
+    sent = False
+    for channel in (send_sms, send_whatsapp):
+        try:
+            sent = bool(channel(phone, message)) or sent
+        except Exception as e:
+            print(f"{channel.__name__} to {phone} failed: {e}")
+    return sent
+
 @router.post("/send_notification")
 def send_notification(customer_id: int, notif_type: str, db: Session = Depends(get_db)):
     customer = db.query(Customer).filter(Customer.id == customer_id).first()
@@ -67,3 +82,24 @@ def send_notification(customer_id: int, notif_type: str, db: Session = Depends(g
     log_action(1, f"SEND_NOTIFICATION_{notif_type}", "notifications", notif.id)
     return {"message": f"Notification {status}", "notification_id": notif.id}
 
+# Sends the LOW_STOCK notifications queued by inventory_ledger (LOW_STOCK_NOTIFY=1) to
+# the store's alert number; call from cron or after a busy stock intake. An alert is
+# SENT once any channel delivers it; otherwise it stays PENDING for the next call.
+@router.post("/send_low_stock_alerts")
+def send_low_stock_alerts(db: Session = Depends(get_db)):
+    if not LOW_STOCK_ALERT_PHONE:
+        return {"error": "LOW_STOCK_ALERT_PHONE is not set"}
+
+    pending = db.query(Notification).filter(
+        # FAILED: alerts marked so before they were left PENDING on failure
+        Notification.type == "LOW_STOCK", Notification.status.in_(("PENDING", "FAILED"))
+    ).order_by(Notification.id).all()
+    sent = [notif for notif in pending if send_any(LOW_STOCK_ALERT_PHONE, notif.message)]
+    for notif in sent:
+        notif.status = "SENT"
+        notif.sent_at = datetime.now()
+    db.commit()
+
+    if sent:
+        log_action(1, "SEND_NOTIFICATION_LOW_STOCK", "notifications", sent[-1].id)
+    return {"message": f"{len(sent)} low-stock alert(s) sent, {len(pending) - len(sent)} left pending"}
@@ -3,15 +3,16 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 import logging
 
-from ..database import get_db
-from ..models import Product as DBProduct
+from ..database import get_db, get_read_db
+from ..models import LowStockItem, Product as DBProduct, SupplierPrice
 from ..schemas import ProductCreate, Product as ProductSchema
+from .. import pricing, kpi_cache, inventory_ledger
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.get("/")
-def read_products(db: Session = Depends(get_db)):
+def read_products(db: Session = Depends(get_read_db)):
     products = db.query(DBProduct).all()
     return [
         {
@@ -32,9 +33,19 @@ def create_product(product_data: ProductCreate, db: Session = Depends(get_db)):
         if existing_product:
             raise HTTPException(status_code=400, detail="Product with this SKU already exists.")
 
-        new_product = DBProduct(**product_data.dict())
+        # Initial stock enters through the ledger as an OPENING movement
+        new_product = DBProduct(**product_data.dict(exclude={"stock_qty"}), stock_qty=0)
         db.add(new_product)
+        db.flush()
+        if product_data.stock_qty:
+            inventory_ledger.record_movements(db, [{
+                "product_id": new_product.id, "movement_type": "OPENING",
+                "quantity": product_data.stock_qty, "remarks": "Opening stock"
+            }])
+        else:
+            inventory_ledger.refresh_low_stock(db, [new_product.id])
         db.commit()
+        kpi_cache.invalidate(*kpi_cache.STOCK_WRITE)
         db.refresh(new_product)
         return new_product
     except Exception as e:
@@ -55,10 +66,21 @@ def update_product(product_id: int, product_data: ProductCreate, db: Session = D
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    for key, value in product_data.dict().items():
+    # A changed stock_qty becomes an ADJUSTMENT movement rather than an overwrite
+    for key, value in product_data.dict(exclude={"stock_qty"}).items():
         setattr(db_product, key, value)
-    
+    difference = product_data.stock_qty - (db_product.stock_qty or 0)
+    if difference:
+        inventory_ledger.record_movements(db, [{
+            "product_id": product_id, "movement_type": "ADJUSTMENT",
+            "quantity": difference, "remarks": "Stock edited on the product form"
+        }])
+    # The threshold or is_active may have changed even when the stock did not
+    inventory_ledger.refresh_low_stock(db, [product_id])
+
     db.commit()
+    pricing.invalidate(product_id)
+    kpi_cache.invalidate(*kpi_cache.STOCK_WRITE)
     db.refresh(db_product)
     return db_product
 
@@ -67,6 +89,10 @@ def delete_product(product_id: int, db: Session = Depends(get_db)):
     db_product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
+    db.query(LowStockItem).filter(LowStockItem.product_id == product_id).delete()
+    db.query(SupplierPrice).filter(SupplierPrice.product_id == product_id).delete()
     db.delete(db_product)
     db.commit()
+    pricing.invalidate(product_id)
+    kpi_cache.invalidate(*kpi_cache.STOCK_WRITE)
     return None
\ No newline at end of file
@@ -1,17 +1,28 @@
 # /backend/routers/purchase.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
-from ..database import SessionLocal
-from ..models import Supplier as DBSupplier, Purchase, PurchaseItem, InventoryMovement, Expense, Product
-from ..audit import log_action
-from ..schemas import PurchaseCreate
+from ..database import AUDIT_USER_ID, SessionLocal, get_async_db, get_read_db
+from ..models import Supplier as DBSupplier, Purchase, PurchaseItem, Expense, Product
+from ..audit import log_action, log_actions
+from .. import kpi_cache
+from ..receiving import receive_purchases
+from ..purchase_orders import create_purchases, group_rows, import_orders, missing_references
+from ..uploads import iter_records
+from .. import reorder, supplier_prices
+from ..schemas import PurchaseCreate, PurchaseReceipt, PurchaseReceiptBatch, SupplierPriceComparison
 from sqlalchemy import func 
 
 router = APIRouter(tags=["Purchases"])
 
+# Upload rows resolved and checked per query round in an import
+IMPORT_CHUNK_SIZE = 500
+
 def get_db():
     db = SessionLocal()
+    db.info["audit_user_id"] = AUDIT_USER_ID
     try:
         yield db
     finally:
@@ -107,7 +118,7 @@ def delete_supplier(supplier_id: int, db: Session = Depends(get_db)):
 # ===============================================
 # Endpoint: /api/purchases/ (For GET)
 @router.get("/")
-def list_purchases(db: Session = Depends(get_db)):
+def list_purchases(db: Session = Depends(get_read_db)):
     purchases = db.query(Purchase).options(joinedload(Purchase.supplier)).all()
     
     result = []
@@ -135,69 +146,144 @@ def create_purchase(
     purchase_data: PurchaseCreate,
     db: Session = Depends(get_db)
 ):
-    total_amount = sum(item.quantity * item.unit_price for item in purchase_data.items)
-    purchase = Purchase(
-        supplier_id=purchase_data.supplier_id,
-        total_amount=total_amount,
-        remarks=purchase_data.remarks,
-        status="PENDING"
+    if not purchase_data.items:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A purchase order needs at least one item")
+    bad_suppliers, bad_products = missing_references(
+        db, [purchase_data.supplier_id], [item.product_id for item in purchase_data.items]
     )
-    db.add(purchase)
-    db.commit()
-    db.refresh(purchase)
-
-    for item in purchase_data.items:
-        purchase_item = PurchaseItem(
-            purchase_id=purchase.id,
-            product_id=item.product_id,
-            quantity=item.quantity,
-            unit_price=item.unit_price
-        )
-        db.add(purchase_item)
+    if bad_suppliers:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Supplier not found")
+    if bad_products:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Product {min(bad_products)} not found")
+
+    # Header and lines in one transaction
+    purchase, = create_purchases(db, [{
+        "supplier_id": purchase_data.supplier_id,
+        "remarks": purchase_data.remarks,
+        "items": [item.dict() for item in purchase_data.items]
+    }])
+    log_action(1, "CREATE_PURCHASE", "purchases", purchase.id, must_persist=True, db=db)
     db.commit()
-
-    log_action(1, "CREATE_PURCHASE", "purchases", purchase.id)
     return {"message": "Purchase order created", "purchase_id": purchase.id}
 
 
+# ===============================================
+# IMPORT PURCHASE ORDERS FROM A SUPPLIER FILE
+# ===============================================
+# Endpoint: /api/purchases/import[?supplier_id=]
+# CSV (text/csv), NDJSON (application/x-ndjson) or a JSON array; columns sku or
+# product_id, quantity, unit_price, supplier_id (or the query parameter), po_ref,
+# remarks. The file is read and checked a chunk at a time; valid rows become POs in
+# one transaction at the end, bad rows come back as errors.
+@router.post("/import", status_code=status.HTTP_201_CREATED)
+async def import_purchases(request: Request, supplier_id: Optional[int] = None,
+                           db: AsyncSession = Depends(get_async_db)):
+    orders, errors, chunk, rows = {}, [], [], 0
+    async for line in iter_records(request):
+        chunk.append(line)
+        rows += 1
+        if len(chunk) == IMPORT_CHUNK_SIZE:
+            await db.run_sync(group_rows, chunk, orders, errors, supplier_id)
+            chunk = []
+    if chunk:
+        await db.run_sync(group_rows, chunk, orders, errors, supplier_id)
+    report = await db.run_sync(import_orders, orders, errors)
+    # One audit INSERT for every PO in the file, committed with them
+    await db.run_sync(lambda session: log_actions(
+        1, "CREATE_PURCHASE", "purchases", [purchase["purchase_id"] for purchase in report["purchases"]], db=session
+    ))
+    await db.commit()
+    return {"created": len(report["purchases"]), "rows": rows, **report}
+
+
+# ===============================================
+# REORDER SUGGESTIONS (DRAFT POs PER SUPPLIER)
+# ===============================================
+# Endpoint: /api/purchases/suggestions
+# Each draft can be posted to /api/purchases/ as it is (see backend/reorder.py)
+@router.get("/suggestions")
+def reorder_suggestions(
+    window_days: Optional[int] = Query(None, ge=7, le=365),
+    service_level: Optional[float] = Query(None, gt=0.5, lt=1),
+    review_days: Optional[float] = Query(None, ge=0, le=90),
+    supplier_id: Optional[int] = None,
+    db: Session = Depends(get_read_db)
+):
+    return reorder.suggest(db, window_days, service_level, review_days, supplier_id)
+
+
+# ===============================================
+# SUPPLIER PRICE INDEX (PRICE PREFILL, COMPARISON)
+# ===============================================
+# Endpoint: /api/purchases/prices?supplier_id=&product_id=
+# Last, lowest and average price paid per supplier and product (see backend/supplier_prices.py);
+# new_purchase.html prefills unit prices from a supplier's rows
+@router.get("/prices")
+def supplier_price_lookup(supplier_id: Optional[int] = None, product_id: Optional[int] = None,
+                          db: Session = Depends(get_read_db)):
+    if supplier_id is None and product_id is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Give a supplier_id, a product_id or both")
+    rows = supplier_prices.lookup(db, supplier_id, [product_id] if product_id is not None else None)
+    return [supplier_prices.as_dict(price, supplier_name) for price, supplier_name in rows]
+
+
+# Endpoint: /api/purchases/prices:compare
+# Every supplier's prices for up to 500 products, cheapest landed cost first
+@router.post("/prices:compare")
+def compare_supplier_prices(comparison: SupplierPriceComparison, db: Session = Depends(get_read_db)):
+    if len(comparison.product_ids) + len(comparison.skus) > 500:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Compare at most 500 products at a time")
+    product_ids = set(comparison.product_ids)
+    missing = []
+    if comparison.skus:
+        by_sku = dict(db.query(Product.sku, Product.id).filter(Product.sku.in_(set(comparison.skus))).all())
+        missing = sorted(set(comparison.skus) - set(by_sku))
+        product_ids |= set(by_sku.values())
+    items = supplier_prices.compare(db, product_ids, comparison.since) if product_ids else []
+    missing += sorted(product_ids - {item["product_id"] for item in items})
+    return {"items": items, "missing": missing}
+
+
 # ===============================================
 # RECEIVE PURCHASE ORDER (UPDATE STATUS AND INVENTORY)
 # ===============================================
 # Endpoint: /api/purchases/{purchase_id}/receive
+# No body receives everything outstanding; {"lines": [...]} receives part of the PO
 @router.post("/{purchase_id}/receive")
-def receive_purchase(purchase_id: int, db: Session = Depends(get_db)):
-    purchase = db.query(Purchase).filter(Purchase.id == purchase_id).first()
-    
-    if not purchase:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Purchase Order not found")
-        
-    if purchase.status == "RECEIVED":
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Purchase Order already received")
-
-    # Update stock for each item
-    items = db.query(PurchaseItem).filter(PurchaseItem.purchase_id == purchase_id).all()
-    
-    for item in items:
-        # 1. Create Inventory Movement
-        movement = InventoryMovement(
-            product_id=item.product_id,
-            movement_type="PURCHASE",
-            quantity=item.quantity,
-            remarks=f"Stock received via Purchase ID {purchase_id}"
+def receive_purchase(purchase_id: int, receipt: Optional[PurchaseReceipt] = None, db: Session = Depends(get_db)):
+    # Lines locked, movements bulk-inserted and stock moved in one UPDATE (see backend/receiving.py)
+    results, errors = receive_purchases(db, [(purchase_id, receipt.lines if receipt else None)])
+    if errors:
+        db.rollback()
+        not_found = errors[0]["detail"] == "Purchase Order not found"
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND if not_found else status.HTTP_400_BAD_REQUEST,
+            detail=errors[0]["detail"]
         )
-        db.add(movement)
-        
-        # 2. Update Product Stock Quantity
-        db_product = db.query(Product).filter(Product.id == item.product_id).first()
-        if db_product:
-            db_product.stock_qty += item.quantity
-    
-    # 3. Update Purchase Order Status
-    purchase.status = "RECEIVED"
+    log_action(1, "RECEIVE_PURCHASE", "purchases", purchase_id, must_persist=True, db=db)
     db.commit()
+    kpi_cache.invalidate(*kpi_cache.STOCK_WRITE)
 
-    log_action(1, "RECEIVE_PURCHASE", "purchases", purchase.id)
-    return {"message": "Stock received and inventory updated successfully"}
+    if results[0]["status"] == "PARTIAL":
+        return {"message": "Stock partially received; the PO stays open for the rest", **results[0]}
+    return {"message": "Stock received and inventory updated successfully", **results[0]}
+
+
+# ===============================================
+# RECEIVE MANY PURCHASE ORDERS (ONE TRANSACTION)
+# ===============================================
+# Endpoint: /api/purchases/receive:batch
+# All POs are received together or, if any PO or line is rejected, none are
+@router.post("/receive:batch")
+def receive_purchase_batch(batch: PurchaseReceiptBatch, db: Session = Depends(get_db)):
+    results, errors = receive_purchases(db, [(p.purchase_id, p.lines) for p in batch.purchases])
+    if errors:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=errors)
+    log_actions(1, "RECEIVE_PURCHASE", "purchases", [result["purchase_id"] for result in results], db=db)
+    db.commit()
+    kpi_cache.invalidate(*kpi_cache.STOCK_WRITE)
+    return {"received": len(results), "results": results}
 
 
 # ===============================================
@@ -211,7 +297,7 @@ def delete_purchase(purchase_id: int, db: Session = Depends(get_db)):
     if not db_purchase:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Purchase Order not found")
 
-    if db_purchase.status == "RECEIVED":
+    if db_purchase.status in ("RECEIVED", "PARTIAL"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
             detail="Cannot delete a Purchase Order that has already been received and affected inventory."
@@ -222,23 +308,27 @@ def delete_purchase(purchase_id: int, db: Session = Depends(get_db)):
     
     # Delete the Purchase Order header
     db.delete(db_purchase)
+    log_action(1, "DELETE_PURCHASE", "purchases", purchase_id, must_persist=True, db=db)
     db.commit()
-    
-    log_action(1, "DELETE_PURCHASE", "purchases", purchase_id)
     return
 
 
 # Endpoint: /api/purchases/expenses
 @router.post("/expenses")
 def add_expense(description: str, amount: float, purchase_id: int = None, db: Session = Depends(get_db)):
+    if purchase_id is not None and not db.get(Purchase, purchase_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Purchase Order not found")
     expense = Expense(
         description=description,
         amount=amount,
         purchase_id=purchase_id
     )
     db.add(expense)
+    # Freight/duty on a PO changes the landed cost of what it delivered
+    if purchase_id is not None:
+        supplier_prices.refresh_prices(db, [purchase_id])
+    db.flush()
+    log_action(1, "ADD_EXPENSE", "expenses", expense.id, must_persist=True, db=db)
     db.commit()
     db.refresh(expense)
-
-    log_action(1, "ADD_EXPENSE", "expenses", expense.id)
     return {"message": "Expense recorded", "expense_id": expense.id}
\ No newline at end of file
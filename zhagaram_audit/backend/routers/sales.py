@@ -1,33 +1,76 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from datetime import date, datetime, time, timedelta
+from typing import Literal, Optional
 import logging
 from pydantic import BaseModel
-from ..database import get_db
-from ..models import Sale, SaleItem, Product, Payment
+from ..database import get_async_db, get_async_read_db
+from ..pagination import encode_cursor, after_cursor
+from ..models import Sale, SaleItem, Customer
+from ..pricing import price_items
+from ..invoicing import next_invoice_number
+from ..payments import apply_payment, apply_payment_batch
+from .. import rollups, kpi_cache, inventory_ledger, costing
 
 # Set up logging to help us catch any database errors
 logger = logging.getLogger(__name__)
 
+# async def throughout: requests wait on the database without holding a threadpool
+# thread. The sync helpers (pricing, payments, rollups) run on the request's
+# connection via AsyncSession.run_sync.
 router = APIRouter(tags=["sales"])
 
 class SaleItemCreate(BaseModel):
     product_id: int
     quantity: int
+    # IMEIs/serials of the units sold (at most quantity); recorded when stock leaves
+    serial_numbers: list[str] = []
 
 class SaleCreate(BaseModel):
     customer_id: int
     items: list[SaleItemCreate]
     status: str = "QUOTE"
 
+class PaymentRow(BaseModel):
+    # Settlement files usually carry the invoice number rather than our sale id
+    sale_id: Optional[int] = None
+    invoice_number: Optional[str] = None
+    amount: float
+    payment_type: str = "CASH"
+
+class PaymentBatch(BaseModel):
+    payments: list[PaymentRow]
+
 # --- 1. CREATE SALE (Fixes "Method Not Allowed" & "Not Found") ---
 @router.post("/api/sales/", status_code=status.HTTP_201_CREATED)
-def create_sale(sale_data: SaleCreate, db: Session = Depends(get_db)):
+async def create_sale(sale_data: SaleCreate, db: AsyncSession = Depends(get_async_db)):
     try:
-        # Generate a unique invoice number
-        timestamp = int(datetime.utcnow().timestamp())
-        invoice_num = f"INV-{timestamp}"
-        
+        stock_out = sale_data.status in inventory_ledger.STOCK_OUT_STATUSES
+        serialized = any(item.serial_numbers for item in sale_data.items)
+        if serialized and not stock_out:
+            raise HTTPException(status_code=400, detail="Serial numbers are recorded on invoices, not quotes")
+        for item in sale_data.items:
+            if len(item.serial_numbers) > item.quantity:
+                raise HTTPException(status_code=400, detail=f"More serial numbers than units for product {item.product_id}")
+
+        # Resolve every product in one IN (...) fetch (cached) and calculate totals
+        priced = await db.run_sync(price_items, sale_data.items, True)
+        if priced["missing"]:
+            raise HTTPException(status_code=404, detail=f"Product {priced['missing'][0]} not found")
+        if serialized:
+            checked = inventory_ledger.sale_movements(None, sale_data.items)
+            errors = [e for e in await db.run_sync(inventory_ledger.serial_conflicts, checked) if e]
+            if errors:
+                raise HTTPException(status_code=400, detail=errors[0])
+
+        # Only a sale that passed validation takes the next per-financial-year invoice number
+        # (hi/lo blocks, no collisions), so rejected sales leave no gaps. A new block is
+        # reserved on its own sync session, so keep that off the event loop.
+        invoice_num = await run_in_threadpool(next_invoice_number)
+
         # Create the main Sale record
         new_sale = Sale(
             customer_id=sale_data.customer_id,
@@ -38,62 +81,133 @@ def create_sale(sale_data: SaleCreate, db: Session = Depends(get_db)):
             created_at=datetime.utcnow()
         )
         db.add(new_sale)
-        db.flush() # Get the new_sale.id before committing
+        await db.flush() # Get the new_sale.id before committing
 
-        total_accumulated = 0
-        
-        # Process items and calculate totals
-        for item in sale_data.items:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
-            if not product:
-                raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-            
-            # Simple tax calculation logic
-            tax_rate = product.tax_rate or 0
-            item_total = (item.quantity * product.sale_price) * (1 + tax_rate / 100)
-            total_accumulated += item_total
-            
-            db.add(SaleItem(
+        db.add_all([
+            SaleItem(
                 sale_id=new_sale.id,
-                product_id=product.id,
-                quantity=item.quantity,
-                unit_price=product.sale_price,
-                tax_rate=tax_rate,
-                total=item_total
-            ))
+                product_id=line["product_id"],
+                quantity=line["quantity"],
+                unit_price=line["unit_price"],
+                tax_rate=line["tax_rate"],
+                total=line["total"],
+                unit_cost=line["unit_cost"]
+            ) for line in priced["lines"]
+        ])
         
-        new_sale.total_amount = total_accumulated
-        db.commit()
+        new_sale.total_amount = priced["total"]
+        if stock_out:
+            movements = inventory_ledger.sale_movements(invoice_num, sale_data.items, new_sale.id)
+            await db.run_sync(inventory_ledger.record_movements, movements)
+            # Stock went out: the rollup takes what the units cost, not the purchase_price estimate
+            realized = await db.run_sync(costing.sale_costs, new_sale.id)
+            for line in priced["lines"]:
+                line["cost"] = line["quantity"] * realized.get(line["product_id"], line["unit_cost"])
+        await db.run_sync(rollups.record_sale, new_sale.created_at.date(), priced["total"], priced["lines"])
+        await db.commit()
+        kpi_cache.invalidate(*kpi_cache.SALES_WRITE)
+        if stock_out:
+            kpi_cache.invalidate(*kpi_cache.STOCK_WRITE)
         return {"id": new_sale.id, "invoice_number": invoice_num, "message": "Sale created successfully"}
     
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error creating sale: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-# --- 2. LIST SALES ---
+# --- 1b. DRY-RUN PRICING (used by new_sale.html while typing, never writes) ---
+@router.post("/api/sales/price")
+async def price_cart(items: list[SaleItemCreate], db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(price_items, items)
+
+# --- 2. LIST SALES (keyset paginated on created_at, id) ---
+MAX_PAGE_SIZE = 200
+COUNT_CAP = 10000
+
 @router.get("/api/sales/")
-def list_sales(db: Session = Depends(get_db)):
-    sales = db.query(Sale).options(joinedload(Sale.customer)).all()
-    return [
-        {
-            "id": s.id,
-            "invoice_number": s.invoice_number or "N/A",
-            "customer_name": s.customer.name if s.customer else "Walk-in",
-            "date": s.created_at.strftime("%Y-%m-%d") if s.created_at else "N/A",
-            "total_amount": float(s.total_amount or 0),
-            "status": s.status or "QUOTE"
-        } for s in sales
-    ]
+async def list_sales(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    invoice_prefix: Optional[str] = None,
+    sort: Literal["desc", "asc"] = "desc",
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    query = select(Sale, Customer.name.label("customer_name"))\
+        .outerjoin(Customer, Sale.customer_id == Customer.id)
+
+    # Range filters on the raw column (not func.date) so the (created_at, id) indexes stay usable
+    if status:
+        query = query.where(Sale.status == status)
+    if customer_id:
+        query = query.where(Sale.customer_id == customer_id)
+    if date_from:
+        query = query.where(Sale.created_at >= datetime.combine(date_from, time.min))
+    if date_to:
+        query = query.where(Sale.created_at < datetime.combine(date_to + timedelta(days=1), time.min))
+    if invoice_prefix:
+        escaped = invoice_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.where(Sale.invoice_number.like(f"{escaped}%", escape="\\"))
+
+    # Approximate total: counting is capped so it never costs more than COUNT_CAP index entries
+    total = None
+    if include_total:
+        capped = query.with_only_columns(Sale.id).limit(COUNT_CAP + 1).subquery()
+        total = await db.scalar(select(func.count()).select_from(capped))
+
+    if cursor:
+        query = query.where(after_cursor(Sale.created_at, Sale.id, cursor, descending=(sort == "desc")))
+
+    if sort == "desc":
+        query = query.order_by(Sale.created_at.desc(), Sale.id.desc())
+    else:
+        query = query.order_by(Sale.created_at.asc(), Sale.id.asc())
+
+    # Fetch one extra row to know whether another page exists
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1].Sale
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    return {
+        "items": [
+            {
+                "id": s.id,
+                "invoice_number": s.invoice_number or "N/A",
+                "customer_name": customer_name or "Walk-in",
+                "date": s.created_at.strftime("%Y-%m-%d") if s.created_at else "N/A",
+                "total_amount": float(s.total_amount or 0),
+                "paid_amount": float(s.paid_amount or 0),
+                "balance": float((s.total_amount or 0) - (s.paid_amount or 0)),
+                "status": s.status or "QUOTE"
+            } for s, customer_name in rows
+        ],
+        "next_cursor": next_cursor,
+        "total": min(total, COUNT_CAP) if total is not None else None,
+        "total_is_estimate": total is not None and total > COUNT_CAP
+    }
 
 # --- 3. GET DETAIL ---
 @router.get("/api/sales/{sale_id}")
-def get_sale_detail(sale_id: int, db: Session = Depends(get_db)):
-    sale = db.query(Sale).filter(Sale.id == sale_id).options(
+async def get_sale_detail(sale_id: int, db: AsyncSession = Depends(get_async_db)):
+    # Everything the response touches is eager-loaded: lazy loads are not possible under asyncio
+    result = await db.execute(select(Sale).where(Sale.id == sale_id).options(
         joinedload(Sale.customer), 
         joinedload(Sale.items).joinedload(SaleItem.product),
         joinedload(Sale.payments)
-    ).first()
+    ))
+    sale = result.unique().scalar_one_or_none()
     
     if not sale:
         raise HTTPException(status_code=404, detail="Sale not found")
@@ -113,20 +227,33 @@ def get_sale_detail(sale_id: int, db: Session = Depends(get_db)):
 
 # --- 4. ACTIONS (Payment & Convert) ---
 @router.post("/api/sales/{sale_id}/payment")
-def add_payment(sale_id: int, amount: float, db: Session = Depends(get_db)):
-    sale = db.query(Sale).filter(Sale.id == sale_id).first()
+async def add_payment(sale_id: int, amount: float = Query(..., gt=0), payment_type: str = "CASH", db: AsyncSession = Depends(get_async_db)):
+    sale = await db.run_sync(apply_payment, sale_id, amount, payment_type)
     if not sale: raise HTTPException(status_code=404)
-    db.add(Payment(sale_id=sale_id, amount=amount, payment_type="CASH", created_at=datetime.utcnow()))
-    sale.paid_amount = float(sale.paid_amount or 0) + amount
-    if sale.paid_amount >= sale.total_amount:
-        sale.status = "PAID"
-    db.commit()
+    await db.commit()
+    kpi_cache.invalidate(*kpi_cache.SALES_WRITE)
+    if sale.status == "PAID":
+        kpi_cache.invalidate(*kpi_cache.STOCK_WRITE)
     return {"message": "Payment recorded"}
 
+# Bulk bank/UPI settlement import: one transaction per chunk, per-row results
+@router.post("/api/sales/payments:batch")
+async def add_payments_batch(batch: PaymentBatch, db: AsyncSession = Depends(get_async_db)):
+    results = await db.run_sync(apply_payment_batch, batch.payments)
+    kpi_cache.invalidate(*kpi_cache.SALES_WRITE)
+    # A quote paid in full takes its stock
+    kpi_cache.invalidate(*kpi_cache.STOCK_WRITE)
+    applied = sum(1 for r in results if r["status"] == "APPLIED")
+    return {"applied": applied, "failed": len(results) - applied, "results": results}
+
 @router.post("/api/sales/{sale_id}/convert")
-def convert_to_invoice(sale_id: int, db: Session = Depends(get_db)):
-    sale = db.query(Sale).filter(Sale.id == sale_id).first()
+async def convert_to_invoice(sale_id: int, db: AsyncSession = Depends(get_async_db)):
+    sale = await db.get(Sale, sale_id, with_for_update=True)
     if not sale: raise HTTPException(status_code=404)
+    # A quote went into the rollup at estimated cost; this books the realized cost
+    await db.run_sync(inventory_ledger.take_quote_stock, sale)
     sale.status = "INVOICE"
-    db.commit()
+    await db.commit()
+    kpi_cache.invalidate(*kpi_cache.STOCK_WRITE)
+    kpi_cache.invalidate(*kpi_cache.SALES_WRITE)
     return {"message": "Converted to Invoice"}
\ No newline at end of file
@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from typing import Optional
 from pydantic import BaseModel
-from ..database import get_db
-from ..models import ServiceTicket, Customer, Product, Employee 
+from ..database import get_async_db
+from ..models import ServiceTicket, Customer, Product, Employee, SerialNumber
+from .. import kpi_cache, inventory_ledger
 
 router = APIRouter(
     prefix="/api/service",
@@ -15,22 +17,24 @@ class TicketSchema(BaseModel):
     customer_id: int
     product_id: int
     technician_id: Optional[int] = None
+    # IMEI/serial of the device brought in; links the ticket into the device's history
+    serial_number: Optional[str] = None
     estimate_parts: Optional[float] = 0.0
     estimate_labor: Optional[float] = 0.0
     remarks: Optional[str] = ""
 
 @router.get("/tickets")
-def get_tickets(db: Session = Depends(get_db)):
+async def get_tickets(db: AsyncSession = Depends(get_async_db)):
     # Outer join used so tickets show up even if no technician is assigned
-    results = db.query(
+    results = (await db.execute(select(
         ServiceTicket,
         Customer.name.label("cust_name"),
         Product.model.label("prod_model"),
         Employee.name.label("emp_name")
     ).join(Customer, ServiceTicket.customer_id == Customer.id)\
      .join(Product, ServiceTicket.product_id == Product.id)\
-     .outerjoin(Employee, ServiceTicket.technician_id == Employee.id)\
-     .all()
+     .outerjoin(Employee, ServiceTicket.technician_id == Employee.id)
+    )).all()
 
     return [{
         "id": t.id,
@@ -42,30 +46,41 @@ def get_tickets(db: Session = Depends(get_db)):
         "customer_id": t.customer_id,
         "product_id": t.product_id,
         "technician_id": t.technician_id,
+        "serial_number": t.serial_number,
         "estimate_parts": float(t.estimate_parts or 0),
         "estimate_labor": float(t.estimate_labor or 0),
         "created_at": t.created_at.strftime("%Y-%m-%d %H:%M") if t.created_at else "N/A"
     } for t, cust_name, prod_model, emp_name in results]
 
 @router.post("/tickets")
-def create_ticket(ticket: TicketSchema, db: Session = Depends(get_db)):
+async def create_ticket(ticket: TicketSchema, db: AsyncSession = Depends(get_async_db)):
     # Step 1: Manual Validation (Check if these actually exist in DB)
-    if not db.query(Customer).filter(Customer.id == ticket.customer_id).first():
+    if not await db.get(Customer, ticket.customer_id):
         raise HTTPException(status_code=400, detail=f"Customer ID {ticket.customer_id} not found.")
     
-    if not db.query(Product).filter(Product.id == ticket.product_id).first():
+    if not await db.get(Product, ticket.product_id):
         raise HTTPException(status_code=400, detail=f"Product ID {ticket.product_id} not found.")
 
     if ticket.technician_id:
-        if not db.query(Employee).filter(Employee.id == ticket.technician_id).first():
+        if not await db.get(Employee, ticket.technician_id):
             raise HTTPException(status_code=400, detail=f"Technician ID {ticket.technician_id} not found.")
 
+    # A serial we sold or stocked must be under the product it was registered with
+    serial = inventory_ledger.normalize_serial(ticket.serial_number)
+    if serial:
+        products = set((await db.execute(
+            select(SerialNumber.product_id).where(SerialNumber.serial == serial)
+        )).scalars())
+        if products and ticket.product_id not in products:
+            raise HTTPException(status_code=400, detail=f"Serial {serial} is registered to product ID {min(products)}.")
+
     # Step 2: Attempt Save with Deep Debugging
     try:
         new_ticket = ServiceTicket(
             customer_id=ticket.customer_id,
             product_id=ticket.product_id,
             technician_id=ticket.technician_id,
+            serial_number=serial,
             status="OPEN",
             estimate_parts=ticket.estimate_parts or 0.0,
             estimate_labor=ticket.estimate_labor or 0.0,
@@ -73,11 +88,12 @@ def create_ticket(ticket: TicketSchema, db: Session = Depends(get_db)):
             created_at=datetime.now()
         )
         db.add(new_ticket)
-        db.commit()
-        db.refresh(new_ticket)
+        await db.commit()
+        kpi_cache.invalidate(*kpi_cache.SERVICE_WRITE)
+        await db.refresh(new_ticket)
         return new_ticket
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         # EXTREMELY IMPORTANT: Look at your console terminal when you see this error
         error_msg = str(e)
         print(f"--- DATABASE ERROR START ---")
@@ -86,33 +102,37 @@ def create_ticket(ticket: TicketSchema, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Database Crash: {error_msg}")
 
 @router.put("/tickets/{ticket_id}")
-def update_ticket(ticket_id: int, ticket: TicketSchema, status: str, db: Session = Depends(get_db)):
-    db_ticket = db.query(ServiceTicket).filter(ServiceTicket.id == ticket_id).first()
+async def update_ticket(ticket_id: int, ticket: TicketSchema, status: str, db: AsyncSession = Depends(get_async_db)):
+    db_ticket = await db.get(ServiceTicket, ticket_id)
     if not db_ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
     try:
         db_ticket.technician_id = ticket.technician_id
+        if ticket.serial_number is not None:
+            db_ticket.serial_number = inventory_ledger.normalize_serial(ticket.serial_number)
         db_ticket.remarks = ticket.remarks
         db_ticket.status = status
         db_ticket.estimate_parts = ticket.estimate_parts
         db_ticket.estimate_labor = ticket.estimate_labor
-        db.commit()
+        await db.commit()
+        kpi_cache.invalidate(*kpi_cache.SERVICE_WRITE)
         return {"message": "Updated"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Update Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/tickets/{ticket_id}")
-def delete_ticket(ticket_id: int, db: Session = Depends(get_db)):
-    db_ticket = db.query(ServiceTicket).filter(ServiceTicket.id == ticket_id).first()
+async def delete_ticket(ticket_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_ticket = await db.get(ServiceTicket, ticket_id)
     if not db_ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     try:
-        db.delete(db_ticket)
-        db.commit()
+        await db.delete(db_ticket)
+        await db.commit()
+        kpi_cache.invalidate(*kpi_cache.SERVICE_WRITE)
         return {"message": "Deleted"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,14 +1,7 @@
 import os
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from pathlib import Path
-
-# This ensures we find the 'frontend/templates' folder regardless of how you start the server
-BASE_DIR = Path(__file__).resolve().parent.parent.parent
-TEMPLATES_DIR = BASE_DIR / "frontend" / "templates"
-
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+from ..templating import templates, TEMPLATES_DIR
 
 router = APIRouter(tags=["Service Pages"])
 
@@ -19,6 +12,6 @@ def service_list(request: Request):
         return HTMLResponse(content=f"Error: service.html not found in {TEMPLATES_DIR}", status_code=404)
         
     return templates.TemplateResponse(
-        "service.html",
+        request, "service.html",
         {"request": request, "title": "Service & Workshop"}
     )
\ No newline at end of file
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
+from datetime import date
 
 # --- AUTH SCHEMAS ---
 class LoginData(BaseModel):
@@ -42,7 +43,7 @@ class Product(ProductCreate):
 class PurchaseItemBase(BaseModel):
     product_id: int
     quantity: int = Field(..., gt=0)
-    unit_price: float = Field(..., ge=0)
+    unit_price: float = Field(..., ge=0, allow_inf_nan=False)
 
 class PurchaseCreate(BaseModel):
     supplier_id: int
@@ -50,4 +51,26 @@ class PurchaseCreate(BaseModel):
     remarks: Optional[str] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# A line to receive, by purchase item id or by product; quantity defaults to all that is outstanding
+class ReceiptLine(BaseModel):
+    item_id: Optional[int] = None
+    product_id: Optional[int] = None
+    quantity: Optional[int] = Field(None, gt=0)
+
+# Omit lines to receive everything still outstanding on the PO
+class PurchaseReceipt(BaseModel):
+    lines: Optional[List[ReceiptLine]] = None
+
+class PurchaseReceiptBatchItem(PurchaseReceipt):
+    purchase_id: int
+
+class PurchaseReceiptBatch(BaseModel):
+    purchases: List[PurchaseReceiptBatchItem]
+
+# Up to 500 products, by id and/or SKU; with since, only suppliers that delivered on or after it
+class SupplierPriceComparison(BaseModel):
+    product_ids: List[int] = Field([], max_length=500)
+    skus: List[str] = Field([], max_length=500)
+    since: Optional[date] = None
\ No newline at end of file
@@ -0,0 +1,90 @@
+# /backend/startup_bench.py
+# Measures what a worker pays before serving traffic: cold import of
+# backend.main, building the app, lifespan startup, and the first and second
+# request to each path. Every run is a fresh interpreter, so imports are cold.
+#   python -m backend.startup_bench --runs 5 --path /login --path /api/products/
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Runs in the child interpreter; speaks ASGI directly so no HTTP client is needed
+CHILD = r"""
+import asyncio, json, sys, time
+paths = json.loads(sys.argv[1])
+timings = {}
+
+start = time.perf_counter()
+import backend.main
+timings["import_ms"] = (time.perf_counter() - start) * 1000
+
+start = time.perf_counter()
+app = backend.main.create_app()
+timings["create_app_ms"] = (time.perf_counter() - start) * 1000
+
+
+async def request(path):
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+             "query_string": b"", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 0),
+             "server": ("bench", 80), "state": state}
+    status = []
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+    await app(scope, receive, send)
+    return status[0]
+
+
+async def main():
+    global state
+    state = {}
+    async with app.router.lifespan_context(app) as lifespan_state:
+        timings["startup_ms"] = (time.perf_counter() - started) * 1000
+        state.update(lifespan_state or {})
+        for path in paths:
+            for attempt in ("first", "second"):
+                start = time.perf_counter()
+                code = await request(path)
+                timings[f"{attempt} {path}"] = (time.perf_counter() - start) * 1000
+                timings[f"status {path}"] = code
+
+started = time.perf_counter()
+asyncio.run(main())
+print(json.dumps(timings))
+"""
+
+
+def run_once(paths):
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, json.dumps(paths)],
+        cwd=BASE_DIR, env=dict(os.environ), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark cold import and first-request latency")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", action="append", dest="paths", help="GET path to time (repeatable)")
+    args = parser.parse_args()
+    paths = args.paths or ["/login"]
+
+    runs = [run_once(paths) for _ in range(args.runs)]
+    print(f"{'measure':32} {'median ms':>10} {'max ms':>10}")
+    for key in runs[0]:
+        if key.startswith("status "):
+            continue
+        values = [r[key] for r in runs]
+        print(f"{key:32} {statistics.median(values):10.1f} {max(values):10.1f}")
+    for path in paths:
+        print(f"HTTP status for {path}: {runs[0]['status ' + path]}")
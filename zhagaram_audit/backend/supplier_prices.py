@@ -0,0 +1,169 @@
+# /backend/supplier_prices.py
+# The supplier price index (supplier_prices): per (supplier, product), the last, lowest
+# and average price paid, the landed cost of the last purchase, and when each took
+# effect. It is derived from received purchase lines only, so a PO that was ordered
+# but never delivered does not move it. Dates are when each PO was first received.
+#
+# Maintenance is in the caller's transaction: refresh_prices() recomputes the pairs
+# behind the POs a receipt (or a PO expense) touched, from their purchase lines (one
+# IN query on purchase_items.product_id), then replaces those index rows. Lookups and
+# supplier comparisons then read the index by primary key instead of scanning
+# purchase_items.
+#   python -m backend.supplier_prices rebuild
+import argparse
+
+from sqlalchemy import delete, func, insert, select
+
+from .database import SessionLocal
+from .models import Expense, Product, Purchase, PurchaseItem, Supplier, SupplierPrice
+
+
+def _received_lines(db, product_ids=None, supplier_ids=None):
+    query = select(Purchase.supplier_id, PurchaseItem.product_id, PurchaseItem.purchase_id,
+                   PurchaseItem.unit_price, PurchaseItem.received_qty, Purchase.received_at)\
+        .join(Purchase, Purchase.id == PurchaseItem.purchase_id)\
+        .where(PurchaseItem.received_qty > 0, PurchaseItem.unit_price.is_not(None),
+               Purchase.received_at.is_not(None), Purchase.supplier_id.is_not(None))
+    if product_ids is not None:
+        query = query.where(PurchaseItem.product_id.in_(product_ids), Purchase.supplier_id.in_(supplier_ids))
+    return db.execute(query.order_by(Purchase.received_at, PurchaseItem.purchase_id, PurchaseItem.id)).all()
+
+
+def _landed_factors(db, purchase_ids=None):
+    """{purchase_id: 1 + expenses / ordered value}; expenses are shared by line value."""
+    expenses = select(Expense.purchase_id, func.sum(Expense.amount)).where(Expense.purchase_id.is_not(None))
+    values = select(PurchaseItem.purchase_id, func.sum(PurchaseItem.quantity * PurchaseItem.unit_price))
+    if purchase_ids is not None:
+        expenses = expenses.where(Expense.purchase_id.in_(purchase_ids))
+        values = values.where(PurchaseItem.purchase_id.in_(purchase_ids))
+    expenses = dict(db.execute(expenses.group_by(Expense.purchase_id)).all())
+    if not expenses:
+        return {}
+    values = dict(db.execute(values.group_by(PurchaseItem.purchase_id)).all())
+    return {purchase_id: 1 + (amount or 0) / values[purchase_id]
+            for purchase_id, amount in expenses.items() if values.get(purchase_id)}
+
+
+def _summarize(lines):
+    prices = {}
+    for supplier_id, product_id, purchase_id, unit_price, quantity, received_at in lines:
+        row = prices.get((supplier_id, product_id))
+        if row is None:
+            row = prices[supplier_id, product_id] = {
+                "supplier_id": supplier_id, "product_id": product_id, "last_purchase_id": None,
+                "min_price": unit_price, "min_price_at": received_at, "first_received_at": received_at,
+                "units_received": 0, "purchase_count": 0, "spent": 0.0
+            }
+        if purchase_id != row["last_purchase_id"]:
+            row["purchase_count"] += 1
+        if unit_price < row["min_price"]:
+            row.update(min_price=unit_price, min_price_at=received_at)
+        row.update(last_price=unit_price, last_purchase_id=purchase_id, last_received_at=received_at)
+        row["units_received"] += quantity
+        row["spent"] += unit_price * quantity
+    return prices
+
+
+def rebuild(db, product_ids=None, supplier_ids=None):
+    """Recompute the index, entirely or for every pair of the given products and
+    suppliers. Core statements only, so it runs on a Session or a Connection."""
+    prices = _summarize(_received_lines(db, product_ids, supplier_ids))
+    factors = _landed_factors(db, None if product_ids is None else {p["last_purchase_id"] for p in prices.values()})
+    rows = [{
+        "supplier_id": p["supplier_id"],
+        "product_id": p["product_id"],
+        "last_price": p["last_price"],
+        "last_landed_cost": round(p["last_price"] * factors.get(p["last_purchase_id"], 1), 2),
+        "last_purchase_id": p["last_purchase_id"],
+        "last_received_at": p["last_received_at"],
+        "min_price": p["min_price"],
+        "min_price_at": p["min_price_at"],
+        "avg_price": round(p["spent"] / p["units_received"], 2),
+        "units_received": p["units_received"],
+        "purchase_count": p["purchase_count"],
+        "first_received_at": p["first_received_at"]
+    } for p in prices.values()]
+
+    stale = delete(SupplierPrice)
+    if product_ids is not None:
+        stale = stale.where(SupplierPrice.product_id.in_(product_ids), SupplierPrice.supplier_id.in_(supplier_ids))
+    db.execute(stale)
+    if rows:
+        db.execute(insert(SupplierPrice), rows)
+    return len(rows)
+
+
+def refresh_prices(db, purchase_ids):
+    """Bring the index up to date for the (supplier, product) pairs on these POs. The
+    caller commits."""
+    purchase_ids = set(purchase_ids)
+    if not purchase_ids:
+        return
+    db.flush()
+    pairs = db.execute(
+        select(Purchase.supplier_id, PurchaseItem.product_id).distinct()
+        .join(Purchase, Purchase.id == PurchaseItem.purchase_id)
+        .where(PurchaseItem.purchase_id.in_(purchase_ids), Purchase.supplier_id.is_not(None))
+    ).all()
+    if pairs:
+        rebuild(db, {product_id for _, product_id in pairs}, {supplier_id for supplier_id, _ in pairs})
+
+
+def as_dict(price, supplier_name=None):
+    return {
+        "supplier_id": price.supplier_id,
+        "supplier_name": supplier_name,
+        "product_id": price.product_id,
+        "last_price": price.last_price,
+        "last_landed_cost": price.last_landed_cost,
+        "last_purchase_id": price.last_purchase_id,
+        "last_received_at": str(price.last_received_at),
+        "min_price": price.min_price,
+        "min_price_at": str(price.min_price_at),
+        "avg_price": price.avg_price,
+        "units_received": price.units_received,
+        "purchase_count": price.purchase_count,
+        "first_received_at": str(price.first_received_at)
+    }
+
+
+def lookup(db, supplier_id=None, product_ids=None):
+    """Index rows for a supplier and/or products, each product's cheapest supplier first."""
+    query = db.query(SupplierPrice, Supplier.name).join(Supplier, Supplier.id == SupplierPrice.supplier_id)
+    if supplier_id is not None:
+        query = query.filter(SupplierPrice.supplier_id == supplier_id)
+    if product_ids is not None:
+        query = query.filter(SupplierPrice.product_id.in_(product_ids))
+    return query.order_by(SupplierPrice.product_id, SupplierPrice.last_landed_cost, SupplierPrice.last_price).all()
+
+
+def compare(db, product_ids, since=None):
+    """Per product, every supplier's prices, cheapest landed cost first (only suppliers
+    that delivered on or after since, when given), read from the index."""
+    products = db.query(Product.id, Product.sku, Product.model).filter(Product.id.in_(product_ids))\
+        .order_by(Product.id).all()
+    offers = {}
+    for price, supplier_name in lookup(db, product_ids=[p.id for p in products]):
+        if since is None or price.last_received_at.date() >= since:
+            offers.setdefault(price.product_id, []).append(as_dict(price, supplier_name))
+    return [{
+        "product_id": p.id,
+        "sku": p.sku,
+        "model": p.model,
+        "cheapest_supplier_id": offers[p.id][0]["supplier_id"] if p.id in offers else None,
+        "suppliers": offers.get(p.id, [])
+    } for p in products]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Supplier price index maintenance")
+    parser.add_argument("command", choices=["rebuild"], help="recompute the whole index from received POs")
+    parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        count = rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Indexed {count} supplier/product price(s).")
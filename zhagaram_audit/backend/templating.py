@@ -0,0 +1,11 @@
+# /backend/templating.py
+# The single Jinja2 environment shared by main.py and the page routers, so each
+# worker loads and caches compiled templates once.
+from pathlib import Path
+
+from fastapi.templating import Jinja2Templates
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+TEMPLATES_DIR = BASE_DIR / "frontend" / "templates"
+
+templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
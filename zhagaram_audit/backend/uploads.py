@@ -0,0 +1,90 @@
+# /backend/uploads.py
+# Bulk uploads as (line_no, record) pairs. The format follows Content-Type:
+#   application/x-ndjson  one JSON object per line
+#   text/csv              a header row, then one record per line (no multi-line fields)
+#   anything else         a JSON array of objects, or {"<key>": [...]}
+# NDJSON and CSV are parsed as the body streams in, so a large file is never held
+# in memory whole. A record that cannot be read is {"_error": "..."} so the caller
+# can report it against its line and carry on. parse_number() reads a numeric field
+# of a record.
+import codecs
+import csv
+import json
+import math
+
+from fastapi import HTTPException, Request
+
+
+def parse_number(value, kind=float):
+    """value as kind (int or float), or None when it is not one: not a number, nan or
+    inf, or a float with a fraction where a whole number is wanted (int() would
+    silently truncate it)."""
+    if kind is int and isinstance(value, float) and not value.is_integer():
+        return None
+    try:
+        number = kind(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def upload_format(request: Request):
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type:
+        return "ndjson"
+    if "csv" in content_type:
+        return "csv"
+    return "json"
+
+
+async def _text_lines(request: Request):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    async for data in request.stream():
+        buffer += decoder.decode(data)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+def _json_record(text):
+    try:
+        record = json.loads(text)
+    except ValueError:
+        return {"_error": "Invalid JSON"}
+    return record if isinstance(record, dict) else {"_error": "Record must be an object"}
+
+
+async def iter_records(request: Request, key="items"):
+    fmt = upload_format(request)
+    if fmt == "json":
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array")
+        if isinstance(body, dict):
+            body = body.get(key)
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array")
+        for line_no, record in enumerate(body, start=1):
+            yield line_no, record if isinstance(record, dict) else {"_error": "Record must be an object"}
+        return
+
+    header, line_no = None, 0
+    async for line in _text_lines(request):
+        line_no += 1
+        if not line.strip():
+            continue
+        if fmt == "ndjson":
+            yield line_no, _json_record(line)
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+        elif len(values) > len(header):
+            yield line_no, {"_error": f"{len(values)} fields but the header has {len(header)}"}
+        else:
+            yield line_no, {name: value.strip() for name, value in zip(header, values) if value.strip()}